@@ -1,75 +1,50 @@
 from qpython.qconnection import QConnection
 import threading
-from queue import Queue
 import numpy as np
 from custom_config_load import *
 from encryption_utils import load_credentials
-import select
+from kdb_pool import KdbConnectionPool
+from kdb_async import AsyncQConnection, AsyncKdbConnectionPool
+from kdb_reactor import reactor, take_buffered
 import pandas as pd
 from qpython.qcollection import QDictionary
+from qpython.qtype import QException
 import time
 from queue import Empty
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sqlalchemy.sql import func
 from datetime import datetime
 from uuid import UUID
 from sqlalchemy.orm import Session
-from models.models import TestGroup, TestCase, TestResult, SessionLocal
+from models.models import TestGroup, TestCase, TestResult, TestDependency, TestRun, SessionLocal, engine
+from dependency_graph import build_waves
+from result_writer import result_writer
+import runs
+import progress
+from message_buffer import MessageBuffer, BufferClosed
 import logging
-from config.config import CACHE_PATH
+from config.config import KDB_POOL_MAX_SIZE, KDB_POOL_IDLE_TIMEOUT, KDB_POOL_MAX_AGE, MAX_TEST_PARALLELISM, FUNCTIONAL_BATCH_THRESHOLD, FUNCTIONAL_BATCH_SIZE, SUBSCRIPTION_BUFFER_SIZE
 
 logger = logging.getLogger(__name__)
 
-def set_cache_refresh_flag():
-    with open(CACHE_PATH + "refresh_flag.txt", "w") as f:
-        f.write("1")  # Set to "1" to indicate cache should be refreshed
+# error_message prefix for tests that weren't run because a prerequisite failed. They are stored with
+# skipped set (and pass_status False), and counted as skipped rather than failed in the rollup, run counters and progress.
+SKIPPED_PREFIX = "Skipped - "
 
 config = load_config()
 custom_ca = config['security']['custom_ca_path']
 
-_conn_cache = {}
-MAX_CONN_AGE = 60 * 60
-
-def make_kdb_conn(host, port, tls, timeout, scope=""):
-    """
-    Creates or reuses a cached QConnection to KDB+.
-    Reuses if it's less than MAX_CONN_AGE old; otherwise creates a new QConnection.
-    """
-    global _conn_cache
-    key = (host, port, tls, scope)
-    now = time.time()
-
-    # If we have a cached connection, check whether it's still valid
-    if key in _conn_cache:
-        entry = _conn_cache[key]
-        age = now - entry["time_opened"]
-
-        # If age <= MAX_CONN_AGE, reuse existing QConnection
-        if age <= MAX_CONN_AGE:
-            return entry["conn"]
-        else:
-            # Otherwise, discard old connection and create a new one
-            try:
-                entry["conn"].close()  # Make sure it’s closed
-            except:
-                pass
-            del _conn_cache[key]
-
-    # We either have no cache entry or it was expired
+def kdb_conn_args(scope=""):
+    """Connection keyword arguments for the stored credentials, shared by the sync and asyncio clients."""
     credentials = load_credentials()
     method = credentials.get('method')
 
     if method == 'User/Password':
-        q = QConnection(
-            host=host,
-            port=port,
-            username=credentials.get('username'),
-            password=credentials.get('password'),
-            tls_enabled=tls,
-            timeout=timeout,
-            custom_ca=custom_ca,
-            pandas=True
-        )
+        return {
+            'username': credentials.get('username'),
+            'password': credentials.get('password'),
+        }
     elif method == 'Azure Oauth':
         oauth_config = {
             'tenant_id': credentials.get('tenant_id'),
@@ -78,108 +53,145 @@ def make_kdb_conn(host, port, tls, timeout, scope=""):
             'scope': scope,
             'flow': 'client_credentials',
         }
-        q = QConnection(
-            host=host,
-            port=port,
-            username=credentials.get('username'),
-            tls_enabled=tls,
-            timeout=timeout,
-            custom_ca=custom_ca,
-            oauth_provider="azure",
-            oauth_config=oauth_config,
-            pandas=True
-        )
+        return {
+            'username': credentials.get('username'),
+            'oauth_provider': "azure",
+            'oauth_config': oauth_config,
+        }
     else:
         raise ValueError("Unsupported connection method.")
 
-    # Store new connection in our cache
-    _conn_cache[key] = {
-        "conn": q,
-        "time_opened": now
-    }
-    return q
+
+def make_kdb_conn(host, port, tls, timeout, scope=""):
+    """
+    Creates a new (unopened) QConnection to KDB+ using the stored credentials.
+    Queries should go through kdb_pool, which keeps opened handles around for reuse.
+    """
+    return QConnection(host=host, port=port, tls_enabled=tls, timeout=timeout, custom_ca=custom_ca, pandas=True, **kdb_conn_args(scope))
+
+
+def make_async_kdb_conn(host, port, tls, timeout, scope=""):
+    """Creates a new (unopened) AsyncQConnection to KDB+ using the stored credentials."""
+    return AsyncQConnection(host=host, port=port, tls_enabled=tls, timeout=timeout, custom_ca=custom_ca, pandas=True, **kdb_conn_args(scope))
+
+
+kdb_pool = KdbConnectionPool(make_kdb_conn, max_size=KDB_POOL_MAX_SIZE, idle_timeout=KDB_POOL_IDLE_TIMEOUT, max_age=KDB_POOL_MAX_AGE)
+async_kdb_pool = AsyncKdbConnectionPool(make_async_kdb_conn, max_size=KDB_POOL_MAX_SIZE, idle_timeout=KDB_POOL_IDLE_TIMEOUT, max_age=KDB_POOL_MAX_AGE)
 
 
 def sendFreeFormQuery(code, host, port, tls, scope = ""):
-    q = make_kdb_conn(host, port, tls, 10, scope)
     try:
-        q.open()
-        response = q.sendSync('.qsuite.executeUserCode', ''.join(code))
+        response = kdb_pool.send_sync(host, port, tls, 10, scope, '.qsuite.executeUserCode', ''.join(code))
         return parseResponse(response, "Response Preview")
 
     except Exception as e:
-        res = {"success":False, "data": "", "message": "Kdb Error => " + str(e), "type": "error"}
-
-    finally:
-        q.close() 
+        return {"success":False, "data": "", "message": "Kdb Error => " + str(e), "type": "error"}
 
 
 def sendFunctionalQuery(kdbFunction, host, port, tls, scope = ""):
-    q = make_kdb_conn(host, port, tls, 10, scope)
     try:
-        q.open()
-        response = q.sendSync('.qsuite.executeFunction', kdbFunction)
+        response = kdb_pool.send_sync(host, port, tls, 10, scope, '.qsuite.executeFunction', kdbFunction)
         return parseResponse(response,"Response was not Boolean")
 
     except Exception as e:
-        res = {"success":False, "data": "", "message": "Kdb Error => " + str(e)}
-
-    finally:
-        q.close()
+        return {"success":False, "data": "", "message": "Kdb Error => " + str(e)}
 
 def sendKdbQuery(kdbFunction, host, port, tls, scope = "", *args):
-    q = make_kdb_conn(host, port, tls, 10, scope)
-    q.open()
-    res = q.sendSync(kdbFunction, *args)
-    q.close()
-    return res
+    return kdb_pool.send_sync(host, port, tls, 10, scope, kdbFunction, *args)
 
 def test_kdb_conn(host, port, tls, scope = ""):
-    q = make_kdb_conn(host, port, tls, 5, scope)
-    q.open()
-    q.close()
+    # checkout runs the liveness check on an idle handle or opens a new one
+    with kdb_pool.connection(host, port, tls, 5, scope):
+        pass
+    #throws exception if it times out or port doesn't exist
+    return "success"
+
+
+# asyncio variants for the API endpoints, so a slow kdb query doesn't block the worker's event loop
+async def sendFreeFormQueryAsync(code, host, port, tls, scope = ""):
+    try:
+        response = await async_kdb_pool.send_sync(host, port, tls, 10, scope, '.qsuite.executeUserCode', ''.join(code))
+        return parseResponse(response, "Response Preview")
+
+    except Exception as e:
+        return {"success":False, "data": "", "message": "Kdb Error => " + str(e), "type": "error"}
+
+
+async def sendFunctionalQueryAsync(kdbFunction, host, port, tls, scope = ""):
+    try:
+        response = await async_kdb_pool.send_sync(host, port, tls, 10, scope, '.qsuite.executeFunction', kdbFunction)
+        return parseResponse(response,"Response was not Boolean")
+
+    except Exception as e:
+        return {"success":False, "data": "", "message": "Kdb Error => " + str(e)}
+
+async def sendKdbQueryAsync(kdbFunction, host, port, tls, scope = "", *args):
+    return await async_kdb_pool.send_sync(host, port, tls, 10, scope, kdbFunction, *args)
+
+async def test_kdb_conn_async(host, port, tls, scope = ""):
+    await async_kdb_pool.check(host, port, tls, 5, scope)
     #throws exception if it times out or port doesn't exist
     return "success"
 
-class kdbSub(threading.Thread):
+class kdbSub:
+    """
+    A kdb subscription. The handshake and subscribe call are made here; after start() its socket is
+    read by the process wide reactor (kdb_reactor), so subscriptions don't cost a thread each.
+    """
+
     def __init__(self, sub_name, host, port, tls, scope = "", *args):
-        super(kdbSub, self).__init__()
         self.q = make_kdb_conn(host, port, tls, 10, scope)
         self.q.open()
         self.q.sendSync('.qsuite.subTests.' + sub_name, *args)
-        self.message_queue = Queue()
+        # bounded, a reader that falls behind a fast tickerplant loses the oldest messages instead of growing the worker
+        self.message_queue = MessageBuffer(SUBSCRIPTION_BUFFER_SIZE)
+        # called with each decoded message, SubscriptionHub replaces it to fan messages out to its clients
+        self.on_message = self.message_queue.put
+        # called once the subscription has ended, so blocked readers wake up instead of waiting for messages
+        self.on_stopped = self.message_queue.close
         self._stopper = threading.Event()
+        self._closed = threading.Event()
+        self._started = False
+
+    def start(self):
+        buffered = take_buffered(self.q._connection, self.q._connection_file)
+        reactor.register(self.q._connection, self._on_frame, self._on_closed, buffered)
+        # only once the reactor owns the connection, stopit() closes it directly until then
+        self._started = True
 
     def stopit(self):
-        print("KdbSubs - unsubbing")
-        self._stopper.set()           # <--- signal thread first
+        logger.info("KdbSubs - unsubbing")
+        self._stopper.set()           # <--- signal first
+        if self._started:
+            reactor.unregister(self.q._connection)
+        elif not self._closed.is_set():
+            self._on_closed(None)
         ###self.q.sendAsync(".u.unsub","direct unsub")  --> unsub logic is also handled in .z.pc
 
     def stopped(self):
         return self._stopper.is_set()
 
-    def run(self):
-        try:
-            while not self.stopped():
-                # Check if the socket has data ready to read with a timeout (1 second)
-                ready_to_read, _, _ = select.select([self.q._connection], [], [], 1.0)
-
-                # If data is available, read it
-                if ready_to_read:
-                    message = self.q.receive(data_only=False, raw=False)
-                    if isinstance(message.data, list):
-                        if len(message.data) == 3 and message.data[0] == b'upd':
-                            self.message_queue.put(parse_dataframe(message.data[2]))
-                else:
-                    # No data received within the timeout, continue looping
-                    #print("No data received, checking stop condition...")
-                    continue
-
-        except Exception as e:
-            print("Error encountered while trying to read tick message: ", e)
-        finally:
-            self.q.close()
-            print("KdbSubs - finished closing conn")
+    def join(self, timeout=None):
+        """Waits until the connection has been closed after stopit(), or after it dropped."""
+        self._closed.wait(timeout)
+
+    def _on_frame(self, frame):
+        # runs on the reactor thread
+        reader = self.q._reader_class(None, encoding=self.q._encoding)
+        message = reader.read(frame, **self.q._options.union_dict(raw=False))
+        if isinstance(message.data, list):
+            if len(message.data) == 3 and message.data[0] == b'upd':
+                self.on_message(parse_dataframe(message.data[2]))
+
+    def _on_closed(self, error):
+        if error is not None:
+            logger.error(f"Error encountered while trying to read tick message: {error}")
+        # also marks a subscription whose connection dropped as stopped, so its readers give up
+        self._stopper.set()
+        self.q.close()
+        self.on_stopped()
+        self._closed.set()
+        logger.info("KdbSubs - finished closing conn")
 
 
 ##utility functions##
@@ -300,44 +312,32 @@ def run_subscription_test(
     timeout_seconds: int = 10
 ) -> dict:
     """
-    Start a kdb subscription in a thread and gather messages until either
+    Start a kdb subscription and gather messages until either
     we have the requested number of messages or we've reached the timeout.
     Returns a dict with success, message, and collected data.
     """
-    q_thread = kdbSub(sub_name, kdb_host, kdb_port, kdb_tls, kdb_scope, *sub_params)
-    q_thread.start()
+    q_sub = kdbSub(sub_name, kdb_host, kdb_port, kdb_tls, kdb_scope, *sub_params)
+    q_sub.start()
 
     start_time = time.time()
     collected_messages = []
     success = False
 
     try:
-        while True:
-            # Check if we've hit the desired number_of_messages
-            if len(collected_messages) >= number_of_messages:
-                success = True
-                break
-
-            # Check if we've hit the timeout
-            if time.time() - start_time >= timeout_seconds:
-                # We can consider it a partial success or a fail, depending on your logic
-                success = False
-                break
-
-            # Try to get data from the queue
+        while len(collected_messages) < number_of_messages:
+            remaining = timeout_seconds - (time.time() - start_time)
+            # Wait for the next message, waking as soon as it arrives
             try:
-                msg = q_thread.message_queue.get_nowait()
-                collected_messages.append(msg)
+                collected_messages.append(q_sub.message_queue.get(timeout=max(remaining, 0)))
             except Empty:
-                pass
-
-            # If the thread signaled a stop (e.g., error or server closed)
-            if q_thread.stopped():
-                # Decide if that is success or fail. Possibly it ended early?
+                # We've hit the timeout. We can consider it a partial success or a fail, depending on your logic
+                break
+            except BufferClosed:
+                # The subscription ended (e.g., error or server closed). Possibly it ended early?
                 success = len(collected_messages) > 0
                 break
-
-            time.sleep(0.01)
+        else:
+            success = True
 
     except Exception as e:
         print(f"Error running subscription: {str(e)}")
@@ -347,9 +347,9 @@ def run_subscription_test(
             "data": []
         }
     finally:
-        # Always stop the thread if it's still running
-        q_thread.stopit()
-        q_thread.join()
+        # Always stop the subscription if it's still running
+        q_sub.stopit()
+        q_sub.join()
 
     return {
         "success": success,
@@ -359,96 +359,265 @@ def run_subscription_test(
     }
 
 
-def run_scheduled_test_group(test_group_id: UUID):
-    """Runs scheduled tests for a given test group."""
+def run_test_case(test_name, test_type, test_code, server, port, tls, scope):
+    """
+    Executes a single test against kdb and returns (result, time_taken, time_run).
+    Only takes plain values so it can run on a worker thread without touching the ORM session.
+    A test that can't be run at all (e.g. invalid subscription config) comes back as a failure.
+    """
+    start_time = datetime.utcnow()
+    result = {"success":False, "data": "", "message": "Test not executed"}  # Default
+
+    if test_type == "Free-Form":
+        code_lines = test_code.split('\n\n')
+        result = sendFreeFormQuery(code_lines, server, port, tls, scope)
+
+    elif test_type == "Functional":  # test is a predefined q function
+        result = sendFunctionalQuery(test_code, server, port, tls, scope)
+
+    elif test_type == "Subscription":
+        # 'test_code' will be JSON with subscription params
+        try:
+            config = json.loads(test_code)
+            sub_name = config.get("subscriptionTest", "defaultSub")
+            sub_params = config.get("subParams", [])
+            # Convert to ints for > comparison in run_subscription_test
+            number_msgs = int(config.get("numberOfMessages", 5))
+            sub_timeout = int(config.get("subTimeout", 10))
+        except Exception as e:
+            logger.error(f"Error parsing test case config: {str(e)}")
+            result = {"success": False, "data": "", "message": f"Invalid subscription config => {str(e)}"}
+        else:
+            result = run_subscription_test(
+                sub_name=sub_name,
+                kdb_host=server,
+                kdb_port=port,
+                kdb_tls=tls,
+                kdb_scope=scope,
+                sub_params=sub_params,
+                number_of_messages=number_msgs,
+                timeout_seconds=sub_timeout
+            )
+
+    logger.info(f"Test '{test_name}' result: {result}")
+    end_time = datetime.utcnow()
+    return result, (end_time - start_time).total_seconds(), end_time
+
+
+def run_test_case_job(test_name, test_type, test_code, server, port, tls, scope):
+    return [run_test_case(test_name, test_type, test_code, server, port, tls, scope)]
+
+
+def sendFunctionalBatch(kdbFunctions, host, port, tls, scope = ""):
+    """
+    Runs several Functional tests in a single .qsuite.executeBatch round-trip.
+    Returns (result, time_taken) per test in input order, time_taken being the server side execution time.
+    """
+    # the handle sits silent while kdb works through the batch, so allow each test the usual 10s
+    table = kdb_pool.send_sync(host, port, tls, 10 * len(kdbFunctions), scope, '.qsuite.executeBatch', list(kdbFunctions))
+    rows = table.to_dict(orient='records')
+    if len(rows) != len(kdbFunctions):
+        raise ValueError(f".qsuite.executeBatch returned {len(rows)} rows for {len(kdbFunctions)} tests")
+
+    outcomes = []
+    for row in rows:
+        success = bool(row['success'])
+        message = convert_value_to_str(row['message'])
+        outcomes.append((
+            {"success": success, "data": "", "message": "Test Ran Successfully" if success else message, "type": "bool"},
+            float(row['elapsed'])
+        ))
+    return outcomes
+
+
+def _batch_unsupported(e):
+    # q's answer to calling a .qsuite.executeBatch it doesn't have, e.g. a process loaded with an older qsuiteSetup.q
+    if not isinstance(e, QException) or not e.args:
+        return False
+    error = e.args[0].decode(errors='replace') if isinstance(e.args[0], bytes) else str(e.args[0])
+    return error in ('type', '.qsuite.executeBatch')
+
+
+def run_functional_batch(kdbFunctions, server, port, tls, scope):
+    """
+    Job wrapper around sendFunctionalBatch returning run_test_case style outcomes.
+    Falls back to one query per test only when the server has no .qsuite.executeBatch, any other
+    failure (timeout, dropped connection, ...) fails every test of the batch.
+    """
+    try:
+        batch = sendFunctionalBatch(kdbFunctions, server, port, tls, scope)
+    except Exception as e:
+        if _batch_unsupported(e):
+            logger.warning(f".qsuite.executeBatch is not defined on {server}:{port}, running {len(kdbFunctions)} Functional tests individually")
+            return [run_test_case(kdbFunction, "Functional", kdbFunction, server, port, tls, scope) for kdbFunction in kdbFunctions]
+        logger.error(f"Batch execution of {len(kdbFunctions)} Functional tests failed: {str(e)}")
+        time_run = datetime.utcnow()
+        return [({"success": False, "data": "", "message": "Kdb Error => " + str(e)}, 0.0, time_run) for _ in kdbFunctions]
+
+    time_run = datetime.utcnow()
+    outcomes = []
+    for kdbFunction, (result, time_taken) in zip(kdbFunctions, batch):
+        logger.info(f"Test '{kdbFunction}' result: {result}")
+        outcomes.append((result, time_taken, time_run))
+    return outcomes
+
+
+def run_scheduled_test_group(test_group_id: UUID, run_id: bytes = None):
+    """
+    Runs scheduled tests for a given test group.
+    Tests run in dependency order (TestDependency), one wave at a time with up to test_group.parallelism
+    tests of a wave in flight. Tests whose prerequisites didn't pass are recorded as skipped, not run.
+    run_id is a TestRun already allocated by the caller (see execute_test_group), otherwise a new run is allocated.
+    """
     logger.info(f"Running scheduled job for TestGroup ID: {test_group_id.hex}")
     session: Session = SessionLocal()
+    run_progress = None
 
     try:
         test_group = session.query(TestGroup).filter(TestGroup.id == test_group_id.bytes).first()
         if not test_group:
             logger.error(f"TestGroup ID {test_group_id.hex} not found.")
+            if run_id is not None:
+                # allocated by execute_test_group, the group was deleted before the run started
+                runs.finish_run(engine, run_id, status='failed')
             return
 
-        # Determine the run_number: max existing for today + 1
-        current_date = datetime.utcnow().date()
-        max_run_number = session.query(func.max(TestResult.run_number)).filter(
-            TestResult.group_id == test_group_id.bytes,
-            TestResult.date_run == current_date
-        ).scalar() or 0  # Returns 0 if no runs exist
-        run_number = max_run_number + 1
-        logger.info(f"Assigned run_number: {run_number} for group {test_group_id.hex} on {current_date}")
         # Retrieve test cases for the group
         test_cases = session.query(TestCase).filter(TestCase.group_id == test_group_id.bytes).all()
-                    
-        for test_case in test_cases:
-            start_time = datetime.utcnow()
-            result = {"success":False, "data": "", "message": "Test not executed"}  # Default
-
-            if test_case.test_type == "Free-Form":
-                code_lines = test_case.test_code.split('\n\n')
-                result = sendFreeFormQuery(code_lines, test_group.server, test_group.port, test_group.tls, test_group.scope)
-
-            elif test_case.test_type == "Functional":  # test is a predefined q function
-                result = sendFunctionalQuery(test_case.test_code, test_group.server, test_group.port, test_group.tls, test_group.scope)
-
-            elif test_case.test_type == "Subscription":
-                # 'test_code' will be JSON with subscription params
-                try:
-                    config = json.loads(test_case.test_code)
-                except Exception as e:
-                    logger.error(f"Error parsing test case config: {str(e)}")
-                    continue  # Skip this test if config parsing fails
-
-                sub_name = config.get("subscriptionTest", "defaultSub")
-                sub_params = config.get("subParams", [])
-                number_msgs = config.get("numberOfMessages", 5)
-                sub_timeout = config.get("subTimeout", 10)
-
-                # Convert to ints for > comparison in run_subscription_test
-                number_msgs = int(number_msgs)
-                sub_timeout = int(sub_timeout)
-
-                result = run_subscription_test(
-                    sub_name=sub_name,
-                    kdb_host=test_group.server,
-                    kdb_port=test_group.port,
-                    kdb_tls=test_group.tls,
-                    kdb_scope=test_group.scope,
-                    sub_params=sub_params,
-                    number_of_messages=number_msgs,
-                    timeout_seconds=sub_timeout
-                )
-
-            logger.info(f"Test '{test_case.test_name}' result: {result}")
-            time_taken = (datetime.utcnow() - start_time).total_seconds()
+        cases_by_id = {test_case.id: test_case for test_case in test_cases}
+
+        if run_id is None:
+            run_id, run_number = runs.allocate_run(engine, test_group_id.bytes, datetime.utcnow().date(), len(test_cases))
+        else:
+            runs.start_run(engine, run_id, len(test_cases))
+        run = session.get(TestRun, run_id)
+        run_date, run_number = run.date_run, run.run_number
+        logger.info(f"Assigned run_number: {run_number} for group {test_group_id.hex} on {run_date}")
+        run_progress = progress.RunProgress(test_group_id.bytes, run_date, run_number, len(test_cases))
+        run_progress.started()
+
+        dependencies = session.query(TestDependency.test_id, TestDependency.dependent_test_id).filter(
+            TestDependency.test_id.in_(cases_by_id.keys())
+        ).all()
+        prerequisites = {}
+        for test_id, prerequisite_id in dependencies:
+            if prerequisite_id in cases_by_id:
+                prerequisites.setdefault(test_id, []).append(prerequisite_id)
+        waves, cyclic = build_waves(cases_by_id.keys(), dependencies)
+        # Everything needed is loaded, end the read transaction so it can't hold up the result writer
+        session.close()
+
+        parallelism = max(1, min(test_group.parallelism or 1, MAX_TEST_PARALLELISM))
+        target = (test_group.server, test_group.port, test_group.tls, test_group.scope)
+        passed = set()
+
+        def record_result(test_case, outcome):
+            result, time_taken, time_run = outcome
+            skipped = result.get("skipped", False)
             if result["success"]:
                 err_message = ""
+                passed.add(test_case.id)
             elif result["message"] == "Response Preview":
                 err_message = "Response was not Boolean"
             else:
                 err_message = result["message"]
 
-            test_result = TestResult(
-                test_case_id=test_case.id,
-                group_id=test_group_id.bytes,
-                date_run=datetime.utcnow().date(),
-                time_run=datetime.utcnow().time(),
-                time_taken=time_taken,
-                pass_status=result["success"],
-                error_message=err_message,
-                run_number=run_number  # Assign the computed run_number
-            )
-            session.add(test_result)
-            session.commit()
-            logger.info(f"Executed test case '{test_case.test_name}' with status: {result['success']} (run_number: {run_number})")
+            result_writer.submit({
+                "test_case_id": test_case.id,
+                "group_id": test_group_id.bytes,
+                "date_run": run_date,  # a run's results stay on its day even if it runs past midnight
+                "time_run": time_run.time(),
+                "time_taken": time_taken,
+                "pass_status": result["success"],
+                "skipped": skipped,
+                "error_message": err_message,
+                "run_number": run_number  # Assign the computed run_number
+            })
+            logger.info(f"Executed test case '{test_case.test_name}' with status: {'skipped' if skipped else result['success']} (run_number: {run_number})")
+            run_progress.test_finished(test_case.test_name, result["success"], time_taken, err_message, skipped)
+
+        def record_skipped(test_case, reason):
+            record_result(test_case, ({"success": False, "skipped": True, "data": "", "message": SKIPPED_PREFIX + reason}, 0.0, datetime.utcnow()))
+
+        def record_job(test_cases_in_job, outcomes=None, error=None):
+            # A job that raised still gets a failed result per test, so the run's counters reach total_tests
+            if error is not None:
+                logger.error(f"Error executing test case(s) {[test_case.test_name for test_case in test_cases_in_job]}: {str(error)}")
+                outcomes = [({"success": False, "data": "", "message": f"Kdb Error => {str(error)}"}, 0.0, datetime.utcnow())] * len(test_cases_in_job)
+            for test_case, outcome in zip(test_cases_in_job, outcomes):
+                record_result(test_case, outcome)
+
+        for test_id in cyclic:
+            record_skipped(cases_by_id[test_id], "dependency cycle")
+
+        executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="qsuite-test") if parallelism > 1 else None
+        if executor:
+            logger.info(f"Running {len(test_cases)} tests in {len(waves)} waves with parallelism {parallelism}")
 
-        # After committing new test results, trigger cache refresh
         try:
-            set_cache_refresh_flag()
-            logger.info("Cache refreshed successfully.")
-        except Exception as e:
-            logger.error(f"Error refreshing cache: {str(e)}")
+            for wave in waves:
+                runnable = []
+                for test_id in wave:
+                    failed = [cases_by_id[p].test_name for p in prerequisites.get(test_id, []) if p not in passed]
+                    if failed:
+                        record_skipped(cases_by_id[test_id], "depends on failed test(s) " + ", ".join(failed))
+                    else:
+                        runnable.append(cases_by_id[test_id])
+
+                # Many Functional tests in a wave are sent as .qsuite.executeBatch calls instead of one round-trip each
+                jobs = []
+                functional = [test_case for test_case in runnable if test_case.test_type == "Functional"]
+                if len(functional) >= FUNCTIONAL_BATCH_THRESHOLD:
+                    runnable = [test_case for test_case in runnable if test_case.test_type != "Functional"]
+                    for i in range(0, len(functional), FUNCTIONAL_BATCH_SIZE):
+                        chunk = functional[i:i + FUNCTIONAL_BATCH_SIZE]
+                        jobs.append((chunk, run_functional_batch, ([test_case.test_code for test_case in chunk], *target)))
+                for test_case in runnable:
+                    jobs.append(([test_case], run_test_case_job, (test_case.test_name, test_case.test_type, test_case.test_code, *target)))
+
+                if executor is None:
+                    for test_cases_in_job, job, args in jobs:
+                        try:
+                            outcomes = job(*args)
+                        except Exception as e:
+                            record_job(test_cases_in_job, error=e)
+                        else:
+                            record_job(test_cases_in_job, outcomes)
+                    continue
 
+                # Workers only run the kdb side, results are written from this thread as they complete
+                futures = {executor.submit(job, *args): test_cases_in_job for test_cases_in_job, job, args in jobs}
+                for future in as_completed(futures):
+                    test_cases_in_job = futures[future]
+                    try:
+                        outcomes = future.result()
+                    except Exception as e:
+                        record_job(test_cases_in_job, error=e)
+                    else:
+                        record_job(test_cases_in_job, outcomes)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        # Make sure every result of this run is committed (and its date indexed) before reporting it finished
+        result_writer.flush()
+        unwritten = result_writer.take_unwritten(test_group_id.bytes, run_date, run_number)
+        if unwritten:
+            # the counters only cover what was written, the rest is spooled until the writer next starts
+            logger.error(f"{unwritten} results of run {run_number} of group {test_group_id.hex} could not be written")
+            runs.finish_run(engine, run_id, status='failed')
+            run_progress.finished('failed')
+        else:
+            runs.finish_run(engine, run_id)
+            run_progress.finished()
+
+    except Exception:
+        if run_id is not None:
+            runs.finish_run(engine, run_id, status='failed')
+        if run_progress is not None:
+            run_progress.finished('failed')
+        raise
     finally:
+        if run_progress is not None:
+            run_progress.close()
         session.close()
@@ -0,0 +1,203 @@
+import logging
+import os
+import uuid
+from datetime import date, datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import select, delete
+
+from models.models import TestResult
+from config.config import ARCHIVE_PATH, ARCHIVE_BATCH_ROWS, RESULT_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Archived results live in one zstd compressed Parquet file per day, hive partitioned on date_run:
+#   ARCHIVE_PATH/test_result/date_run=2024-01-31/part-0.parquet
+RESULTS_PATH = os.path.join(ARCHIVE_PATH, "test_result")
+PARTITION_PREFIX = "date_run="
+PART_FILE = "part-0.parquet"
+
+RESULT_SCHEMA = pa.schema([
+    ("id", pa.binary(16)),
+    ("test_case_id", pa.binary(16)),
+    ("group_id", pa.binary(16)),
+    ("time_run", pa.time64("us")),
+    ("time_taken", pa.float64()),
+    ("pass_status", pa.bool_()),
+    ("skipped", pa.bool_()),  # null in days archived before results had a skipped state
+    ("error_message", pa.string()),
+    ("run_number", pa.int32()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("date_run", pa.date32())]), flavor="hive")
+
+
+def partition_dir(day):
+    return os.path.join(RESULTS_PATH, f"{PARTITION_PREFIX}{day.isoformat()}")
+
+
+def archived_dates(start=None, end=None):
+    """Days that have an archive partition, optionally limited to start..end (inclusive)."""
+    if not os.path.isdir(RESULTS_PATH):
+        return []
+    days = []
+    for name in os.listdir(RESULTS_PATH):
+        if not name.startswith(PARTITION_PREFIX):
+            continue
+        day = date.fromisoformat(name[len(PARTITION_PREFIX):])
+        if (start is None or day >= start) and (end is None or day <= end):
+            days.append(day)
+    return sorted(days)
+
+
+def partition_batches(path, columns=None, batch_size=10_000):
+    """
+    A partition file's rows as RecordBatches of the given columns (default all of RESULT_SCHEMA). Columns added
+    to RESULT_SCHEMA since the day was archived read as nulls, as they do through read_results.
+    """
+    columns = columns or RESULT_SCHEMA.names
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+        for name in columns:
+            if name not in batch.schema.names:
+                field = RESULT_SCHEMA.field(name)
+                batch = batch.append_column(field, pa.nulls(batch.num_rows, field.type))
+        yield batch.select(columns)
+
+
+def write_partition(day, batches):
+    """
+    Writes a day's rows, given as RESULT_SCHEMA RecordBatches, to its Parquet file one batch at a time after any
+    rows already archived for that day (minus duplicates by id), so re-archiving a day after an interrupted
+    run is harmless. The file is written under a temporary name, synced and then moved into place.
+    """
+    directory = partition_dir(day)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, PART_FILE)
+    tmp_path = os.path.join(directory, f".{PART_FILE}.{uuid.uuid4().hex}.tmp")
+    try:
+        with pq.ParquetWriter(tmp_path, RESULT_SCHEMA, compression="zstd") as writer:
+            archived_ids = None
+            if os.path.exists(path):
+                archived_ids = pq.read_table(path, columns=["id"])["id"].combine_chunks()
+                for batch in partition_batches(path):
+                    writer.write_batch(batch)
+            for batch in batches:
+                if archived_ids is not None:
+                    batch = batch.filter(pc.invert(pc.is_in(batch["id"], value_set=archived_ids)))
+                if batch.num_rows:
+                    writer.write_batch(batch)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    # the rename has to be on disk too before the rows it holds are deleted from the database
+    directory_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+def archive_results(engine, retention_days=RESULT_RETENTION_DAYS, today=None):
+    """
+    Moves test results older than retention_days from the database into the Parquet archive, a day at a
+    time: the day's rows are streamed into its file ARCHIVE_BATCH_ROWS at a time, and only once the file is
+    written and synced are they deleted, in a short transaction of its own. The rollup (TestResultDaily)
+    is left alone, so daily totals still cover archived days.
+    """
+    cutoff = (today or datetime.utcnow().date()) - timedelta(days=retention_days)
+    with engine.connect() as connection:
+        days = connection.execute(
+            select(TestResult.date_run).where(TestResult.date_run < cutoff).distinct().order_by(TestResult.date_run)
+        ).scalars().all()
+
+    archived = 0
+    for day in days:
+        read = 0
+
+        def day_batches(result):
+            nonlocal read
+            for rows in result.partitions():
+                read += len(rows)
+                yield pa.RecordBatch.from_pydict(
+                    {name: [row[i] for row in rows] for i, name in enumerate(RESULT_SCHEMA.names)}, schema=RESULT_SCHEMA
+                )
+
+        with engine.connect() as connection:
+            result = connection.execution_options(yield_per=ARCHIVE_BATCH_ROWS).execute(select(
+                *(TestResult.__table__.c[name] for name in RESULT_SCHEMA.names)
+            ).where(TestResult.date_run == day).order_by(TestResult.group_id, TestResult.run_number, TestResult.test_case_id))
+            write_partition(day, day_batches(result))
+        # days past retention get no new results (runs are failed long before), so the whole day can go
+        with engine.begin() as connection:
+            connection.execute(delete(TestResult).where(TestResult.date_run == day))
+        archived += read
+        logger.info(f"Archived {read} test results from {day}")
+
+    if days:
+        logger.info(f"Archived {archived} test results from {len(days)} days before {cutoff}")
+    return archived
+
+
+def read_results(start, end, columns=None, test_case_id=None, group_id=None):
+    """
+    Archived results with start <= date_run <= end as a pyarrow Table (date_run included), optionally
+    for one test case or group. Only the partitions in the range are opened.
+    """
+    days = archived_dates(start, end)
+    columns = columns or ["date_run"] + RESULT_SCHEMA.names
+    if not days:
+        return pa.table({name: pa.array([], type=result_field_type(name)) for name in columns})
+
+    dataset = ds.dataset([os.path.join(partition_dir(day), PART_FILE) for day in days], format="parquet",
+                         schema=RESULT_SCHEMA.append(pa.field("date_run", pa.date32())),
+                         partitioning=PARTITIONING, partition_base_dir=RESULTS_PATH)
+    condition = None
+    for name, value in (("test_case_id", test_case_id), ("group_id", group_id)):
+        if value is not None:
+            clause = ds.field(name) == pa.scalar(value, pa.binary(16))
+            condition = clause if condition is None else condition & clause
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def result_field_type(name):
+    return pa.date32() if name == "date_run" else RESULT_SCHEMA.field(name).type
+
+
+def read_result_rows(start, end, columns=None, test_case_id=None, group_id=None):
+    """read_results as a list of dicts, in date_run / run_number order when both are selected."""
+    table = read_results(start, end, columns, test_case_id, group_id)
+    if "date_run" in table.column_names and "run_number" in table.column_names:
+        table = table.sort_by([("date_run", "ascending"), ("run_number", "ascending")])
+    return table.to_pylist()
+
+
+def iter_result_batches(start, end, columns=None, group_ids=None, pass_status=None, batch_size=10_000, days=None):
+    """
+    Archived results with start <= date_run <= end as RecordBatches of at most batch_size rows, day by day
+    in date order, so a long range is read with bounded memory. date_run is added as the first column.
+    days, when given, is the archived_dates(start, end) listing to read instead of listing them again.
+    """
+    columns = columns or RESULT_SCHEMA.names
+    value_set = pa.array(group_ids, type=pa.binary(16)) if group_ids else None
+    for day in (archived_dates(start, end) if days is None else days):
+        filter_columns = list(dict.fromkeys(columns + ["group_id", "pass_status"]))
+        for batch in partition_batches(os.path.join(partition_dir(day), PART_FILE), filter_columns, batch_size):
+            mask = None
+            if value_set is not None:
+                mask = pc.is_in(batch["group_id"], value_set=value_set)
+            if pass_status is not None:
+                status = pc.equal(batch["pass_status"], pass_status)
+                mask = status if mask is None else pc.and_(mask, status)
+            if mask is not None:
+                batch = batch.filter(mask)
+            if batch.num_rows:
+                batch = batch.select(columns)
+                yield pa.RecordBatch.from_arrays(
+                    [pa.array([day] * batch.num_rows, pa.date32())] + batch.columns, names=["date_run"] + columns
+                )
@@ -0,0 +1,279 @@
+"""
+Bulk creation and update of test cases, shared by the /bulk_upsert_test_cases/ and /discover_test_cases/
+endpoints and this command line:
+
+    python bulk_import.py --group-id GROUP tests.csv        (or .json / .ndjson, - for stdin)
+    python bulk_import.py --group-id GROUP --discover       (every function in the group's .qsuite.tests)
+
+Each test case is a dict of test_name, test_code, test_type (Functional when missing), an optional id and
+optional dependencies, given as ids or names of tests in the same import or already in the database. In CSV
+the dependencies column is a ';' separated list. A test whose name already exists is updated in place.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import sys
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select, insert, update, delete
+
+from models.models import TestCase, TestGroup, TestDependency, SessionLocal
+from dependency_graph import build_waves
+
+logger = logging.getLogger(__name__)
+
+TEST_TYPES = ("Functional", "Free-Form", "Subscription")
+# bound parameters per IN (...) lookup
+LOOKUP_CHUNK = 500
+
+
+class BulkImportError(ValueError):
+    """Raised with every problem found in an import; nothing is written when it is raised."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def chunked(values, size=LOOKUP_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def parse_test_cases(data, content_type="application/json"):
+    """Reads test case dicts from a JSON list (or {"test_cases": [...]}), NDJSON or CSV document."""
+    if isinstance(data, bytes):
+        data = data.decode()
+    if "csv" in content_type:
+        test_cases = []
+        for row in csv.DictReader(io.StringIO(data)):
+            row = {key.strip(): (value or "").strip() for key, value in row.items() if key}
+            row["dependencies"] = [dep.strip() for dep in row.get("dependencies", "").split(";") if dep.strip()]
+            test_cases.append({key: value for key, value in row.items() if value != ""})
+        return test_cases
+    if "ndjson" in content_type:
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
+    parsed = json.loads(data)
+    return parsed["test_cases"] if isinstance(parsed, dict) else parsed
+
+
+def parse_id(value):
+    if isinstance(value, uuid.UUID):
+        return value.bytes
+    try:
+        return uuid.UUID(str(value)).bytes
+    except ValueError:
+        return None
+
+
+def find_cycles(new_prerequisites, get_prerequisites):
+    """
+    Tests caught in a dependency cycle once the upserted tests' prerequisites are replaced by
+    new_prerequisites ({test_id: {prerequisite_id}}). The existing graph is walked one level (one query)
+    at a time from the new prerequisites, the way dependency_graph.find_cycle does for a single test.
+    """
+    edges = [(test_id, prerequisite_id) for test_id, prerequisites in new_prerequisites.items() for prerequisite_id in prerequisites]
+    seen = set(new_prerequisites)
+    frontier = [prerequisite_id for _, prerequisite_id in edges if prerequisite_id not in seen]
+    seen.update(frontier)
+    while frontier:
+        next_frontier = []
+        for test_id, prerequisite_id in get_prerequisites(frontier):
+            edges.append((test_id, prerequisite_id))
+            if prerequisite_id not in seen:
+                seen.add(prerequisite_id)
+                next_frontier.append(prerequisite_id)
+        frontier = next_frontier
+    _, cyclic = build_waves(seen, edges)
+    return cyclic
+
+
+def bulk_upsert(db, group_id, test_cases):
+    """
+    Validates every test case first (names checked against the database in one lookup) and then writes
+    all cases and their dependencies in the session's transaction. Raises BulkImportError without writing
+    anything if any case is invalid. Returns {"created", "updated", "ids": {test_name: id hex}}.
+    """
+    group_id = parse_id(group_id)
+    if db.get(TestGroup, group_id) is None:
+        raise BulkImportError(["Test group not found"])
+
+    errors = []
+    by_name = {}
+    for position, test_case in enumerate(test_cases):
+        name = (test_case.get("test_name") or "").strip()
+        if not name:
+            errors.append(f"Test case {position} has no test_name")
+            continue
+        if name in by_name:
+            errors.append(f"Test case '{name}' appears more than once")
+            continue
+        if not test_case.get("test_code"):
+            errors.append(f"Test case '{name}' has no test_code")
+        if test_case.get("test_type", "Functional") not in TEST_TYPES:
+            errors.append(f"Test case '{name}' has an invalid test_type, should be one of {list(TEST_TYPES)}")
+        if test_case.get("id") and parse_id(test_case["id"]) is None:
+            errors.append(f"Test case '{name}' has an invalid id")
+        by_name[name] = test_case
+    if errors:
+        raise BulkImportError(errors)
+
+    # every existing test sharing a name with the import, or referenced by id, in one pass
+    wanted_ids = {parse_id(test_case["id"]) for test_case in by_name.values() if test_case.get("id")}
+    dependency_refs = {str(dep) for test_case in by_name.values() for dep in test_case.get("dependencies", [])}
+    wanted_ids |= {parse_id(ref) for ref in dependency_refs if parse_id(ref)}
+    wanted_names = set(by_name) | {ref for ref in dependency_refs if not parse_id(ref)}
+    existing = {}
+    for names in chunked(wanted_names):
+        existing.update({row.id: row for row in db.execute(
+            select(TestCase.id, TestCase.test_name, TestCase.group_id).where(TestCase.test_name.in_(names))
+        )})
+    for ids in chunked(wanted_ids - set(existing)):
+        existing.update({row.id: row for row in db.execute(
+            select(TestCase.id, TestCase.test_name, TestCase.group_id).where(TestCase.id.in_(ids))
+        )})
+    existing_by_name = {row.test_name: row for row in existing.values()}
+
+    ids = {}
+    for name, test_case in by_name.items():
+        given_id = parse_id(test_case["id"]) if test_case.get("id") else None
+        named = existing_by_name.get(name)
+        if named and given_id and named.id != given_id:
+            errors.append(f"A test case named '{name}' already exists")
+        elif named and named.group_id != group_id:
+            errors.append(f"A test case named '{name}' already exists in another group")
+        elif given_id in existing and existing[given_id].group_id != group_id:
+            errors.append(f"Test case '{name}' belongs to another group")
+        ids[name] = given_id or (named.id if named else uuid.uuid4().bytes)
+
+    known_ids = set(existing) | set(ids.values())
+    prerequisites = {}
+    for name, test_case in by_name.items():
+        resolved = set()
+        for ref in test_case.get("dependencies", []):
+            ref = str(ref)
+            dep_id = parse_id(ref)
+            if dep_id is None:
+                dep_id = ids.get(ref) or (existing_by_name[ref].id if ref in existing_by_name else None)
+            if dep_id is None or dep_id not in known_ids:
+                errors.append(f"Dependency '{ref}' of '{name}' does not exist")
+            else:
+                resolved.add(dep_id)
+        prerequisites[ids[name]] = resolved
+    if errors:
+        raise BulkImportError(errors)
+
+    def get_prerequisites(test_ids):
+        return db.execute(select(TestDependency.test_id, TestDependency.dependent_test_id).where(
+            TestDependency.test_id.in_(test_ids)
+        )).all()
+
+    cyclic = find_cycles(prerequisites, get_prerequisites)
+    if cyclic:
+        names = {test_id: name for name, test_id in ids.items()}
+        names.update({row.id: row.test_name for row in existing.values()})
+        raise BulkImportError(["Dependencies would create a cycle between: " +
+                               ", ".join(sorted(names.get(test_id, test_id.hex()) for test_id in cyclic))])
+
+    new_rows, updated_rows = [], []
+    now = datetime.utcnow()
+    for name, test_case in by_name.items():
+        row = {"id": ids[name], "test_name": name, "test_code": test_case["test_code"]}
+        if ids[name] in existing:
+            updated_rows.append(row)
+        else:
+            new_rows.append({**row, "group_id": group_id, "creation_date": now,
+                             "test_type": test_case.get("test_type", "Functional")})
+
+    if new_rows:
+        db.execute(insert(TestCase), new_rows)
+    if updated_rows:
+        db.execute(update(TestCase), updated_rows)
+    for test_ids in chunked(prerequisites):
+        db.execute(delete(TestDependency).where(TestDependency.test_id.in_(test_ids)))
+    dependency_rows = [{"test_id": test_id, "dependent_test_id": prerequisite_id}
+                       for test_id, prerequisite_ids in prerequisites.items() for prerequisite_id in prerequisite_ids]
+    if dependency_rows:
+        db.execute(insert(TestDependency), dependency_rows)
+
+    logger.info(f"Bulk upsert into group {group_id.hex()}: {len(new_rows)} created, {len(updated_rows)} updated, "
+                f"{len(dependency_rows)} dependencies")
+    return {"created": len(new_rows), "updated": len(updated_rows), "ids": {name: test_id.hex() for name, test_id in ids.items()}}
+
+
+def discovered_test_cases(function_names, existing_codes=(), existing_names=()):
+    """
+    Functional test cases for .qsuite.tests functions (as returned by .qsuite.showAllTests) not yet in the
+    group, and the names of those skipped because a test of that name already exists in some group (test
+    names are unique across groups, so importing them would update or reject another test).
+    """
+    names = [name.decode('latin') if isinstance(name, bytes) else name for name in function_names]
+    existing_codes, existing_names = set(existing_codes), set(existing_names)
+    new_names = [name for name in names if name not in existing_codes]
+    clashes = [name for name in new_names if name in existing_names]
+    return [{"test_name": name, "test_code": name, "test_type": "Functional"} for name in new_names if name not in existing_names], clashes
+
+
+def existing_test_names(db, names):
+    """Which of names are already taken by a test case, in any group."""
+    taken = set()
+    for chunk in chunked(set(names)):
+        taken.update(db.execute(select(TestCase.test_name).where(TestCase.test_name.in_(chunk))).scalars())
+    return taken
+
+
+def discover(db, group_id, function_names):
+    """discovered_test_cases for the group, checked against the database."""
+    names = [name.decode('latin') if isinstance(name, bytes) else name for name in function_names]
+    return discovered_test_cases(names, functional_test_codes(db, group_id), existing_test_names(db, names))
+
+
+def functional_test_codes(db, group_id):
+    return db.execute(select(TestCase.test_code).where(
+        TestCase.group_id == parse_id(group_id),
+        TestCase.test_type == "Functional"
+    )).scalars().all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update many test cases of one group in a single transaction")
+    parser.add_argument("--group-id", required=True, help="Test group the test cases belong to")
+    parser.add_argument("file", nargs="?", help="CSV, JSON or NDJSON file of test cases, - for stdin")
+    parser.add_argument("--discover", action="store_true", help="Add every .qsuite.tests function of the group's kdb process")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    db = SessionLocal()
+    try:
+        if args.discover:
+            from KdbSubs import sendKdbQuery
+            group = db.get(TestGroup, parse_id(args.group_id))
+            if group is None:
+                sys.exit("Test group not found")
+            function_names = sendKdbQuery('.qsuite.showAllTests', group.server, group.port, group.tls, group.scope, [])
+            test_cases, clashes = discover(db, args.group_id, function_names)
+            for name in clashes:
+                print(f"Skipped '{name}': a test case with that name already exists")
+        elif args.file:
+            data = sys.stdin.read() if args.file == "-" else open(args.file).read()
+            content_type = "text/csv" if args.file.endswith(".csv") else "application/x-ndjson" if args.file.endswith(".ndjson") else "application/json"
+            test_cases = parse_test_cases(data, content_type)
+        else:
+            parser.error("give a file of test cases or --discover")
+
+        result = bulk_upsert(db, args.group_id, test_cases)
+        db.commit()
+        print(f"{result['created']} test cases created, {result['updated']} updated")
+    except BulkImportError as e:
+        db.rollback()
+        sys.exit("\n".join(e.errors))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+from config.config import CACHE_PATH
+from models.models import TestResultDaily
+
+logger = logging.getLogger(__name__)
+
+# Bit n of the calendar is set when there are results for EPOCH + n days
+EPOCH = date(2000, 1, 1)
+DAYS = 40960  # ~112 years
+MAGIC = b'QDTX'
+HEADER = struct.Struct('<4sIQ')  # magic, built flag, version counter
+VERSION_OFFSET = 8
+SIZE = HEADER.size + DAYS // 8
+
+
+class DateIndex:
+    """
+    Calendar bitmap of the dates that have test results, persisted in a small mmap'd file in CACHE_PATH.
+
+    Writers (the ResultWriter after each committed batch) set bits under an flock and then bump the version
+    counter in the header, so every worker sharing the file sees new dates. Readers only compare the version
+    with the one they last summarised, so get_unique_dates is a memory lookup unless a new date appeared.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._mm = None
+        self._open_lock = threading.Lock()
+        self._summary_version = None
+        self._summary = None
+
+    def _map(self):
+        if self._mm is None:
+            with self._open_lock:
+                if self._mm is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    try:
+                        if os.fstat(fd).st_size < SIZE:
+                            os.ftruncate(fd, SIZE)
+                            os.pwrite(fd, HEADER.pack(MAGIC, 0, 0), 0)
+                    finally:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                    self._mm = mmap.mmap(fd, SIZE)
+                    self._fd = fd
+        return self._mm
+
+    @contextmanager
+    def _locked(self):
+        mm = self._map()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield mm
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @property
+    def version(self):
+        return struct.unpack_from('<Q', self._map(), VERSION_OFFSET)[0]
+
+    @property
+    def built(self):
+        """False until the index has been rebuilt from the database once."""
+        magic, built, _ = HEADER.unpack_from(self._map())
+        return magic == MAGIC and built == 1
+
+    def _set(self, mm, day):
+        offset = (day - EPOCH).days
+        if not 0 <= offset < DAYS:
+            logger.warning(f"Date {day} is outside the date index range, ignoring it")
+            return False
+        position, bit = HEADER.size + offset // 8, 1 << (offset % 8)
+        if mm[position] & bit:
+            return False
+        mm[position] |= bit
+        return True
+
+    def add(self, dates):
+        """Marks dates as having results. The version only moves when a new date appears."""
+        with self._locked() as mm:
+            changed = False
+            for day in set(dates):
+                changed = self._set(mm, day) or changed
+            if changed:
+                struct.pack_into('<Q', mm, VERSION_OFFSET, struct.unpack_from('<Q', mm, VERSION_OFFSET)[0] + 1)
+        return changed
+
+    def rebuild(self, dates):
+        """Replaces the whole calendar, see rebuild_from_rollup."""
+        with self._locked() as mm:
+            mm[HEADER.size:SIZE] = bytes(SIZE - HEADER.size)
+            for day in dates:
+                self._set(mm, day)
+            version = struct.unpack_from('<Q', mm, VERSION_OFFSET)[0] + 1
+            HEADER.pack_into(mm, 0, MAGIC, 1, version)
+
+    def summary(self):
+        """First and latest date with results and the dates in between without any, as returned by get_unique_dates."""
+        version = self.version
+        if version != self._summary_version:
+            # bits are set before the version is bumped, so a concurrent add is picked up by the next call at worst
+            bitmap = int.from_bytes(self._map()[HEADER.size:SIZE], 'little')
+            if bitmap:
+                first, last = (bitmap & -bitmap).bit_length() - 1, bitmap.bit_length() - 1
+                bits = bin(bitmap)[:1:-1]  # bits[n] is bit n
+                self._summary = {
+                    "start_date": (EPOCH + timedelta(days=first)).strftime('%Y-%m-%d'),
+                    "latest_date": (EPOCH + timedelta(days=last)).strftime('%Y-%m-%d'),
+                    "missing_dates": [(EPOCH + timedelta(days=offset)).strftime('%Y-%m-%d')
+                                      for offset in range(first, last + 1) if bits[offset] == '0'],
+                }
+            else:
+                self._summary = {"start_date": None, "latest_date": None, "missing_dates": []}
+            self._summary_version = version
+        return self._summary
+
+
+date_index = DateIndex(os.path.join(CACHE_PATH, "date_index.bin"))
+
+
+def rebuild_from_rollup(connection):
+    """
+    Rebuilds date_index from test_result_daily. add() only ever sets bits, so this is what drops a date
+    again: it runs at startup (covering a restored database) and after results are deleted.
+    """
+    date_index.rebuild(connection.execute(select(TestResultDaily.date_run).distinct()).scalars().all())
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from models.models import SessionLocal
+from models.models import SessionLocal, ReadSessionLocal, AsyncReadSessionLocal
 from auth.authorization_header_elements import get_bearer_token
 from auth.custom_exceptions import PermissionDeniedException
 from fastapi import Depends
@@ -13,6 +13,29 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """Read-only session for GET endpoints."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Read-only AsyncSession for the async GET endpoints."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+def get_async_session_factory():
+    """
+    Session factory for responses that stream after the endpoint has returned: dependency sessions are
+    closed by then, so a StreamingResponse opens its own session from this inside its generator.
+    """
+    return AsyncReadSessionLocal
+
+
 def validate_token(token: str = Depends(get_bearer_token)):
     return JsonWebToken(token).validate()
 
@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+# TestDependency(test_id=A, dependent_test_id=B) means A depends on B, i.e. B has to pass before A runs.
+
+
+def build_waves(test_ids, dependencies):
+    """
+    Groups tests into topological waves: every test's prerequisites sit in an earlier wave,
+    so the tests within one wave are independent and can run in parallel.
+    Prerequisites outside test_ids (e.g. in another group) are treated as already satisfied.
+
+    Returns (waves, cyclic) where cyclic lists the tests caught in (or behind) a dependency cycle.
+    """
+    test_ids = list(test_ids)
+    known = set(test_ids)
+    prerequisites = defaultdict(set)
+    dependents = defaultdict(set)
+    for test_id, prerequisite_id in dependencies:
+        if test_id in known and prerequisite_id in known and test_id != prerequisite_id:
+            prerequisites[test_id].add(prerequisite_id)
+            dependents[prerequisite_id].add(test_id)
+        elif test_id == prerequisite_id and test_id in known:
+            prerequisites[test_id].add(test_id)
+
+    remaining = {test_id: len(prerequisites[test_id]) for test_id in test_ids}
+    wave = [test_id for test_id in test_ids if remaining[test_id] == 0]
+    waves = []
+    while wave:
+        waves.append(wave)
+        next_wave = []
+        for test_id in wave:
+            for dependent_id in dependents[test_id]:
+                remaining[dependent_id] -= 1
+                if remaining[dependent_id] == 0:
+                    next_wave.append(dependent_id)
+        wave = next_wave
+
+    scheduled = {test_id for wave in waves for test_id in wave}
+    cyclic = [test_id for test_id in test_ids if test_id not in scheduled]
+    return waves, cyclic
+
+
+def find_cycle(test_id, prerequisite_ids, get_prerequisites):
+    """
+    Checks whether making test_id depend on prerequisite_ids would close a cycle.
+
+    get_prerequisites(ids) returns (test_id, prerequisite_id) pairs for the given tests, so the
+    existing graph is walked one level (one query) at a time instead of being loaded whole.
+    Returns the offending path [test_id, ..., test_id] or None.
+    """
+    parent = {}
+    frontier = []
+    for prerequisite_id in prerequisite_ids:
+        if prerequisite_id == test_id:
+            return [test_id, test_id]
+        if prerequisite_id not in parent:
+            parent[prerequisite_id] = test_id
+            frontier.append(prerequisite_id)
+
+    while frontier:
+        next_frontier = []
+        for current_id, prerequisite_id in get_prerequisites(frontier):
+            if prerequisite_id == test_id:
+                path = [test_id, current_id]
+                while path[-1] != test_id:
+                    path.append(parent[path[-1]])
+                return list(reversed(path))
+            if prerequisite_id not in parent:
+                parent[prerequisite_id] = current_id
+                next_frontier.append(prerequisite_id)
+        frontier = next_frontier
+    return None
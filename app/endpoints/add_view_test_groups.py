@@ -2,17 +2,18 @@ import requests
 import uuid
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional
 import logging
 from uuid import UUID
 
-from models.models import TestGroup, TestCase, TestResult
-from dependencies import get_db
+from models.models import TestGroup, TestCase, TestResult, TestResultDaily
+from dependencies import get_db, get_async_db
 from KdbSubs import *
-from config.config import SCHEDULER_URL
+from config.config import SCHEDULER_URL, MAX_TEST_PARALLELISM
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +32,7 @@ class TestGroupCreate(BaseModel):
     schedule: Optional[str] = None
     tls: bool
     scope: Optional[str] = None
+    parallelism: Optional[int] = Field(None, ge=1, le=MAX_TEST_PARALLELISM)
 
 class TestGroupUpdate(BaseModel):
     name: Optional[str] = None
@@ -39,6 +41,7 @@ class TestGroupUpdate(BaseModel):
     schedule: Optional[str] = None
     tls: Optional[bool] = None
     scope: Optional[str] = None
+    parallelism: Optional[int] = Field(None, ge=1, le=MAX_TEST_PARALLELISM)
 
 @router.post("/test_kdb_connection/")
 async def test_kdb_connection(
@@ -48,7 +51,7 @@ async def test_kdb_connection(
     logger.info("testing kdb connection")
     try:
         # Pass the optional scope through to the kdb test function
-        result = test_kdb_conn(
+        result = await test_kdb_conn_async(
             host=test_group.server,
             port=test_group.port,
             tls=test_group.tls,
@@ -96,6 +99,8 @@ async def upsert_test_group(
             existing_group.tls = test_group.tls
         if test_group.scope is not None:
             existing_group.scope = test_group.scope
+        if test_group.parallelism is not None:
+            existing_group.parallelism = test_group.parallelism
 
         db.commit()
 
@@ -109,7 +114,8 @@ async def upsert_test_group(
             port=test_group.port,
             schedule=test_group.schedule,
             tls=test_group.tls,
-            scope=test_group.scope
+            scope=test_group.scope,
+            parallelism=test_group.parallelism or 1
         )
         db.add(new_test_group)
         db.commit()
@@ -145,7 +151,8 @@ async def add_test_group(
         port=test_group.port,
         schedule=test_group.schedule,
         tls=test_group.tls,
-        scope=test_group.scope
+        scope=test_group.scope,
+        parallelism=test_group.parallelism or 1
     )
     db.add(new_test_group)
     db.commit()
@@ -190,6 +197,8 @@ async def edit_test_group(
         test_group_obj.tls = test_group.tls
     if test_group.scope is not None:
         test_group_obj.scope = test_group.scope
+    if test_group.parallelism is not None:
+        test_group_obj.parallelism = test_group.parallelism
 
     db.commit()
 
@@ -227,9 +236,9 @@ async def delete_test_group(id: UUID, db: Session = Depends(get_db)):
     return {"message": "Test group deleted successfully"}
 
 @router.get("/test_groups/")
-async def get_test_groups(db: Session = Depends(get_db)):
+async def get_test_groups(db: AsyncSession = Depends(get_async_db)):
     logger.info("getting test groups")
-    test_groups = db.query(TestGroup).all()
+    test_groups = (await db.execute(select(TestGroup))).scalars().all()
     groups_data = [
         {
             "id": group.id.hex(),
@@ -238,7 +247,8 @@ async def get_test_groups(db: Session = Depends(get_db)):
             "port": group.port,
             "schedule": group.schedule,
             "tls": group.tls,
-            "scope": group.scope  # Return scope if you want
+            "scope": group.scope,  # Return scope if you want
+            "parallelism": group.parallelism
         }
         for group in test_groups
     ]
@@ -249,7 +259,7 @@ async def get_test_group_stats(
     date: str,
     group_id: Optional[UUID] = None,
     run_number: Optional[int] = None,  # New optional parameter
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"Getting test group stats for date={date}, group_id={group_id}, run_number={run_number}")
     try:
@@ -257,29 +267,23 @@ async def get_test_group_stats(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
 
-    passed_count_query = db.query(func.count(TestResult.id)).join(TestCase).filter(
-        TestResult.date_run == specific_date,
-        TestResult.pass_status == True
-    )
-
-    failed_count_query = db.query(func.count(TestResult.id)).join(TestCase).filter(
-        TestResult.date_run == specific_date,
-        TestResult.pass_status == False
-    )
+    query = select(
+        func.coalesce(func.sum(TestResultDaily.passed), 0),
+        func.coalesce(func.sum(TestResultDaily.failed), 0),
+        func.coalesce(func.sum(TestResultDaily.skipped), 0)
+    ).where(TestResultDaily.date_run == specific_date)
 
     if group_id:
-        passed_count_query = passed_count_query.filter(TestCase.group_id == group_id.bytes)
-        failed_count_query = failed_count_query.filter(TestCase.group_id == group_id.bytes)
+        query = query.where(TestResultDaily.group_id == group_id.bytes)
 
     if run_number is not None:
-        passed_count_query = passed_count_query.filter(TestResult.run_number == run_number)
-        failed_count_query = failed_count_query.filter(TestResult.run_number == run_number)
+        query = query.where(TestResultDaily.run_number == run_number)
 
-    passed_count = passed_count_query.scalar()
-    failed_count = failed_count_query.scalar()
+    passed_count, failed_count, skipped_count = (await db.execute(query)).one()
 
     return {
         "total_passed": passed_count,
-        "total_failed": failed_count
+        "total_failed": failed_count,
+        "total_skipped": skipped_count
     }
 
@@ -1,19 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, desc, literal, null, tuple_, exists, union_all
 from sqlalchemy import select
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 from typing import List, Optional
 import time
+import json
+import base64
 from math import floor
 import logging
 from uuid import UUID
 
-from models.models import TestResult, TestCase, TestGroup
-from dependencies import get_db
-from config.config import PAGE_SIZE
+from models.models import TestResult, TestResultDaily, TestCase, TestGroup, TestRun
+from dependencies import get_db, get_async_db, get_async_session_factory
+from config.config import PAGE_SIZE, PROGRESS_KEEPALIVE_SECONDS
 from KdbSubs import run_scheduled_test_group
+from result_writer import result_writer
+import runs
+import progress
 
 logger = logging.getLogger(__name__)
 
@@ -21,50 +28,105 @@ router = APIRouter()
 
 
 @router.get("/get_test_progress/{test_group_id}")
-async def get_test_progress(test_group_id: UUID, date: str, run_number: int, db: Session = Depends(get_db)):
-    """Fetch the number of completed tests for a test group on a specific date and run number."""
+async def get_test_progress(test_group_id: UUID, date: str, run_number: int, db: AsyncSession = Depends(get_async_db)):
+    """Progress of a test group's run on a specific date, read from its TestRun counters."""
     try:
         specific_date = datetime.strptime(date, '%d-%m-%Y').date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
 
-    completed_tests = db.query(TestResult).filter(
-        TestResult.group_id == test_group_id.bytes,
-        TestResult.date_run == specific_date,
-        TestResult.run_number == run_number
-    ).count()
+    run = (await db.execute(select(
+        TestRun.status, TestRun.total_tests, TestRun.completed, TestRun.passed, TestRun.failed, TestRun.skipped
+    ).where(
+        TestRun.group_id == test_group_id.bytes,
+        TestRun.date_run == specific_date,
+        TestRun.run_number == run_number
+    ))).first()
+    if run is None:
+        return {"completed_tests": 0, "total_tests": 0, "passed": 0, "failed": 0, "skipped": 0, "status": None}
+
+    return {
+        "completed_tests": run.completed,
+        "total_tests": run.total_tests,
+        "passed": run.passed,
+        "failed": run.failed,
+        "skipped": run.skipped,
+        "status": run.status
+    }
+
+
+@router.get("/stream_test_progress/{test_group_id}")
+async def stream_test_progress(test_group_id: UUID, date: str, run_number: int,
+                               session_factory=Depends(get_async_session_factory)):
+    """
+    Server-sent events for a test group's run: the current counters, then an event per finished test
+    (test_name, pass_status, skipped, time_taken and the running completed/passed/failed/skipped counters) until the run
+    finishes. Fed by the process executing the run through progress.py; the database is only read when
+    no event has arrived for a keepalive period, to end the stream of a run that is gone or stopped.
+    """
+    try:
+        specific_date = datetime.strptime(date, '%d-%m-%Y').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
+
+    async def run_state():
+        async with session_factory() as db:
+            run = (await db.execute(select(
+                TestRun.status, TestRun.total_tests, TestRun.completed, TestRun.passed, TestRun.failed, TestRun.skipped
+            ).where(
+                TestRun.group_id == test_group_id.bytes,
+                TestRun.date_run == specific_date,
+                TestRun.run_number == run_number
+            ))).first()
+        return run._asdict() if run else None
+
+    async def event_stream():
+        key = progress.run_key(test_group_id.bytes, specific_date, run_number)
+        async for event in progress.progress_events(key, PROGRESS_KEEPALIVE_SECONDS, run_state):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event['event']}\nid: {event['seq']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
-    return {"completed_tests": completed_tests}
+
+@router.get("/get_result_writer_stats/")
+async def get_result_writer_stats():
+    """Queue depth and flush latency of this worker's result ingestion."""
+    return result_writer.stats()
 
 
 @router.get("/get_test_results_30_days/")
-async def get_test_results_30_days(group_id: Optional[UUID] = None, db: Session = Depends(get_db)):
+async def get_test_results_30_days(group_id: Optional[UUID] = None, db: AsyncSession = Depends(get_async_db)):
     logger.info("get_test_results_30_days")
     stTime = time.time()
 
     end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=29)
 
-    query = db.query(
-        TestResult.date_run,
-        func.sum(case((TestResult.pass_status == True, 1), else_=0)).label('passed'),
-        func.sum(case((TestResult.pass_status == False, 1), else_=0)).label('failed')
-    ).filter(
-        TestResult.date_run >= start_date,
-        TestResult.date_run <= end_date
+    query = select(
+        TestResultDaily.date_run,
+        func.sum(TestResultDaily.passed).label('passed'),
+        func.sum(TestResultDaily.failed).label('failed'),
+        func.sum(TestResultDaily.skipped).label('skipped')
+    ).where(
+        TestResultDaily.date_run >= start_date,
+        TestResultDaily.date_run <= end_date
     )
 
     if group_id:
-        query = query.filter(TestResult.group_id == group_id.bytes)
+        query = query.where(TestResultDaily.group_id == group_id.bytes)
 
-    results_summary = query.group_by(TestResult.date_run).all()
+    results_summary = (await db.execute(query.group_by(TestResultDaily.date_run))).all()
 
     results_data = []
     for result in results_summary:
         results_data.append({
             "date": result.date_run.strftime('%Y-%m-%d'),
             "passed": result.passed,
-            "failed": result.failed
+            "failed": result.failed,
+            "skipped": result.skipped
         })
 
     print("time taken: ", time.time() - stTime)
@@ -78,7 +140,7 @@ async def get_test_results_by_day(
     page_number: int = 1,
     sortOption: str = "",
     run_number: Optional[int] = None,  # New optional parameter
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"Get test results by day: date={date}, group_id={group_id}, run_number={run_number}")
     stTime = time.time()
@@ -88,13 +150,26 @@ async def get_test_results_by_day(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
 
-    query = db.query(TestResult, TestCase.creation_date).join(TestCase).join(TestGroup).filter(
+    # only the columns the page shows, joined once, rather than full entities and their relationships
+    query = select(
+        TestResult.id,
+        TestResult.test_case_id,
+        TestCase.test_name,
+        TestResult.time_taken,
+        TestResult.pass_status,
+        TestResult.skipped,
+        TestResult.error_message,
+        TestGroup.id.label('group_id'),
+        TestGroup.name.label('group_name'),
+        TestResult.time_run,
+        TestCase.creation_date
+    ).join(TestCase, TestResult.test_case_id == TestCase.id).join(TestGroup, TestCase.group_id == TestGroup.id).where(
         TestResult.date_run == specific_date
     )
     
-    query = query.filter(TestCase.group_id == group_id.bytes)
+    query = query.where(TestCase.group_id == group_id.bytes)
     if run_number is not None:
-        query = query.filter(TestResult.run_number == run_number)
+        query = query.where(TestResult.run_number == run_number)
 
     print("sort option: ", sortOption)
     print("page_number: ", page_number)
@@ -105,44 +180,45 @@ async def get_test_results_by_day(
     elif sortOption == 'Time Taken':
         query = query.order_by(desc(TestResult.time_taken))
 
-    total_test_results = query.count()
+    total_test_results = (await db.execute(select(func.count()).select_from(query.subquery()))).scalar()
     print("count run tests: ", total_test_results)
     total_pages_test_results = 1 + floor(total_test_results / PAGE_SIZE)
 
     query = query.offset((page_number - 1) * PAGE_SIZE).limit(PAGE_SIZE)
-    test_results = query.all()
+    test_results = (await db.execute(query)).all()
     print("timeTaken for db query (test results): ", time.time() - stTime)
     stTime = time.time()
 
     results_data = []
-    for result, creation_date in test_results:
+    for result in test_results:
         results_data.append({
             'id': result.id.hex(),
             'test_case_id': result.test_case_id.hex(),
-            'Test Name': result.test_case.test_name,
+            'Test Name': result.test_name,
             'Time Taken': result.time_taken,
             'Status': result.pass_status,
+            'Skipped': result.skipped,
             'Error Message': result.error_message,
-            'group_id': result.test_case.group.id.hex(),
-            'group_name': result.test_case.group.name,
+            'group_id': result.group_id.hex(),
+            'group_name': result.group_name,
             'time_run': result.time_run,
-            'Creation Date': creation_date
+            'Creation Date': result.creation_date
         })
 
-    run_test_case_ids = db.query(TestResult.test_case_id).join(TestCase).filter(
+    run_test_case_ids = select(TestResult.test_case_id).join(TestCase).where(
         TestResult.date_run == specific_date
     )
     if run_number is not None:
-        run_test_case_ids = run_test_case_ids.filter(TestResult.run_number == run_number)
+        run_test_case_ids = run_test_case_ids.where(TestResult.run_number == run_number)
 
-    run_test_case_ids = run_test_case_ids.filter(TestCase.group_id == group_id.bytes).distinct()
+    run_test_case_ids = run_test_case_ids.where(TestCase.group_id == group_id.bytes).distinct()
     run_test_case_ids = run_test_case_ids.subquery()
     select_run_test_case_ids = select(run_test_case_ids.c.test_case_id)
 
-    unrun_tests_count = db.query(TestCase).filter(
+    unrun_tests_count = (await db.execute(select(func.count(TestCase.id)).where(
         TestCase.group_id == group_id.bytes,
         ~TestCase.id.in_(select_run_test_case_ids)
-    ).count()
+    ))).scalar()
 
     print("count un-run tests: ", unrun_tests_count)
 
@@ -159,12 +235,18 @@ async def get_test_results_by_day(
         unrun_offset = rows_in_first_page + max(0, (page_number - total_pages_test_results - 1) * PAGE_SIZE)
 
         if unrun_limit > 0:
-            unrun_tests_query = db.query(TestCase).filter(
+            unrun_tests_query = select(
+                TestCase.id,
+                TestCase.test_name,
+                TestCase.creation_date,
+                TestGroup.id.label('group_id'),
+                TestGroup.name.label('group_name')
+            ).join(TestGroup, TestCase.group_id == TestGroup.id).where(
                 TestCase.group_id == group_id.bytes,
                 ~TestCase.id.in_(select_run_test_case_ids)
             ).offset(unrun_offset).limit(unrun_limit)
 
-            unrun_tests = unrun_tests_query.all()
+            unrun_tests = (await db.execute(unrun_tests_query)).all()
             print("timeTaken for db query (unrun tests): ", time.time() - stTime)
             stTime = time.time()
 
@@ -175,9 +257,10 @@ async def get_test_results_by_day(
                     'Test Name': test.test_name,
                     'Time Taken': None,
                     'Status': None,
+                    'Skipped': False,
                     'Error Message': None,
-                    'group_id': test.group.id.hex(),
-                    'group_name': test.group.name,
+                    'group_id': test.group_id.hex(),
+                    'group_name': test.group_name,
                     'time_run': None,
                     'Creation Date': test.creation_date
                 })
@@ -193,8 +276,170 @@ async def get_test_results_by_day(
     }
 
 
+# sortOption -> (sort column, tie-breaker column, descending) for get_test_results_page.
+# Each order is served by an index: ix_test_result_run_status / ix_test_result_run_time on test_result
+# and ix_test_case_group_name for name order, so a page is an index seek from the cursor.
+RESULT_SORT_KEYS = {
+    "": ("test_name", "test_case_id", False),
+    "Failed": ("pass_status", "id", False),
+    "Passed": ("pass_status", "id", True),
+    "Time Taken": ("time_taken", "id", True),
+}
+
+
+def encode_cursor(segment, key, tie_breaker):
+    payload = json.dumps([segment, key, tie_breaker.hex()])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        segment, key, tie_breaker = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return segment, key, bytes.fromhex(tie_breaker)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(query, key, tie_breaker, descending, after, page_size):
+    """Orders query by (key, tie_breaker), starts it after the cursor values and ranks the page's rows."""
+    if after is not None:
+        # typed so ids bind as the column's GUID type rather than raw bytes
+        after = tuple_(literal(after[0], key.type), literal(after[1], tie_breaker.type))
+        if descending:
+            query = query.where(tuple_(key, tie_breaker) < after)
+        else:
+            query = query.where(tuple_(key, tie_breaker) > after)
+    order = [key.desc(), tie_breaker.desc()] if descending else [key, tie_breaker]
+    page = query.order_by(*order).limit(page_size).subquery()
+
+    page_key, page_tie_breaker = page.c[key.key], page.c[tie_breaker.key]
+    page_order = [page_key.desc(), page_tie_breaker.desc()] if descending else [page_key, page_tie_breaker]
+    return select(page, func.row_number().over(order_by=page_order).label('position'))
+
+
+@router.get("/get_test_results_page/")
+async def get_test_results_page(
+    date: str,
+    group_id: UUID,
+    sortOption: str = "",
+    run_number: Optional[int] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(PAGE_SIZE, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Cursor paginated results for one run of a group: the run's results in sortOption order, followed by
+    the group's tests that have no result in that run, by name. Pass next_cursor back for the following
+    page (null on the last one). Without run_number the day's latest run is shown.
+    """
+    logger.info(f"Get test results page: date={date}, group_id={group_id}, run_number={run_number}, sort={sortOption}")
+    stTime = time.time()
+
+    try:
+        specific_date = datetime.strptime(date, '%d-%m-%Y').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
+    if sortOption not in RESULT_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Invalid sortOption, should be one of {list(RESULT_SORT_KEYS)}")
+
+    group = await db.get(TestGroup, group_id.bytes)
+    if not group:
+        raise HTTPException(status_code=404, detail="Test group not found")
+
+    if run_number is None:
+        run_number = (await db.execute(select(func.max(TestResultDaily.run_number)).where(
+            TestResultDaily.group_id == group_id.bytes,
+            TestResultDaily.date_run == specific_date
+        ))).scalar() or 0
+
+    segment, *after = decode_cursor(cursor) if cursor else (0, None, None)
+    pages = []
+
+    if segment == 0:
+        run_query = select(
+            literal(0).label('segment'),
+            TestResult.id,
+            TestCase.id.label('test_case_id'),
+            TestCase.test_name,
+            TestResult.time_taken,
+            TestResult.pass_status,
+            TestResult.skipped,
+            TestResult.error_message,
+            TestResult.time_run,
+            TestCase.creation_date
+        ).join(TestCase, TestResult.test_case_id == TestCase.id).where(
+            TestResult.date_run == specific_date,
+            TestResult.run_number == run_number
+        )
+        key_name, tie_breaker_name, descending = RESULT_SORT_KEYS[sortOption]
+        # filter the group on the table whose index drives the sort, so the planner walks that index
+        # (name order walks test_case and looks each result up by ix_test_result_case_run)
+        if key_name == "test_name":
+            run_query = run_query.where(TestCase.group_id == group_id.bytes)
+        else:
+            run_query = run_query.where(TestResult.group_id == group_id.bytes)
+        columns = run_query.selected_columns
+        pages.append(keyset_page(run_query, columns[key_name], columns[tie_breaker_name], descending,
+                                 after if cursor else None, page_size))
+
+    has_run = exists().where(
+        TestResult.test_case_id == TestCase.id,
+        TestResult.date_run == specific_date,
+        TestResult.run_number == run_number
+    )
+    unrun_query = select(
+        literal(1).label('segment'),
+        null().label('id'),
+        TestCase.id.label('test_case_id'),
+        TestCase.test_name,
+        null().label('time_taken'),
+        null().label('pass_status'),
+        literal(False).label('skipped'),
+        null().label('error_message'),
+        null().label('time_run'),
+        TestCase.creation_date
+    ).where(TestCase.group_id == group_id.bytes, ~has_run)
+    columns = unrun_query.selected_columns
+    pages.append(keyset_page(unrun_query, columns.test_name, columns.test_case_id, False,
+                             after if segment == 1 else None, page_size))
+
+    merged = union_all(*pages).subquery()
+    rows = (await db.execute(select(merged).order_by(merged.c.segment, merged.c.position).limit(page_size))).all()
+    logger.debug(f"timeTaken for db query (test results page): {time.time() - stTime}")
+
+    results_data = [{
+        'id': row.id.hex() if row.id else None,
+        'test_case_id': row.test_case_id.hex(),
+        'Test Name': row.test_name,
+        'Time Taken': row.time_taken,
+        'Status': None if row.pass_status is None else bool(row.pass_status),
+        'Skipped': bool(row.skipped),
+        'Error Message': row.error_message,
+        'group_id': group.id.hex(),
+        'group_name': group.name,
+        'time_run': row.time_run,
+        'Creation Date': row.creation_date
+    } for row in rows]
+
+    next_cursor = None
+    if len(rows) == page_size:
+        last = rows[-1]
+        if last.segment == 0:
+            key_name, tie_breaker_name, _ = RESULT_SORT_KEYS[sortOption]
+            next_cursor = encode_cursor(0, getattr(last, key_name), getattr(last, tie_breaker_name))
+        else:
+            next_cursor = encode_cursor(1, last.test_name, last.test_case_id)
+
+    return {
+        "test_data": results_data,
+        "columnList": ["Test Name", "Time Taken", "Status", "Error Message"],
+        "run_number": run_number,
+        "next_cursor": next_cursor,
+    }
+
+
 @router.get("/get_test_result_summary/")
-async def get_test_result_summary(date: str, db: Session = Depends(get_db)):
+async def get_test_result_summary(date: str, db: AsyncSession = Depends(get_async_db)):
     logger.info("get_test_result_summary")
     stTime = time.time()
     print("starting query")
@@ -205,26 +450,28 @@ async def get_test_result_summary(date: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
 
     start_query_time = time.time()
-    results_summary = db.query(
-        TestResult.group_id,
-        func.sum(case((TestResult.pass_status == True, 1), else_=0)).label('passed'),
-        func.sum(case((TestResult.pass_status == False, 1), else_=0)).label('failed')
-    ).filter(
-        TestResult.date_run == specific_date
+    results_summary = (await db.execute(select(
+        TestResultDaily.group_id,
+        func.sum(TestResultDaily.passed).label('passed'),
+        func.sum(TestResultDaily.failed).label('failed'),
+        func.sum(TestResultDaily.skipped).label('skipped')
+    ).where(
+        TestResultDaily.date_run == specific_date
     ).group_by(
-        TestResult.group_id
-    ).all()
+        TestResultDaily.group_id
+    ))).all()
     print("timeTaken for results summary query: ", time.time() - start_query_time)
 
     start_query_time = time.time()
-    test_groups = db.query(TestGroup).all()
+    test_groups = (await db.execute(select(TestGroup))).scalars().all()
     print("timeTaken for test groups query: ", time.time() - start_query_time)
 
-    summary_dict = {result.group_id: {'passed': result.passed, 'failed': result.failed} for result in results_summary}
+    summary_dict = {result.group_id: {'passed': result.passed, 'failed': result.failed, 'skipped': result.skipped}
+                    for result in results_summary}
 
     groups_data = []
     for group in test_groups:
-        group_summary = summary_dict.get(group.id, {'passed': 0, 'failed': 0})
+        group_summary = summary_dict.get(group.id, {'passed': 0, 'failed': 0, 'skipped': 0})
         groups_data.append({
             "id": group.id.hex(),
             "Name": group.name,
@@ -233,11 +480,12 @@ async def get_test_result_summary(date: str, db: Session = Depends(get_db)):
             "Scheduled": group.schedule,
             "Passed": group_summary['passed'],
             "Failed": group_summary['failed'],
+            "Skipped": group_summary['skipped'],
             "TLS": group.tls,
             "Scope": group.scope
         })
 
-    column_list = ["Name", "Machine", "Port", "Scheduled", "Passed", "Failed", "TLS"]
+    column_list = ["Name", "Machine", "Port", "Scheduled", "Passed", "Failed", "Skipped", "TLS"]
     print("Total time taken: ", time.time() - stTime)
 
     return {"groups_data": groups_data, "columnList": column_list}
@@ -247,7 +495,7 @@ async def get_test_result_summary(date: str, db: Session = Depends(get_db)):
 async def get_run_numbers_by_day(
     date: str,
     group_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"Get run numbers for date={date}, group_id={group_id}")
     try:
@@ -255,19 +503,29 @@ async def get_run_numbers_by_day(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
 
-    # Query distinct run numbers for the given date and group
-    run_numbers = db.query(TestResult.run_number).join(TestCase).filter(
-        TestResult.date_run == specific_date,
-        TestCase.group_id == group_id.bytes
-    ).distinct().order_by(TestResult.run_number).all()
-
-    # Extract run numbers from the result (returns list of tuples)
-    run_number_list = [run_number[0] for run_number in run_numbers if run_number[0] is not None]
+    group_runs = (await db.execute(select(
+        TestRun.run_number, TestRun.status, TestRun.started_at, TestRun.finished_at,
+        TestRun.total_tests, TestRun.completed, TestRun.passed, TestRun.failed, TestRun.skipped
+    ).where(
+        TestRun.date_run == specific_date,
+        TestRun.group_id == group_id.bytes
+    ).order_by(TestRun.run_number))).all()
 
     return {
         "date": date,
         "group_id": str(group_id),
-        "run_numbers": run_number_list
+        "run_numbers": [run.run_number for run in group_runs],
+        "runs": [{
+            "run_number": run.run_number,
+            "status": run.status,
+            "started_at": run.started_at.isoformat() if run.started_at else None,
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+            "total_tests": run.total_tests,
+            "completed": run.completed,
+            "passed": run.passed,
+            "failed": run.failed,
+            "skipped": run.skipped
+        } for run in group_runs]
     }
 
 
@@ -282,20 +540,15 @@ async def execute_test_group(test_group_id: UUID, background_tasks: BackgroundTa
             logger.error(f"TestGroup ID {test_group_id.hex} not found.")
             raise HTTPException(status_code=404, detail="Test group not found")
 
-        # Determine the run_number: max existing for today + 1
-        current_date = datetime.utcnow().date()
-        max_run_number = db.query(func.max(TestResult.run_number)).filter(
-            TestResult.group_id == test_group_id.bytes,
-            TestResult.date_run == current_date
-        ).scalar() or 0
-        run_number = max_run_number + 1
-
         # Get total number of tests
-        test_cases = db.query(TestCase).filter(TestCase.group_id == test_group_id.bytes).all()
-        total_tests = len(test_cases)
+        total_tests = db.query(func.count(TestCase.id)).filter(TestCase.group_id == test_group_id.bytes).scalar()
+
+        # Allocate the run before answering, so the caller can poll its progress straight away
+        current_date = datetime.utcnow().date()
+        run_id, run_number = runs.allocate_run(db.get_bind(), test_group_id.bytes, current_date, total_tests)
 
         # Run the test group in the background
-        background_tasks.add_task(run_scheduled_test_group, test_group_id)
+        background_tasks.add_task(run_scheduled_test_group, test_group_id, run_id)
 
         # Return the date, run number, and total tests
         print("response!!!!")
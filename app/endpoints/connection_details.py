@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import os
 from encryption_utils import save_credentials, load_credentials
+from KdbSubs import kdb_pool, async_kdb_pool
 
 router = APIRouter()
 
@@ -26,6 +27,9 @@ async def store_credentials(credentials: ConnectionCredentialsInput):
 
     try:
         save_credentials(credentials_data)
+        # pooled handles were authenticated with the old credentials
+        kdb_pool.clear()
+        async_kdb_pool.clear()
         return {"message": "Credentials stored securely."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,249 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from datetime import datetime
+from typing import Optional
+import asyncio
+import csv
+import io
+import json
+import logging
+from uuid import UUID
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from models.models import TestResult, TestCase, TestGroup
+from dependencies import get_async_session_factory
+from config.config import EXPORT_BATCH_ROWS
+import archive
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+EXPORT_SCHEMA = pa.schema([
+    ("date_run", pa.date32()),
+    ("time_run", pa.time64("us")),
+    ("run_number", pa.int32()),
+    ("group_id", pa.string()),
+    ("group_name", pa.string()),
+    ("test_case_id", pa.string()),
+    ("test_name", pa.string()),
+    ("id", pa.string()),
+    ("pass_status", pa.bool_()),
+    ("skipped", pa.bool_()),
+    ("time_taken", pa.float64()),
+    ("error_message", pa.string()),
+])
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+STATUS_FILTERS = {"all": None, "passed": True, "failed": False}
+ID_COLUMNS = ("group_id", "test_case_id", "id")
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file for the pyarrow writers that hands back what has been written since the last drain()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def to_record_batch(columns):
+    """Builds an export batch from a dict of column lists, ids given as raw bytes."""
+    for name in ID_COLUMNS:
+        columns[name] = [value.hex() if value is not None else None for value in columns[name]]
+    return pa.RecordBatch.from_pydict(columns, schema=EXPORT_SCHEMA)
+
+
+def json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+async def archived_batches(session_factory, start, end, group_ids, pass_status, days):
+    """Export batches of the archived days, with test and group names looked up from the database."""
+    if not days:
+        return
+    async with session_factory() as db:
+        groups = dict((await db.execute(select(TestGroup.id, TestGroup.name))).all())
+        names_query = select(TestCase.id, TestCase.test_name)
+        if group_ids:
+            names_query = names_query.where(TestCase.group_id.in_(group_ids))
+        test_names = dict((await db.execute(names_query)).all())
+
+    batches = archive.iter_result_batches(start, end, group_ids=group_ids, pass_status=pass_status,
+                                          batch_size=EXPORT_BATCH_ROWS, days=days)
+    while True:
+        # parquet decoding happens in a worker thread, one batch at a time
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            return
+        columns = batch.to_pydict()
+        columns["group_name"] = [groups.get(group_id) for group_id in columns["group_id"]]
+        columns["test_name"] = [test_names.get(test_case_id) for test_case_id in columns["test_case_id"]]
+        yield to_record_batch(columns)
+
+
+async def live_batches(session_factory, start, end, group_ids, pass_status, archived_days):
+    """
+    Export batches read from the database through a server side cursor, EXPORT_BATCH_ROWS at a time,
+    leaving out archived_days.
+    """
+    query = select(
+        TestResult.date_run,
+        TestResult.time_run,
+        TestResult.run_number,
+        TestResult.group_id,
+        TestGroup.name.label('group_name'),
+        TestResult.test_case_id,
+        TestCase.test_name,
+        TestResult.id,
+        TestResult.pass_status,
+        TestResult.skipped,
+        TestResult.time_taken,
+        TestResult.error_message
+    ).join(TestCase, TestResult.test_case_id == TestCase.id).join(TestGroup, TestResult.group_id == TestGroup.id).where(
+        TestResult.date_run >= start,
+        TestResult.date_run <= end
+    )
+    # days already in the archive are exported from there
+    if archived_days:
+        query = query.where(TestResult.date_run.notin_(archived_days))
+    if group_ids:
+        query = query.where(TestResult.group_id.in_(group_ids))
+    if pass_status is not None:
+        query = query.where(TestResult.pass_status == pass_status)
+    query = query.order_by(TestResult.date_run, TestResult.group_id, TestResult.run_number)
+
+    async with session_factory() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_ROWS))
+        async for rows in result.partitions():
+            yield to_record_batch({name: [row[i] for row in rows] for i, name in enumerate(EXPORT_SCHEMA.names)})
+
+
+async def result_batches(session_factory, start, end, group_ids, pass_status):
+    # listed once, so the archive and database reads agree on which days each of them covers
+    archived_days = archive.archived_dates(start, end)
+    async for batch in archived_batches(session_factory, start, end, group_ids, pass_status, archived_days):
+        yield batch
+    async for batch in live_batches(session_factory, start, end, group_ids, pass_status, archived_days):
+        yield batch
+
+
+# Encoding a batch is CPU bound, so each one is encoded in a worker thread rather than on the event loop
+
+async def encode_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_SCHEMA.names)
+
+    def encode(batch):
+        writer.writerows(zip(*(column.to_pylist() for column in batch.columns)))
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    async for batch in batches:
+        yield await asyncio.to_thread(encode, batch)
+    yield buffer.getvalue().encode()
+
+
+def ndjson_lines(batch):
+    return ''.join(
+        json.dumps({name: json_value(value) for name, value in row.items()}) + '\n' for row in batch.to_pylist()
+    ).encode()
+
+
+async def encode_ndjson(batches):
+    async for batch in batches:
+        yield await asyncio.to_thread(ndjson_lines, batch)
+
+
+async def encode_arrow(batches, open_writer):
+    sink = ChunkSink()
+    writer = open_writer(sink)
+
+    def encode(batch):
+        writer.write_batch(batch)
+        return sink.drain()
+
+    try:
+        async for batch in batches:
+            yield await asyncio.to_thread(encode, batch)
+    except BaseException:
+        writer.close()
+        raise
+    # closing writes the Parquet footer
+    await asyncio.to_thread(writer.close)
+    yield sink.drain()
+
+
+ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "parquet": lambda batches: encode_arrow(batches, lambda sink: pq.ParquetWriter(sink, EXPORT_SCHEMA, compression="zstd")),
+    "arrow": lambda batches: encode_arrow(batches, lambda sink: pa.ipc.new_stream(sink, EXPORT_SCHEMA)),
+}
+
+
+@router.get("/export_results/")
+async def export_results(
+    start_date: str,
+    end_date: str,
+    format: str = "csv",
+    group_ids: Optional[str] = None,
+    status: str = "all",
+    session_factory=Depends(get_async_session_factory)
+):
+    """
+    Streams every test result from start_date to end_date (DD-MM-YYYY, inclusive), archived or live, as CSV,
+    NDJSON, Parquet or an Arrow IPC stream. Optionally limited to comma separated group_ids and to passed or
+    failed results. Rows are read and encoded EXPORT_BATCH_ROWS at a time, so memory stays flat however long
+    the range is.
+    """
+    logger.info(f"export_results: {start_date} to {end_date}, format={format}, group_ids={group_ids}, status={status}")
+    try:
+        start = datetime.strptime(start_date, '%d-%m-%Y').date()
+        end = datetime.strptime(end_date, '%d-%m-%Y').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format, should be one of {list(EXPORT_FORMATS)}")
+    if status not in STATUS_FILTERS:
+        raise HTTPException(status_code=400, detail=f"Invalid status, should be one of {list(STATUS_FILTERS)}")
+    try:
+        group_id_list = [UUID(id_str).bytes for id_str in group_ids.split(',')] if group_ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid group IDs format, should be a comma-separated list of UUIDs")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    batches = result_batches(session_factory, start, end, group_id_list, STATUS_FILTERS[status])
+    filename = f"test_results_{start.isoformat()}_{end.isoformat()}.{extension}"
+    return StreamingResponse(ENCODERS[format](batches), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
@@ -7,8 +7,14 @@ from typing import List
 import logging
 from uuid import UUID
 
-from models.models import TestResult, TestCase, TestDependency
+from models.models import TestResult, TestCase, TestGroup, TestDependency
 from dependencies import get_db
+from dependency_graph import find_cycle
+import rollup
+import runs
+import bulk_import
+from date_index import rebuild_from_rollup
+from KdbSubs import sendKdbQueryAsync
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +42,22 @@ async def upsert_test_case(test_case: TestCaseUpsert, db: Session = Depends(get_
     if existing_name:
         raise HTTPException(status_code=400, detail="A test case with this name already exists")
 
+    # Reject dependencies that would make the execution graph cyclic
+    def get_prerequisites(test_ids):
+        return db.query(TestDependency.test_id, TestDependency.dependent_test_id).filter(
+            TestDependency.test_id.in_(test_ids),
+            TestDependency.test_id != test_case.id.bytes  # this test's current dependencies are being replaced
+        ).all()
+
+    cycle = find_cycle(test_case.id.bytes, [dep_id.bytes for dep_id in test_case.dependencies], get_prerequisites)
+    if cycle:
+        names = dict(db.query(TestCase.id, TestCase.test_name).filter(TestCase.id.in_(set(cycle))).all())
+        names[test_case.id.bytes] = test_case.test_name
+        raise HTTPException(
+            status_code=400,
+            detail="Dependencies would create a cycle: " + " -> ".join(names.get(test_id, test_id.hex()) for test_id in cycle)
+        )
+
     # Attempt to find an existing test case by ID
     existing_test_case = db.get(TestCase, test_case.id.bytes)
 
@@ -74,6 +96,58 @@ async def upsert_test_case(test_case: TestCaseUpsert, db: Session = Depends(get_
     return {"message": message, "id": existing_test_case.id.hex()}
 
 
+@router.post("/bulk_upsert_test_cases/{group_id}")
+async def bulk_upsert_test_cases(group_id: UUID, request: Request, db: Session = Depends(get_db)):
+    """
+    Creates or updates many test cases of a group in one transaction. The body is a JSON list of test cases
+    (as for upsert_test_case, dependencies may also be given by test name), NDJSON, or CSV with a header
+    of test_name, test_code, test_type, dependencies (';' separated) and optionally id.
+    """
+    start_time = time.time()
+    try:
+        test_cases = bulk_import.parse_test_cases(await request.body(), request.headers.get("content-type", ""))
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the test cases: {str(e)}")
+
+    try:
+        result = bulk_import.bulk_upsert(db, group_id, test_cases)
+    except bulk_import.BulkImportError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=e.errors)
+    db.commit()
+
+    logger.info(f"Time taken to bulk upsert {len(test_cases)} test cases: {time.time() - start_time}")
+    return {"message": f"{result['created']} test cases added, {result['updated']} edited", **result}
+
+
+@router.post("/discover_test_cases/{group_id}")
+async def discover_test_cases(group_id: UUID, db: Session = Depends(get_db)):
+    """
+    Adds a Functional test case for every .qsuite.tests function of the group's kdb process not already in the group.
+    Functions named like an existing test case of any group are skipped and listed under "skipped".
+    """
+    test_group = db.get(TestGroup, group_id.bytes)
+    if not test_group:
+        raise HTTPException(status_code=404, detail="TestGroup not found")
+
+    try:
+        function_names = await sendKdbQueryAsync('.qsuite.showAllTests', test_group.server, test_group.port,
+                                                 test_group.tls, test_group.scope, [])
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Kdb Error during retrieval of available q functions => {str(e)}")
+
+    test_cases, clashes = bulk_import.discover(db, group_id, function_names)
+    try:
+        result = bulk_import.bulk_upsert(db, group_id, test_cases)
+    except bulk_import.BulkImportError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=e.errors)
+    db.commit()
+    if clashes:
+        logger.info(f"Discovery for group {group_id} skipped {len(clashes)} functions named like existing test cases")
+    return {"message": f"{result['created']} test cases discovered", **result, "skipped": clashes}
+
+
 @router.delete("/delete_test_case/{test_case_id}")
 async def delete_test_case(test_case_id: UUID, db: Session = Depends(get_db)):
     logger.info(f"Deleting test case with ID: {test_case_id}")
@@ -83,8 +157,14 @@ async def delete_test_case(test_case_id: UUID, db: Session = Depends(get_db)):
     if not test_case:
         raise HTTPException(status_code=404, detail="Test case not found")
 
-    # Delete associated test results
+    # Delete associated test results, then recompute the rollup rows they contributed to
+    affected_runs = db.query(TestResult.group_id, TestResult.date_run, TestResult.run_number).filter(
+        TestResult.test_case_id == test_case_id.bytes
+    ).distinct().all()
     db.query(TestResult).filter(TestResult.test_case_id == test_case_id.bytes).delete()
+    affected_runs = [tuple(run) for run in affected_runs]
+    rollup.rebuild(db.connection(), affected_runs)
+    runs.refresh_counts(db.connection(), affected_runs)
 
     # Delete associated dependencies
     db.query(TestDependency).filter(
@@ -95,6 +175,9 @@ async def delete_test_case(test_case_id: UUID, db: Session = Depends(get_db)):
     # Delete the test case
     db.delete(test_case)
     db.commit()
+    if affected_runs:
+        # a day may have lost its last results
+        rebuild_from_rollup(db.connection())
 
     logger.info(f"Time taken to delete test case: {time.time() - start_time}")
     return {"message": "Test case deleted successfully"}
@@ -6,7 +6,7 @@ import logging
 from uuid import UUID
 
 from models.models import TestGroup
-from dependencies import get_db
+from dependencies import get_db, get_read_db
 from KdbSubs import *
 
 logger = logging.getLogger(__name__)
@@ -27,7 +27,7 @@ async def execute_q_code(request: QCodeRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="TestGroup not found")
 
     try:
-        result = sendFreeFormQuery(request.code, test_group.server, test_group.port, test_group.tls, test_group.scope)
+        result = await sendFreeFormQueryAsync(request.code, test_group.server, test_group.port, test_group.tls, test_group.scope)
         print(result)
         return result
 
@@ -39,7 +39,7 @@ async def execute_q_code(request: QCodeRequest, db: Session = Depends(get_db)):
 async def execute_q_function(
     test_name: str,
     group_id: Optional[UUID] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     logger.info("execute_q_function")
     # Query the TestGroup table to get the server, port, and tls values
@@ -49,7 +49,7 @@ async def execute_q_function(
         raise HTTPException(status_code=404, detail="TestGroup not found")
 
     try:
-        result = sendFunctionalQuery(test_name, test_group.server, test_group.port, test_group.tls, test_group.scope)
+        result = await sendFunctionalQueryAsync(test_name, test_group.server, test_group.port, test_group.tls, test_group.scope)
         print(result)
         return result
 
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select, text, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import List, Optional
 import logging
 from uuid import UUID
 
 from models.models import TestResult, TestCase, TestGroup
-from dependencies import get_db
+from dependencies import get_async_db
 from KdbSubs import *
 
 logger = logging.getLogger(__name__)
@@ -19,7 +20,7 @@ async def get_tests_by_ids(
     date: str,
     group_id: Optional[UUID] = None,
     run_number: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info("get_tests_by_ids")
     try:
@@ -35,34 +36,52 @@ async def get_tests_by_ids(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid test IDs format, should be a comma-separated list of UUIDs")
 
-    query = db.query(TestResult).join(TestCase).join(TestGroup).filter(
+    query = select(
+        TestResult.id,
+        TestResult.test_case_id,
+        TestCase.test_name,
+        TestResult.time_taken,
+        TestResult.pass_status,
+        TestResult.skipped,
+        TestResult.error_message,
+        TestGroup.id.label('group_id'),
+        TestGroup.name.label('group_name')
+    ).join(TestCase, TestResult.test_case_id == TestCase.id).join(TestGroup, TestCase.group_id == TestGroup.id).where(
         TestResult.date_run == specific_date,
         TestCase.id.in_(test_ids_list)
     )
 
     if run_number is not None:
-        query = query.filter(TestResult.run_number == run_number)
+        query = query.where(TestResult.run_number == run_number)
 
     if group_id:
-        query = query.filter(TestCase.group_id == group_id.bytes)
+        query = query.where(TestCase.group_id == group_id.bytes)
 
-    test_results = query.all()
+    test_results = (await db.execute(query)).all()
     found_test_ids = {result.test_case_id for result in test_results}
     missing_test_ids = set(test_ids_list) - found_test_ids
 
-    missing_test_cases = db.query(TestCase).filter(TestCase.id.in_(missing_test_ids)).all()
+    missing_test_cases = (await db.execute(
+        select(
+            TestCase.id,
+            TestCase.test_name,
+            TestGroup.id.label('group_id'),
+            TestGroup.name.label('group_name')
+        ).join(TestGroup, TestCase.group_id == TestGroup.id).where(TestCase.id.in_(missing_test_ids))
+    )).all()
 
     results_data = []
     for result in test_results:
         results_data.append({
             'id': result.id.hex(),
             'test_case_id': result.test_case_id.hex(),
-            'Test Name': result.test_case.test_name,
+            'Test Name': result.test_name,
             'Time Taken': result.time_taken,
             'Status': result.pass_status,
+            'Skipped': result.skipped,
             'Error Message': result.error_message,
-            'group_id': result.test_case.group.id.hex(),
-            'group_name': result.test_case.group.name
+            'group_id': result.group_id.hex(),
+            'group_name': result.group_name
         })
 
     for test in missing_test_cases:
@@ -72,9 +91,10 @@ async def get_tests_by_ids(
             'Test Name': test.test_name,
             'Time Taken': None,
             'Status': None,
+            'Skipped': False,
             'Error Message': '',
-            'group_id': test.group.id.hex(),
-            'group_name': test.group.name
+            'group_id': test.group_id.hex(),
+            'group_name': test.group_name
         })
 
     column_list = ["Test Name", "Time Taken", "Status", "Error Message"]
@@ -84,25 +104,120 @@ async def get_tests_by_ids(
         "columnList": column_list,
     }
 
+# The trigram index can only match queries of at least this many characters
+MIN_TRIGRAM_QUERY = 3
+HIGHLIGHT = ('<mark>', '</mark>')
+SNIPPET_CONTEXT = 40
+
+# Tests whose name matches come first (earliest match, then alphabetically), then the tests that only
+# match in their code by bm25. The column filters keep each pass to its own candidates, and the code
+# pass only runs when the names don't fill the page.
+FTS_NAME_HITS = """
+SELECT test_case.id, test_case.test_name, test_case.test_code
+FROM test_case_fts JOIN test_case ON test_case.search_rowid = test_case_fts.rowid
+WHERE test_case_fts MATCH :match {group_filter}
+ORDER BY instr(lower(test_case.test_name), lower(:query)), test_case.test_name
+LIMIT :limit
+"""
+FTS_CODE_HITS = """
+SELECT test_case.id, test_case.test_name, test_case.test_code
+FROM test_case_fts JOIN test_case ON test_case.search_rowid = test_case_fts.rowid
+WHERE test_case_fts MATCH :match {group_filter}
+ORDER BY test_case_fts.rank
+LIMIT :limit
+"""
+
+
+def fts_phrase(query):
+    """Quotes the query as one FTS5 phrase, which the trigram tokenizer matches as a substring anywhere."""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def like_pattern(query):
+    return '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def highlight_text(value, query, context=None):
+    """Marks the first case-insensitive occurrence of query, optionally cut down to context characters either side."""
+    if not value:
+        return value
+    position = value.lower().find(query.lower())
+    if position < 0:
+        return value[:2 * context] if context else value
+    end = position + len(query)
+    before, after = value[:position], value[end:]
+    if context:
+        before = ('...' + before[-context:]) if len(before) > context else before
+        after = (after[:context] + '...') if len(after) > context else after
+    return before + HIGHLIGHT[0] + value[position:end] + HIGHLIGHT[1] + after
+
+
+async def search_fts(db, query, limit, group_id):
+    group_filter = "AND test_case.group_id = :group_id" if group_id else ""
+    params = {"query": query, "limit": limit}
+    if group_id:
+        params["group_id"] = group_id.bytes
+
+    phrase = fts_phrase(query)
+    rows = (await db.execute(text(FTS_NAME_HITS.format(group_filter=group_filter)),
+                             {**params, "match": "{test_name} : " + phrase})).all()
+    if len(rows) < limit:
+        rows += (await db.execute(text(FTS_CODE_HITS.format(group_filter=group_filter)),
+                                  {**params, "match": f"{{test_code}} : {phrase} NOT {{test_name}} : {phrase}",
+                                   "limit": limit - len(rows)})).all()
+    return rows
+
+
+async def search_like(db, query, limit, group_id, with_code):
+    """ILIKE search, served by the pg_trgm GIN indexes on PostgreSQL and used on SQLite for very short queries."""
+    pattern = like_pattern(query)
+    matches = TestCase.test_name.ilike(pattern, escape='\\')
+    if with_code:
+        matches = or_(matches, TestCase.test_code.ilike(pattern, escape='\\'))
+    stmt = select(TestCase.id, TestCase.test_name, TestCase.test_code).where(matches)
+    if group_id:
+        stmt = stmt.where(TestCase.group_id == group_id.bytes)
+
+    # same order as the FTS search: name matches by position, then the rest by trigram similarity
+    postgres = db.get_bind().dialect.name == 'postgresql'
+    position = (func.strpos if postgres else func.instr)(func.lower(TestCase.test_name), query.lower())
+    stmt = stmt.order_by(position == 0, position)
+    if postgres:
+        stmt = stmt.order_by(func.word_similarity(query, TestCase.test_code).desc())
+    stmt = stmt.order_by(TestCase.test_name)
+    return (await db.execute(stmt.limit(limit))).all()
+
+
 @router.get("/search_tests/")
 async def search_tests(
     query: str,
     limit: int = 10,
     group_id: Optional[UUID] = None,
-    db: Session = Depends(get_db)
+    snippets: bool = False,
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """
+    Ranked search over test names and code, best matches first.
+    With snippets=true each hit also carries the name and a piece of the code with the match wrapped in <mark>.
+    """
     logger.info("search_tests")
     if not query:
         return []
 
-    query_stmt = db.query(TestCase).filter(TestCase.test_name.ilike(f'%{query}%'))
-
-    if group_id:
-        query_stmt = query_stmt.filter(TestCase.group_id == group_id.bytes)
-
-    tests = query_stmt.limit(limit).all()
+    dialect = db.get_bind().dialect.name
+    if dialect == 'sqlite' and len(query) >= MIN_TRIGRAM_QUERY:
+        tests = await search_fts(db, query, limit, group_id)
+    else:
+        # too short for the trigram index on SQLite, so only test names are scanned
+        tests = await search_like(db, query, limit, group_id, with_code=dialect != 'sqlite')
 
-    results = [{'id': test.id.hex(), 'Test Name': test.test_name} for test in tests]
+    results = []
+    for test_id, test_name, test_code in tests:
+        result = {'id': test_id.hex(), 'Test Name': test_name}
+        if snippets:
+            result['Name Highlight'] = highlight_text(test_name, query)
+            result['Code Snippet'] = highlight_text(test_code, query, context=SNIPPET_CONTEXT)
+        results.append(result)
     return results
 
 @router.get("/search_functional_tests/")
@@ -110,20 +225,20 @@ async def search_functional_tests(
     query: str,
     limit: int = 10,
     group_id: Optional[UUID] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info("search_functional_tests")
     if not query:
         return []
 
     # Query the TestGroup table to get the server, port, and tls values
-    test_group = db.query(TestGroup).filter(TestGroup.id == group_id.bytes).first()
+    test_group = await db.get(TestGroup, group_id.bytes)
 
     if not test_group:
         raise HTTPException(status_code=404, detail="TestGroup not found")
 
     try:
-        matchingTestNames = sendKdbQuery(
+        matchingTestNames = await sendKdbQueryAsync(
                 '.qsuite.showMatchingTests',
                 test_group.server,
                 test_group.port,
@@ -143,20 +258,20 @@ async def search_subscription_tests(
     query: str,
     limit: int = 10,
     group_id: Optional[UUID] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info("search_subscription_tests")
     if not query:
         return []
 
     # Query the TestGroup table to get the server, port, and tls values
-    test_group = db.query(TestGroup).filter(TestGroup.id == group_id.bytes).first()
+    test_group = await db.get(TestGroup, group_id.bytes)
 
     if not test_group:
         raise HTTPException(status_code=404, detail="TestGroup not found")
 
     try:
-        matchingTestNames = sendKdbQuery(
+        matchingTestNames = await sendKdbQueryAsync(
                 '.qsuite.showMatchingSubTests',
                 test_group.server,
                 test_group.port,
@@ -10,6 +10,9 @@ from sqlalchemy.orm import Session
 
 from models.models import TestGroup
 from dependencies import get_db
+from subscription_hub import SubscriptionHub
+from kdb_reactor import reactor
+from message_buffer import POLICIES, DROP_OLDEST, BATCH, BufferClosed
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -31,6 +34,24 @@ def make_json_serializable(data):
         return data
 
 
+def encode_message(data):
+    # Convert numpy types to Python native types (e.g., int, float)
+    return json.dumps(make_json_serializable(data))
+
+
+# an idle /live websocket is sent KEEPALIVE this often, which is also how a closed one is noticed
+KEEPALIVE_SECONDS = 1.0
+
+# one upstream kdb subscription per (group, target, sub_name, params) in this worker, shared by its /live clients
+live_hub = SubscriptionHub(encode=encode_message)
+
+
+@router.get("/live_stats/")
+async def live_stats():
+    """Shared /live subscriptions of this worker with their client and message counts, and the reactor reading them."""
+    return {"reactor": reactor.stats(), "subscriptions": live_hub.stats()}
+
+
 @router.websocket("/live")
 async def trade_sub_ws(websocket: WebSocket, db: Session = Depends(get_db)):
     # Example the client can connect with: ws://localhost:8000/live?tbl=trade&index=TSLA
@@ -66,52 +87,50 @@ async def trade_sub_ws(websocket: WebSocket, db: Session = Depends(get_db)):
         if val is not None:
             extra_params.append(val)
 
-    # Create the subscription thread with *args
-    qThread = kdbSub(sub_name, kdb_host, kdb_port, kdb_tls, kdb_scope, *extra_params)
-    qThread.start()
+    # How this client's buffer overflows if it falls behind: drop_oldest, conflate (latest row per conflate_key) or batch
+    policy = websocket.query_params.get('policy', DROP_OLDEST)
+    conflate_key = websocket.query_params.get('conflate_key', 'sym')
+    if policy not in POLICIES:
+        await websocket.send_text(f"Invalid policy: {policy}, should be one of {list(POLICIES)}")
+        await websocket.close()
+        return
 
-    keepalive_counter = 0
+    # Join (or open) the shared subscription, the handshake and subscribe call block so keep them off the event loop
+    # the target is part of the key, so re-pointing a group opens a new subscription instead of joining the old one
+    key = (group_id.hex, kdb_host, kdb_port, kdb_tls, kdb_scope, sub_name, tuple(extra_params))
+    try:
+        subscriber = await asyncio.to_thread(
+            live_hub.acquire, key, lambda: kdbSub(sub_name, kdb_host, kdb_port, kdb_tls, kdb_scope, *extra_params),
+            policy, conflate_key
+        )
+    except Exception as e:
+        await websocket.send_text(f"Kdb Error while subscribing => {e}")
+        await websocket.close()
+        return
 
     try:
         while True:
-            if qThread.stopped():
-                break
-
             try:
-                # Attempt to get data without blocking:
-                data = qThread.message_queue.get_nowait()
+                # Sleeps until a message (already JSON encoded) arrives, or a second passes without one
+                data = await subscriber.buffer.get_async(timeout=KEEPALIVE_SECONDS)
             except Empty:
-                data = None
-
-            if data:
-                # The structure of your data depends on how your Q subscription
-                # handles the sub_name + args. Let's do a generic forward:
-                try:
-                    # Convert numpy types to Python native types (e.g., int, float)
-                    print("raw data: ", data)
-                    serializable_data = make_json_serializable(data)
-                    json_data = json.dumps(serializable_data)
-                    await websocket.send_text(json_data)
-                except Exception as e:
-                    # Log any unexpected serialization errors
-                    logger.exception(f"Error serializing data: {e}")
-
-            else:
-                keepalive_counter += 1
-                if keepalive_counter >= 100:  # e.g. every ~1 second if each loop is 0.01s
-                    # Force a send that fails if the socket is closed
-                    await websocket.send_text("KEEPALIVE")
-                    keepalive_counter = 0
-
-                # Yield control back to the event loop briefly
-                await asyncio.sleep(0.01)
+                if subscriber.stopped():
+                    break
+                # Force a send that fails if the socket is closed
+                await websocket.send_text("KEEPALIVE")
+                continue
+            except BufferClosed:
+                # The kdb subscription has ended
+                break
+
+            # the batch policy hands over everything waiting, sent as one JSON array frame
+            await websocket.send_text("[" + ",".join(data) + "]" if policy == BATCH else data)
 
     except WebSocketDisconnect:
         print("WebSocket disconnected.")
     except Exception as e:
         print(f"Unhandled WebSocket error: {e}")
     finally:
-        # Clean up the subscription thread
-        qThread.stopit()
-        print("finished the stopit")
-
+        # Leave the shared subscription, the last client out stops it
+        subscriber.close()
+        logger.info(f"Client left shared subscription {key}")
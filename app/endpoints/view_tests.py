@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import List, Optional
 import logging
 from uuid import UUID
 import time
+import asyncio
 from pydantic import BaseModel
 
 from models.models import TestResult, TestCase, TestGroup, TestDependency
-from dependencies import get_db
+from dependencies import get_async_db
+import archive
 from KdbSubs import *
 
 logger = logging.getLogger(__name__)
@@ -20,7 +23,7 @@ async def get_test_info(
     date: str,
     test_id: UUID,
     test_result_id: Optional[UUID] = None,  # Make test_result_id optional
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"Fetching test info for test_id={test_id}, test_result_id={test_result_id}, date={date}")
 
@@ -31,47 +34,80 @@ async def get_test_info(
         raise HTTPException(status_code=400, detail="Invalid date format, should be DD-MM-YYYY")
 
     # Step 1: Retrieve the TestCase (required)
-    test_case = db.query(TestCase).join(TestGroup).filter(TestCase.id == test_id.bytes).first()
+    test_case = (await db.execute(select(
+        TestCase.id,
+        TestCase.test_name,
+        TestCase.test_code,
+        TestCase.creation_date,
+        TestCase.test_type,
+        TestGroup.id.label('group_id'),
+        TestGroup.name.label('group_name')
+    ).join(TestGroup, TestCase.group_id == TestGroup.id).where(TestCase.id == test_id.bytes))).first()
     if not test_case:
         raise HTTPException(status_code=404, detail="Test case not found")
 
-    # Step 2: Retrieve the TestResult (optional)
-    test_result = None
+    # Step 2: Retrieve the TestResult, the given one or else the day's latest run (optional)
+    result_query = select(TestResult.time_taken, TestResult.pass_status, TestResult.skipped, TestResult.error_message).where(
+        TestResult.date_run == specific_date,
+        TestResult.test_case_id == test_id.bytes  # Ensure it matches the test case
+    )
     if test_result_id:
-        test_result = db.query(TestResult).filter(
-            TestResult.id == test_result_id.bytes,
-            TestResult.date_run == specific_date,
-            TestResult.test_case_id == test_id.bytes  # Ensure it matches the test case
-        ).first()
-        if not test_result:
-            logger.warning(f"No test result found for test_result_id={test_result_id} on date={specific_date}")
-
-    dependencies = db.query(TestDependency).filter(TestDependency.test_id == test_case.id).all()
-
-    dependent_tests = []
-    for dep in dependencies:
-        dependent_test_case = db.query(TestCase).filter(TestCase.id == dep.dependent_test_id).first()
-        if dependent_test_case:
-            dependent_test_result = db.query(TestResult).filter(
-                TestResult.test_case_id == dependent_test_case.id,
-                TestResult.date_run == specific_date
-            ).first()
-            dependent_tests.append({
-                'test_case_id': dependent_test_case.id.hex(),
-                'Test Name': dependent_test_case.test_name,
-                'Status': dependent_test_result.pass_status if dependent_test_result else None,
-                'Error Message': dependent_test_result.error_message if dependent_test_result else None
-            })
-
-    last_30_days = datetime.utcnow() - timedelta(days=30)
-    last_30_days_results = db.query(TestResult).filter(
-        TestResult.test_case_id == test_case.id,
+        result_query = result_query.where(TestResult.id == test_result_id.bytes)
+    test_result = (await db.execute(result_query.order_by(TestResult.run_number.desc()).limit(1))).first()
+    if test_result_id and not test_result:
+        logger.warning(f"No test result found for test_result_id={test_result_id} on date={specific_date}")
+
+    # Step 3: Every dependency with its latest result of the day, in one query however many there are
+    latest_results = select(
+        TestResult.test_case_id,
+        TestResult.pass_status,
+        TestResult.skipped,
+        TestResult.error_message,
+        func.row_number().over(
+            partition_by=TestResult.test_case_id, order_by=TestResult.run_number.desc()
+        ).label('latest')
+    ).where(
+        TestResult.date_run == specific_date,
+        TestResult.test_case_id.in_(select(TestDependency.dependent_test_id).where(TestDependency.test_id == test_id.bytes))
+    ).subquery()
+    dependencies = (await db.execute(select(
+        TestCase.id,
+        TestCase.test_name,
+        latest_results.c.pass_status,
+        latest_results.c.skipped,
+        latest_results.c.error_message
+    ).select_from(TestDependency).join(
+        TestCase, TestDependency.dependent_test_id == TestCase.id
+    ).outerjoin(
+        latest_results, (latest_results.c.test_case_id == TestCase.id) & (latest_results.c.latest == 1)
+    ).where(TestDependency.test_id == test_id.bytes))).all()
+
+    dependent_tests = [{
+        'test_case_id': dep.id.hex(),
+        'Test Name': dep.test_name,
+        'Status': dep.pass_status,
+        'Skipped': bool(dep.skipped),
+        'Error Message': dep.error_message
+    } for dep in dependencies]
+
+    # Step 4: 30 day history, only the columns it is drawn from, from the database and the Parquet archive
+    today = datetime.utcnow().date()
+    last_30_days = today - timedelta(days=30)
+    history = (await db.execute(select(TestResult.date_run, TestResult.pass_status, TestResult.time_taken).where(
+        TestResult.test_case_id == test_id.bytes,
         TestResult.date_run >= last_30_days
-    ).order_by(TestResult.date_run).all()
-
-    dates = [result.date_run.strftime('%Y-%m-%d') for result in last_30_days_results]
-    statuses = [1 if result.pass_status else 0 for result in last_30_days_results]
-    time_taken = [result.time_taken for result in last_30_days_results]
+    ).order_by(TestResult.date_run, TestResult.run_number))).all()
+    archived = await asyncio.to_thread(
+        archive.read_result_rows, last_30_days, today,
+        ["date_run", "run_number", "pass_status", "time_taken"], test_case_id=test_id.bytes
+    )
+    # a day is either archived or live, unless an archive run was interrupted part way
+    live_dates = {row.date_run for row in history}
+    history = [row for row in archived if row['date_run'] not in live_dates] + [row._asdict() for row in history]
+
+    dates = [row['date_run'].strftime('%Y-%m-%d') for row in history]
+    statuses = [1 if row['pass_status'] else 0 for row in history]
+    time_taken = [row['time_taken'] for row in history]
 
     test_info = {
         'id': test_case.id.hex(),
@@ -79,8 +115,8 @@ async def get_test_info(
         'test_code': test_case.test_code,
         'creation_date': test_case.creation_date,
         'test_type': test_case.test_type,
-        'group_id': test_case.group.id.hex(),
-        'group_name': test_case.group.name,
+        'group_id': test_case.group_id.hex(),
+        'group_name': test_case.group_name,
         'dependent_tests': dependent_tests,
         'dependent_tests_columns': ["Test Name", "Status", "Error Message"],
         'last_30_days_dates': dates,
@@ -92,12 +128,14 @@ async def get_test_info(
         test_info.update({
             'time_taken': test_result.time_taken,
             'pass_status': test_result.pass_status,
+            'skipped': test_result.skipped,
             'error_message': test_result.error_message,
         })
     else:
         test_info.update({
             'time_taken': None,
             'pass_status': None,
+            'skipped': False,
             'error_message': None,
         })
 
@@ -107,21 +145,21 @@ async def get_test_info(
 async def all_functional_tests(
     limit: int = 10,
     group_id: Optional[UUID] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info("all_functional_tests")
     if group_id is None:
         raise HTTPException(status_code=400, detail="group_id is required")
 
     # Query the TestGroup table to get the server, port, and tls values
-    test_group = db.query(TestGroup).filter(TestGroup.id == group_id.bytes).first()
+    test_group = await db.get(TestGroup, group_id.bytes)
 
     if not test_group:
         raise HTTPException(status_code=404, detail="TestGroup not found")
 
-    # Call sendKdbQuery with the fetched parameters
+    # Call sendKdbQueryAsync with the fetched parameters
     try:
-        TestNames = sendKdbQuery('.qsuite.showAllTests', test_group.server, test_group.port, test_group.tls, test_group.scope, [])
+        TestNames = await sendKdbQueryAsync('.qsuite.showAllTests', test_group.server, test_group.port, test_group.tls, test_group.scope, [])
         TestNames = TestNames[:limit]
         results = [x.decode('latin') for x in TestNames]
         return {"success": True, "results": results, "message": ""}
@@ -132,21 +170,21 @@ async def all_functional_tests(
 async def all_subscription_tests(
     limit: int = 10,
     group_id: Optional[UUID] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info("all_subscription_tests")
     if group_id is None:
         raise HTTPException(status_code=400, detail="group_id is required")
 
     # Query the TestGroup table to get the server, port, and tls values
-    test_group = db.query(TestGroup).filter(TestGroup.id == group_id.bytes).first()
+    test_group = await db.get(TestGroup, group_id.bytes)
 
     if not test_group:
         raise HTTPException(status_code=404, detail="TestGroup not found")
 
-    # Call sendKdbQuery with the fetched parameters
+    # Call sendKdbQueryAsync with the fetched parameters
     try:
-        TestNames = sendKdbQuery('.qsuite.showAllSubTests', test_group.server, test_group.port, test_group.tls, test_group.scope, [])
+        TestNames = await sendKdbQueryAsync('.qsuite.showAllSubTests', test_group.server, test_group.port, test_group.tls, test_group.scope, [])
         TestNames = TestNames[:limit]
         results = [x.decode('latin') for x in TestNames]
         return {"success": True, "results": results, "message": ""}
@@ -157,18 +195,18 @@ async def all_subscription_tests(
 async def view_test_code(
     group_id: UUID,
     test_name: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info("view_test_code")
     # Query the TestGroup table to get the server, port, and tls values
-    test_group = db.query(TestGroup).filter(TestGroup.id == group_id.bytes).first()
+    test_group = await db.get(TestGroup, group_id.bytes)
 
     if not test_group:
         raise HTTPException(status_code=404, detail="TestGroup not found")
 
-    # Call sendKdbQuery with the fetched parameters
+    # Call sendKdbQueryAsync with the fetched parameters
     try:
-        test_code = sendKdbQuery('.qsuite.parseTestCode', test_group.server, test_group.port, test_group.tls, test_group.scope, test_name)
+        test_code = await sendKdbQueryAsync('.qsuite.parseTestCode', test_group.server, test_group.port, test_group.tls, test_group.scope, test_name)
         results = test_code.decode('latin')
         return {"success": True, "results": results, "message": ""}
     except Exception as e:
@@ -178,25 +216,27 @@ async def view_test_code(
 @router.get("/get_tests_per_group/")
 async def get_test_ids(
     group_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info("get_test_ids")
     stTime = time.time()
 
     # Check if the group_id is in the TestGroup table
-    test_group = db.query(TestGroup).filter(TestGroup.id == group_id.bytes).first()
+    test_group = await db.get(TestGroup, group_id.bytes)
     if not test_group:
         raise HTTPException(status_code=404, detail="TestGroup not found")
 
     try:
         # Query all test cases for the group
-        test_cases = db.query(TestCase).filter(TestCase.group_id == group_id.bytes).all()
+        test_cases = (await db.execute(select(TestCase).where(TestCase.group_id == group_id.bytes))).scalars().all()
 
         # Get all test IDs
         test_ids = [test.id for test in test_cases]
 
         # Query all dependencies for these tests in a single query
-        dependencies = db.query(TestDependency).filter(TestDependency.test_id.in_(test_ids)).all()
+        dependencies = (await db.execute(
+            select(TestDependency).where(TestDependency.test_id.in_(test_ids))
+        )).scalars().all()
 
         # Create a dictionary to store dependencies for each test
         dependency_map = {test_id: [] for test_id in test_ids}
@@ -0,0 +1,243 @@
+import asyncio
+import ssl
+import struct
+import time
+import logging
+
+from qpython import MetaData, CONVERSION_OPTIONS
+from qpython.qconnection import QConnectionException, QAuthenticationException, MessageType
+from qpython.qreader import QReader
+from qpython.qwriter import QWriter
+from qpython.qtype import QException
+
+try:
+    from qpython._pandas import PandasQReader as DefaultReader, PandasQWriter as DefaultWriter
+except ImportError:
+    DefaultReader, DefaultWriter = QReader, QWriter
+
+logger = logging.getLogger(__name__)
+
+# Responses bigger than this are decoded in a worker thread so they don't hold up the event loop
+DECODE_IN_THREAD_BYTES = 1024 * 1024
+
+
+class AsyncQConnection:
+    """
+    asyncio-native kdb+ IPC connection.
+    Speaks the same protocol as qpython's QConnection (and reuses its reader/writer for
+    the (de)serialization), but the handshake, send and receive are awaited on the event loop.
+    """
+
+    MAX_PROTOCOL_VERSION = 6
+
+    def __init__(self, host, port, username=None, password=None, timeout=None, tls_enabled=False,
+                 custom_ca=None, encoding='latin-1', **options):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.tls_enabled = tls_enabled
+        self.custom_ca = custom_ca
+        self._encoding = encoding
+        self._options = MetaData(**CONVERSION_OPTIONS.union_dict(**options))
+        self._reader = None
+        self._writer = None
+        self._protocol_version = None
+
+    def _ssl_context(self):
+        context = ssl.create_default_context()
+        if self.custom_ca:
+            context.load_verify_locations(cafile=self.custom_ca)
+        return context
+
+    async def _connect(self):
+        if self.tls_enabled:
+            connect = asyncio.open_connection(self.host, self.port, ssl=self._ssl_context(), server_hostname=self.host)
+        else:
+            connect = asyncio.open_connection(self.host, self.port)
+        self._reader, self._writer = await asyncio.wait_for(connect, self.timeout)
+
+    async def open(self):
+        if self._writer:
+            return
+        if not self.host:
+            raise QConnectionException('Host cannot be None')
+
+        credentials = ((self.username or '') + ':' + (self.password or '')).encode(self._encoding)
+        await self._connect()
+        self._writer.write(credentials + bytes([self.MAX_PROTOCOL_VERSION, 0]))
+        response = await asyncio.wait_for(self._reader.read(1), self.timeout)
+
+        if len(response) != 1:
+            # older kdb+ versions drop the connection when offered a protocol version they don't know
+            self.close()
+            await self._connect()
+            self._writer.write(credentials + b'\0')
+            response = await asyncio.wait_for(self._reader.read(1), self.timeout)
+            if len(response) != 1:
+                self.close()
+                raise QAuthenticationException('Connection denied.')
+
+        self._protocol_version = min(struct.unpack('B', response)[0], self.MAX_PROTOCOL_VERSION)
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+    def is_connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    def is_alive(self):
+        """An idle handle is only reusable if kdb hasn't closed it and nothing is left unread on it."""
+        return self.is_connected() and not self._reader.at_eof() and not self._reader._buffer
+
+    async def query(self, msg_type, query, *parameters, **options):
+        if not self.is_connected():
+            raise QConnectionException('Connection is not established.')
+
+        data = [query] + list(parameters) if parameters else query
+        writer = DefaultWriter(None, protocol_version=self._protocol_version, encoding=self._encoding)
+        self._writer.write(writer.write(data, msg_type, **self._options.union_dict(**options)))
+        await self._writer.drain()
+
+    async def receive(self, data_only=True, **options):
+        header = await asyncio.wait_for(self._reader.readexactly(8), self.timeout)
+        endianness = '<' if header[0] == 1 else '>'
+        size = struct.unpack(endianness + 'I', header[4:8])[0] + (header[3] << 32)
+        body = await asyncio.wait_for(self._reader.readexactly(size - 8), self.timeout)
+
+        if size > DECODE_IN_THREAD_BYTES:
+            message = await asyncio.to_thread(self._decode, header + body, **options)
+        else:
+            message = self._decode(header + body, **options)
+        return message.data if data_only else message
+
+    def _decode(self, raw, **options):
+        reader = DefaultReader(None, encoding=self._encoding)
+        return reader.read(raw, **self._options.union_dict(**options))
+
+    async def sendSync(self, query, *parameters, **options):
+        await self.query(MessageType.SYNC, query, *parameters, **options)
+        response = await self.receive(data_only=False, **options)
+        if response.type != MessageType.RESPONSE:
+            raise QConnectionException(f"Received message of type {response.type} where response was expected")
+        return response.data
+
+
+class _AsyncPooled:
+    def __init__(self, conn, generation=0):
+        self.conn = conn
+        self.generation = generation
+        self.time_opened = time.time()
+        self.last_used = self.time_opened
+
+
+class AsyncKdbConnectionPool:
+    """
+    Per-event-loop pool of AsyncQConnections keyed by (host, port, tls, scope).
+    Mirrors KdbConnectionPool: max size per target, idle/age eviction, liveness check on
+    checkout and a single reconnect if the request can't be written to a stale handle.
+    """
+
+    def __init__(self, connect, max_size=4, idle_timeout=5 * 60, max_age=60 * 60):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self._loop = None
+        self._idle = {}
+        self._slots = {}
+        # bumped by clear(), as in KdbConnectionPool
+        self._generation = 0
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # streams belong to the loop that opened them, so start afresh on a new loop
+            for entries in self._idle.values():
+                for entry in entries:
+                    entry.conn.close()
+            self._loop = loop
+            self._idle = {}
+            self._slots = {}
+
+    def _expired(self, entry, now):
+        return (entry.generation != self._generation or now - entry.last_used > self.idle_timeout
+                or now - entry.time_opened > self.max_age)
+
+    async def _checkout(self, key, timeout):
+        host, port, tls, scope = key
+        idle = self._idle.setdefault(key, [])
+        now = time.time()
+        while idle:
+            entry = idle.pop()
+            if self._expired(entry, now) or not entry.conn.is_alive():
+                entry.conn.close()
+                continue
+            entry.conn.timeout = timeout
+            return entry
+
+        generation = self._generation
+        conn = self._connect(host, port, tls, timeout, scope)
+        await conn.open()
+        return _AsyncPooled(conn, generation)
+
+    def _checkin(self, key, entry, broken):
+        if broken or entry.generation != self._generation or not entry.conn.is_connected():
+            entry.conn.close()
+            return
+        entry.last_used = time.time()
+        self._idle.setdefault(key, []).append(entry)
+
+    async def send_sync(self, host, port, tls, timeout, scope, query, *args):
+        self._bind_loop()
+        key = (host, port, tls, scope)
+        slots = self._slots.setdefault(key, asyncio.Semaphore(self.max_size))
+
+        async with slots:
+            for attempt in range(2):
+                entry = await self._checkout(key, timeout)
+                try:
+                    await entry.conn.query(MessageType.SYNC, query, *args)
+                except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError, QConnectionException) as e:
+                    self._checkin(key, entry, broken=True)
+                    if attempt == 1:
+                        raise
+                    logger.info(f"Reconnecting to kdb {host}:{port} after broken connection: {e}")
+                    continue
+                except BaseException:
+                    self._checkin(key, entry, broken=True)
+                    raise
+
+                broken = True
+                try:
+                    response = await entry.conn.receive(data_only=False)
+                    if response.type != MessageType.RESPONSE:
+                        raise QConnectionException(f"Received message of type {response.type} where response was expected")
+                    broken = False
+                    return response.data
+                except QException:
+                    # a q error is a complete response, the handle is still in sync
+                    broken = False
+                    raise
+                finally:
+                    self._checkin(key, entry, broken)
+
+    async def check(self, host, port, tls, timeout, scope=""):
+        """Checks out a live handle (opening one if needed) and hands it straight back."""
+        self._bind_loop()
+        key = (host, port, tls, scope)
+        async with self._slots.setdefault(key, asyncio.Semaphore(self.max_size)):
+            entry = await self._checkout(key, timeout)
+            self._checkin(key, entry, broken=False)
+
+    def clear(self):
+        """Closes the idle handles; those in use are closed when they are checked back in."""
+        self._generation += 1
+        for entries in self._idle.values():
+            for entry in entries:
+                entry.conn.close()
+        self._idle = {}
@@ -0,0 +1,251 @@
+import select
+import socket
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+from qpython.qconnection import QConnectionException, MessageType
+from qpython.qtype import QException
+
+logger = logging.getLogger(__name__)
+
+# Errors raised while writing a request which mean the handle died while idle in the pool.
+# The query never reached kdb, so it is safe to reconnect and send it again.
+RECONNECT_ERRORS = (BrokenPipeError, ConnectionResetError, ConnectionAbortedError, QConnectionException)
+
+
+class PooledConnection:
+    """A QConnection plus the bookkeeping the pool needs to age and evict it."""
+
+    def __init__(self, conn, generation=0):
+        self.conn = conn
+        self.generation = generation  # the pool's generation when the handle was opened, see clear()
+        self.time_opened = time.time()
+        self.last_used = self.time_opened
+
+    def is_alive(self):
+        """
+        Cheap liveness check before checkout.
+        An idle kdb handle should never have unread data, so a readable socket means
+        either the peer closed it (recv returns b'') or the stream is out of sync.
+        """
+        sock = self.conn._connection
+        if sock is None:
+            return False
+        try:
+            if getattr(sock, "pending", None) and sock.pending():
+                return False
+            readable, _, _ = select.select([sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError, socket.error):
+            return False
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class _TargetPool:
+    def __init__(self):
+        self.idle = deque()
+        self.size = 0  # idle + checked out
+        self.available = threading.Condition()
+
+
+class KdbConnectionPool:
+    """
+    Thread-safe pool of open kdb+ handles keyed by (host, port, tls, scope).
+
+    Handles stay open between queries and are reused, so only the first query against
+    a target (or one after eviction) pays for the TCP + TLS + auth handshake.
+    """
+
+    def __init__(self, connect, max_size=4, idle_timeout=5 * 60, max_age=60 * 60, checkout_timeout=30):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.checkout_timeout = checkout_timeout
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        # bumped by clear(), handles opened before then are closed instead of being reused
+        self._generation = 0
+        self.handshakes = 0
+
+    def _target(self, key):
+        with self._lock:
+            target = self._targets.get(key)
+            if target is None:
+                target = _TargetPool()
+                self._targets[key] = target
+            return target
+
+    def _expired(self, entry, now):
+        return (entry.generation != self._generation or now - entry.last_used > self.idle_timeout
+                or now - entry.time_opened > self.max_age)
+
+    def _open(self, host, port, tls, timeout, scope):
+        # taken before the handshake, so a clear() while it is in progress retires this handle too
+        generation = self._generation
+        q = self._connect(host, port, tls, timeout, scope)
+        q.open()
+        with self._lock:
+            self.handshakes += 1
+        return PooledConnection(q, generation)
+
+    def checkout(self, host, port, tls, timeout, scope=""):
+        key = (host, port, tls, scope)
+        with self._lock:
+            sweep = time.time() - self._last_sweep > self.idle_timeout
+            if sweep:
+                self._last_sweep = time.time()
+        if sweep:
+            self.evict_idle()
+
+        target = self._target(key)
+        deadline = time.time() + self.checkout_timeout
+
+        with target.available:
+            while True:
+                now = time.time()
+                while target.idle:
+                    entry = target.idle.pop()  # most recently used first, keeps the hot set small
+                    if self._expired(entry, now) or not entry.is_alive():
+                        entry.close()
+                        target.size -= 1
+                        continue
+                    entry.conn.timeout = timeout
+                    entry.conn._connection.settimeout(timeout)
+                    return key, entry
+
+                if target.size < self.max_size:
+                    target.size += 1
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise TimeoutError(f"Timed out waiting for a free kdb connection to {host}:{port}")
+                target.available.wait(remaining)
+
+        # Open outside the condition so a slow handshake doesn't block other checkouts
+        try:
+            return key, self._open(host, port, tls, timeout, scope)
+        except Exception:
+            self._release_slot(target)
+            raise
+
+    def checkin(self, key, entry, broken=False):
+        target = self._target(key)
+        if broken or entry.generation != self._generation or not entry.conn.is_connected():
+            entry.close()
+            self._release_slot(target)
+            return
+
+        entry.last_used = time.time()
+        with target.available:
+            target.idle.append(entry)
+            target.available.notify()
+
+    def _release_slot(self, target):
+        with target.available:
+            target.size -= 1
+            target.available.notify()
+
+    @contextmanager
+    def connection(self, host, port, tls, timeout, scope=""):
+        """Check a live handle out of the pool, returning it (or discarding it if broken) afterwards."""
+        key, entry = self.checkout(host, port, tls, timeout, scope)
+        broken = False
+        try:
+            yield entry.conn
+        except Exception as e:
+            # A q error (QException) is a complete response, anything else leaves the stream unusable
+            broken = not _is_q_error(e)
+            raise
+        finally:
+            self.checkin(key, entry, broken)
+
+    def send_sync(self, host, port, tls, timeout, scope, query, *args):
+        """
+        sendSync over a pooled handle.
+        If the request can't be written because the handle went stale, reconnect once and resend.
+        """
+        for attempt in range(2):
+            key, entry = self.checkout(host, port, tls, timeout, scope)
+            try:
+                entry.conn.query(MessageType.SYNC, query, *args)
+            except RECONNECT_ERRORS as e:
+                self.checkin(key, entry, broken=True)
+                if attempt == 1:
+                    raise
+                logger.info(f"Reconnecting to kdb {host}:{port} after broken connection: {e}")
+                continue
+            except Exception:
+                self.checkin(key, entry, broken=True)
+                raise
+
+            broken = False
+            try:
+                response = entry.conn.receive(data_only=False)
+                if response.type != MessageType.RESPONSE:
+                    broken = True
+                    raise QConnectionException(f"Received message of type {response.type} where response was expected")
+                return response.data
+            except Exception as e:
+                broken = broken or not _is_q_error(e)
+                raise
+            finally:
+                self.checkin(key, entry, broken)
+
+    def evict_idle(self):
+        """Close handles that have sat idle past idle_timeout or are older than max_age."""
+        now = time.time()
+        with self._lock:
+            targets = list(self._targets.values())
+        for target in targets:
+            with target.available:
+                keep = deque()
+                while target.idle:
+                    entry = target.idle.popleft()
+                    if self._expired(entry, now):
+                        entry.close()
+                        target.size -= 1
+                    else:
+                        keep.append(entry)
+                target.idle = keep
+                target.available.notify_all()
+
+    def clear(self):
+        """
+        Close every idle handle, e.g. after the stored kdb credentials change. Handles checked out at the
+        time are closed when they are checked back in.
+        """
+        with self._lock:
+            self._generation += 1
+            targets = list(self._targets.values())
+        for target in targets:
+            with target.available:
+                while target.idle:
+                    target.idle.pop().close()
+                    target.size -= 1
+                target.available.notify_all()
+
+    def stats(self):
+        with self._lock:
+            items = list(self._targets.items())
+        return {
+            "handshakes": self.handshakes,
+            "targets": {
+                f"{host}:{port}": {"open": target.size, "idle": len(target.idle)}
+                for (host, port, tls, scope), target in items
+            },
+        }
+
+
+def _is_q_error(e):
+    return isinstance(e, QException)
@@ -0,0 +1,231 @@
+import logging
+import selectors
+import socket
+import ssl
+import struct
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+HEADER_SIZE = 8
+RECV_SIZE = 64 * 1024
+# reads per socket per turn of the loop, so a tickerplant publishing faster than it can be decoded still
+# leaves room for the other subscriptions and for register/unregister
+READS_PER_TURN = 4
+
+
+class FrameBuffer:
+    """Splits the bytes read off a kdb+ IPC socket into complete messages (8 byte header included)."""
+
+    def __init__(self):
+        self._data = bytearray()
+
+    def feed(self, data):
+        """Adds data and returns the messages it completed, keeping any partial message for the next feed."""
+        self._data += data
+        frames = []
+        while len(self._data) >= HEADER_SIZE:
+            endianness = '<' if self._data[0] == 1 else '>'
+            size = struct.unpack_from(endianness + 'I', self._data, 4)[0] + (self._data[3] << 32)
+            if size < HEADER_SIZE:
+                raise ValueError(f"Invalid kdb+ message size {size}")
+            if len(self._data) < size:
+                break
+            frames.append(bytes(self._data[:size]))
+            del self._data[:size]
+        return frames
+
+
+def take_buffered(sock, sock_file):
+    """
+    Switches sock to non-blocking and returns whatever qpython's buffered reader already pulled off it
+    during the handshake, so the reactor starts from the first unread byte.
+    """
+    sock.setblocking(False)
+    try:
+        pending = sock_file.peek(RECV_SIZE)
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return b''
+    return sock_file.read(len(pending)) if pending else b''
+
+
+class _Registration:
+    def __init__(self, sock, on_frame, on_closed):
+        self.sock = sock
+        self.on_frame = on_frame
+        self.on_closed = on_closed
+        self.frames = FrameBuffer()
+
+
+class KdbReactor:
+    """
+    A single thread per process that waits on every kdb subscription socket through one selector
+    (epoll on Linux) and hands each complete message to its subscription's on_frame. Reads are
+    non-blocking, at most READS_PER_TURN per socket before the selector is polled again, and partial
+    messages are kept per socket, so one slow or chatty tickerplant can't hold up the others, and adding
+    subscriptions adds no threads. register() and unregister() may be called from any thread; the work
+    is done on the reactor thread, woken through a socketpair. If the loop itself fails, every
+    subscription is closed with the error rather than silently left unread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._registrations = {}
+        # registrations with decrypted TLS data the selector can't see, read again without waiting
+        self._ready = set()
+        self._selector = None
+        self._thread = None
+        self._wakeup_r = self._wakeup_w = None
+        self.frames = 0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            # left behind if the thread died without getting to _fail
+            for resource in (self._selector, self._wakeup_r, self._wakeup_w):
+                if resource is not None:
+                    resource.close()
+            self._selector = selectors.DefaultSelector()
+            self._wakeup_r, self._wakeup_w = socket.socketpair()
+            self._wakeup_r.setblocking(False)
+            self._wakeup_w.setblocking(False)
+            self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+            self._thread = threading.Thread(target=self._run, name="kdb-reactor", daemon=True)
+            self._thread.start()
+
+    def _submit(self, operation):
+        with self._lock:
+            self._ensure_started()
+            self._pending.append(operation)
+            try:
+                self._wakeup_w.send(b'\0')
+            except BlockingIOError:
+                pass  # already plenty of wakeups queued
+
+    def register(self, sock, on_frame, on_closed, buffered=b''):
+        """
+        Starts delivering sock's messages to on_frame(bytes), starting with any already buffered bytes.
+        on_closed(error) is called once, on the reactor thread, after the socket is unregistered or fails.
+        """
+        self._submit(("register", sock, on_frame, on_closed, buffered))
+
+    def unregister(self, sock):
+        self._submit(("unregister", sock))
+
+    def _register(self, sock, on_frame, on_closed, buffered):
+        registration = _Registration(sock, on_frame, on_closed)
+        self._registrations[sock] = registration
+        try:
+            self._selector.register(sock, selectors.EVENT_READ, registration)
+            if buffered:
+                self._dispatch(registration, buffered)
+        except Exception as e:
+            self._close(sock, e)
+
+    def _close(self, sock, error):
+        registration = self._registrations.pop(sock, None)
+        if registration is None:
+            return
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            registration.on_closed(error)
+        except Exception as e:
+            logger.exception(f"Error closing kdb subscription: {e}")
+
+    def _dispatch(self, registration, data):
+        for frame in registration.frames.feed(data):
+            self.frames += 1
+            registration.on_frame(frame)
+
+    def _read(self, registration):
+        sock = registration.sock
+        try:
+            for _ in range(READS_PER_TURN):
+                try:
+                    data = sock.recv(RECV_SIZE)
+                except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                    return
+                if not data:
+                    raise ConnectionError("Connection closed by kdb+")
+                self._dispatch(registration, data)
+            # more may be waiting; the level-triggered selector reports the socket again, except for
+            # records TLS has already decrypted
+            if isinstance(sock, ssl.SSLSocket) and sock.pending():
+                self._ready.add(registration)
+        except Exception as e:
+            logger.warning(f"kdb subscription socket failed: {e}")
+            self._close(sock, e)
+
+    def _run(self):
+        selector = self._selector
+        try:
+            while True:
+                ready, self._ready = self._ready, set()
+                for key, _ in selector.select(0 if ready else None):
+                    if key.data is None:
+                        self._drain_wakeups()
+                    else:
+                        ready.add(key.data)
+                for registration in ready:
+                    if self._registrations.get(registration.sock) is registration:
+                        self._read(registration)
+        except Exception as e:
+            logger.exception(f"kdb reactor failed, closing its {len(self._registrations)} subscriptions: {e}")
+            self._fail(e)
+
+    def _fail(self, error):
+        """Ends every subscription, so readers and the hub see them stop, and lets the next register() start afresh."""
+        with self._lock:
+            registrations, self._registrations = self._registrations, {}
+            pending, self._pending = self._pending, deque()
+            resources = (self._selector, self._wakeup_r, self._wakeup_w)
+            # dropped under the lock, so _submit never writes to the wakeup socket once it is closed
+            self._selector = self._wakeup_r = self._wakeup_w = None
+            self._thread = None
+            self._ready = set()
+        on_closed = [registration.on_closed for registration in registrations.values()]
+        # subscriptions that were waiting to be registered have ended too
+        on_closed += [operation[3] for operation in pending if operation[0] == "register"]
+        for callback in on_closed:
+            try:
+                callback(error)
+            except Exception as e:
+                logger.exception(f"Error closing kdb subscription: {e}")
+        for resource in resources:
+            try:
+                resource.close()
+            except Exception:
+                pass
+
+    def _drain_wakeups(self):
+        try:
+            while self._wakeup_r.recv(RECV_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                operation = self._pending.popleft()
+            try:
+                if operation[0] == "register":
+                    self._register(*operation[1:])
+                else:
+                    self._close(operation[1], None)
+            except Exception as e:
+                logger.exception(f"Error in kdb reactor operation: {e}")
+
+    def stats(self):
+        return {
+            "subscriptions": len(self._registrations),
+            "threads": 1 if self._thread is not None and self._thread.is_alive() else 0,
+            "frames": self.frames,
+        }
+
+
+reactor = KdbReactor()
@@ -7,7 +7,8 @@ from config.config import BASE_DIR
 import logging
 from logging.handlers import TimedRotatingFileHandler
 from models.models import engine, Base
-from endpoints import view_dates, modify_test_cases, add_view_test_results, add_view_test_groups, search_tests, view_tests, run_q_code, connection_details, subscriptions
+from migrations import run_migrations
+from endpoints import view_dates, modify_test_cases, add_view_test_results, add_view_test_groups, search_tests, view_tests, run_q_code, connection_details, subscriptions, export_results
 #import secure
 from dependencies import PermissionsValidator, validate_token
 from encryption_utils import generate_key
@@ -52,11 +53,12 @@ async def lifespan(app: FastAPI):
     with lock:
         logging.info("Acquiring lock for database initialization...")
         Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
         logging.info("Database initialized successfully.")
 
-    from endpoints.view_dates import initialize_cache
-    logging.info("Initializing cache...")
-    initialize_cache()
+        from endpoints.view_dates import initialize_cache
+        logging.info("Initializing cache...")
+        initialize_cache()
 
     secret_key_path = os.path.join(BASE_DIR, "secrets/secret.key")
     if not os.path.exists(secret_key_path):
@@ -106,6 +108,7 @@ if OAUTH_ACTIVE:
     app.include_router(run_q_code.router, dependencies=[Depends(PermissionsValidator(["read:test_data"]))])
     app.include_router(connection_details.router, dependencies=[Depends(PermissionsValidator(["read:test_data"]))])
     app.include_router(subscriptions.router, dependencies=[Depends(PermissionsValidator(["read:test_data"]))])
+    app.include_router(export_results.router, dependencies=[Depends(PermissionsValidator(["read:test_data"]))])
 else:
     app.include_router(view_dates.router)
     app.include_router(modify_test_cases.router)
@@ -116,3 +119,4 @@ else:
     app.include_router(run_q_code.router)
     app.include_router(connection_details.router)
     app.include_router(subscriptions.router)
+    app.include_router(export_results.router)
@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from queue import Empty
+
+DROP_OLDEST = "drop_oldest"
+CONFLATE = "conflate"
+BATCH = "batch"
+POLICIES = (DROP_OLDEST, CONFLATE, BATCH)
+
+
+class BufferClosed(Exception):
+    """Raised by get() once the buffer is closed and everything put before that has been taken."""
+
+
+class MessageBuffer:
+    """
+    Bounded, thread safe buffer between a kdb subscription and one reader, so a reader that falls behind
+    costs at most maxsize messages. What happens once it is full depends on the policy:
+
+    drop_oldest  the oldest message is dropped to make room.
+    conflate     a message put with a key replaces the waiting message with the same key (keeping its place
+                 in line), e.g. only the latest quote per sym is delivered; unkeyed messages as drop_oldest.
+    batch        get() returns everything waiting as one list, so a slow reader sends fewer, larger frames;
+                 the oldest message is dropped when full.
+
+    The counters (received, delivered, dropped, conflated) measure what each policy saved or lost.
+
+    Readers block in get() or await get_async() and are woken by put() or close(), from whichever thread
+    those run on, rather than polling.
+    """
+
+    def __init__(self, maxsize, policy=DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid buffer policy {policy}, should be one of {list(POLICIES)}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = OrderedDict()
+        self._sequence = itertools.count()
+        self._not_empty = threading.Condition()
+        # (loop, future) of the asyncio readers waiting in get_async()
+        self._waiters = []
+        self.closed = False
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.conflated = 0
+
+    def put(self, item, key=None):
+        with self._not_empty:
+            if self.closed:
+                return
+            self.received += 1
+            if self.policy == CONFLATE and key is not None:
+                key = ("key", key)
+                if key in self._items:
+                    self._items[key] = item
+                    self.conflated += 1
+                    return
+            else:
+                key = ("seq", next(self._sequence))
+            if len(self._items) >= self.maxsize:
+                self._items.popitem(last=False)
+                self.dropped += 1
+            self._items[key] = item
+            self._wake()
+
+    def close(self):
+        """No more messages will be put; readers drain what is left and then get BufferClosed."""
+        with self._not_empty:
+            self.closed = True
+            self._wake()
+
+    def _wake(self):
+        self._not_empty.notify_all()
+        for loop, future in self._waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # the reader's event loop has been closed
+        self._waiters = []
+
+    def get_nowait(self):
+        """The next message (a list of messages for the batch policy), raising queue.Empty if there is none."""
+        with self._not_empty:
+            if not self._items:
+                if self.closed:
+                    raise BufferClosed
+                raise Empty
+            return self._take()
+
+    def get(self, timeout=None):
+        """Blocking get_nowait(), raising queue.Empty after timeout seconds without a message."""
+        with self._not_empty:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items:
+                if self.closed:
+                    raise BufferClosed
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise Empty
+                self._not_empty.wait(remaining)
+            return self._take()
+
+    async def get_async(self, timeout=None):
+        """get() for a coroutine: the event loop is free until a message arrives, the buffer closes or timeout passes."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._not_empty:
+                if self._items:
+                    return self._take()
+                if self.closed:
+                    raise BufferClosed
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            remaining = None if deadline is None else deadline - loop.time()
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                with self._not_empty:
+                    if not self._items and not self.closed:
+                        raise Empty
+            finally:
+                with self._not_empty:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+
+    def _take(self):
+        if self.policy == BATCH:
+            items = list(self._items.values())
+            self._items.clear()
+            self.delivered += len(items)
+            return items
+        _, item = self._items.popitem(last=False)
+        self.delivered += 1
+        return item
+
+    def qsize(self):
+        with self._not_empty:
+            return len(self._items)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def stats(self):
+        with self._not_empty:
+            return {
+                "policy": self.policy,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "received": self.received,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "conflated": self.conflated,
+            }
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
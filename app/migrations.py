@@ -0,0 +1,159 @@
+import logging
+from datetime import datetime, date
+
+from sqlalchemy import inspect, text, select, func, update, and_
+from sqlalchemy.schema import CreateColumn
+
+from models.models import Base, SchemaVersion, TestResult, create_search_index, rebuild_search_index, drop_search_index
+from config.config import RESULT_PARTITION_MONTHS_AHEAD
+import rollup
+import runs
+
+logger = logging.getLogger(__name__)
+
+
+def add_column(connection, table_name, column_name):
+    """Adds a model column an existing table is missing. The column must be nullable or carry a server_default."""
+    existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = Base.metadata.tables[table_name].c[column_name]
+    # the dialect renders the name, type, quoted server default and NULL / NOT NULL as create_all would
+    connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}"))
+
+
+def create_index(connection, table_name, index_name):
+    """Creates a model index an existing table is missing (create_all only adds indexes alongside new tables)."""
+    index = next(index for index in Base.metadata.tables[table_name].indexes if index.name == index_name)
+    index.create(connection, checkfirst=True)
+
+
+def add_parallelism(connection):
+    add_column(connection, 'test_group', 'parallelism')
+
+
+def backfill_daily_rollup(connection):
+    rollup.backfill(connection)
+
+
+def add_composite_indexes(connection):
+    create_index(connection, 'test_case', 'ix_test_case_group_name')
+    create_index(connection, 'test_result', 'ix_test_result_run_status')
+    create_index(connection, 'test_result', 'ix_test_result_run_time')
+    create_index(connection, 'test_result', 'ix_test_result_case_run')
+    create_index(connection, 'test_dependency', 'ix_test_dependency_test_id')
+    create_index(connection, 'test_dependency', 'ix_test_dependency_dependent_test_id')
+
+
+def add_search_rowid(connection):
+    add_column(connection, 'test_case', 'search_rowid')
+    if connection.dialect.name == 'sqlite':
+        # existing rows keep their current rowid as their key, new rows get max + 1 from the insert trigger
+        connection.execute(text("UPDATE test_case SET search_rowid = rowid WHERE search_rowid IS NULL"))
+    create_index(connection, 'test_case', 'ix_test_case_search_rowid')
+
+
+def add_search_index(connection):
+    # the index is keyed on search_rowid (migration 6), which a database this old doesn't have yet
+    add_search_rowid(connection)
+    create_search_index(connection)
+    rebuild_search_index(connection)
+
+
+def key_search_index_on_search_rowid(connection):
+    add_search_rowid(connection)
+    drop_search_index(connection)
+    create_search_index(connection)
+    rebuild_search_index(connection)
+
+
+def backfill_test_runs(connection):
+    runs.backfill(connection)
+
+
+def add_skipped_results(connection):
+    add_column(connection, 'test_result', 'skipped')
+    add_column(connection, 'test_result_daily', 'skipped')
+    add_column(connection, 'test_run', 'skipped')
+    # skipped tests were told apart only by their error message (KdbSubs.SKIPPED_PREFIX) and counted as failures
+    was_skipped = and_(TestResult.pass_status == False, TestResult.skipped == False,
+                       TestResult.error_message.startswith("Skipped - "))
+    keys = [tuple(key) for key in connection.execute(
+        select(TestResult.group_id, TestResult.date_run, TestResult.run_number).where(was_skipped).distinct()
+    )]
+    if not keys:
+        return
+    connection.execute(update(TestResult).where(was_skipped).values(skipped=True))
+    rollup.rebuild(connection, keys)
+    runs.refresh_counts(connection, keys)
+
+
+# (version, description, migration). Append new versions, never renumber or reorder them, and put schema
+# changes in a new migration rather than an old one. Migrations build on the current models, so an old one
+# may be adjusted to keep running against them (e.g. 4 adds search_rowid, which today's search index needs)
+# as long as running them all still ends in the same schema. Each migration is idempotent, so a database
+# created fresh by create_all can run them all harmlessly.
+MIGRATIONS = [
+    (1, "test_group.parallelism", add_parallelism),
+    (2, "backfill test_result_daily", backfill_daily_rollup),
+    (3, "composite indexes for result, test case and dependency lookups", add_composite_indexes),
+    (4, "full text search index over test names and code", add_search_index),
+    (5, "test_run rows for runs recorded before the table existed", backfill_test_runs),
+    (6, "search index keyed on test_case.search_rowid instead of rowid", key_search_index_on_search_rowid),
+    (7, "skipped state for results of tests that weren't run", add_skipped_results),
+]
+
+
+def add_months(month_start, months):
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def ensure_result_partitions(connection, first_month=None, months_ahead=RESULT_PARTITION_MONTHS_AHEAD):
+    """
+    Creates the monthly test_result partitions (PostgreSQL only) from first_month (default: this month)
+    until months_ahead months from now. Existing partitions are left alone.
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+    this_month = datetime.utcnow().date().replace(day=1)
+    month = (first_month or this_month).replace(day=1)
+    last_month = add_months(this_month, months_ahead)
+    while month <= last_month:
+        next_month = add_months(month, 1)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS test_result_{month:%Y_%m} PARTITION OF test_result "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        ))
+        month = next_month
+
+
+def current_version(connection):
+    return connection.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+
+def run_migrations(engine):
+    """
+    Brings the database up to the latest schema version, one transaction per migration, and makes sure
+    the upcoming test_result partitions exist on PostgreSQL.
+    Run at startup after create_all, under the same FileLock so only one worker migrates.
+    """
+    with engine.connect() as connection:
+        version = current_version(connection)
+
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        logger.info(f"Applying schema migration {migration_version}: {description}")
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(SchemaVersion.__table__.insert().values(
+                version=migration_version, description=description, applied_at=datetime.utcnow()
+            ))
+        version = migration_version
+
+    with engine.begin() as connection:
+        ensure_result_partitions(connection)
+
+    logger.info(f"Database schema at version {version}")
+    return version
@@ -1,55 +1,274 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import create_engine, Column, String, Text, Integer, DateTime, Boolean, ForeignKey, Date, Time, Float
-from sqlalchemy.dialects.sqlite import BLOB  # SQLite doesn't have a native UUID type, so we use BLOB to store it
+from sqlalchemy import create_engine, event, text, Column, String, Text, Integer, DateTime, Boolean, ForeignKey, Date, Time, Float, Index, UniqueConstraint, DDL, false
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.dialects.sqlite import BLOB
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from config.config import SQLALCHEMY_DATABASE_URI
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from config.config import (SQLALCHEMY_DATABASE_URI, ASYNC_SQLALCHEMY_DATABASE_URI, IS_SQLITE, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+                           SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URI, connect_args={"check_same_thread": False})
+
+def set_sqlite_pragmas(dbapi_connection, read_only=False):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    if read_only:
+        cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+def make_engine(read_only=False, uri=SQLALCHEMY_DATABASE_URI, **kwargs):
+    """
+    Engine on the app database. SQLite connections get WAL and the tuned pragmas; PostgreSQL engines
+    get a connection pool, and read_only makes their transactions read only.
+    """
+    if not uri.startswith('sqlite'):
+        kwargs.setdefault('pool_size', DB_POOL_SIZE)
+        kwargs.setdefault('max_overflow', DB_MAX_OVERFLOW)
+        connect_args = {"options": "-c default_transaction_read_only=on"} if read_only else {}
+        return create_engine(uri, pool_pre_ping=True, connect_args=connect_args, **kwargs)
+
+    new_engine = create_engine(uri, connect_args={"check_same_thread": False}, **kwargs)
+
+    @event.listens_for(new_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection, read_only)
+
+    return new_engine
+
+
+def make_async_engine(read_only=False, uri=ASYNC_SQLALCHEMY_DATABASE_URI):
+    """
+    Async counterpart of make_engine. On SQLite it uses NullPool because each aiosqlite connection runs on
+    its own thread tied to the event loop that opened it; opening a SQLite file is cheap next to that.
+    """
+    if not uri.startswith('sqlite'):
+        connect_args = {"server_settings": {"default_transaction_read_only": "on"}} if read_only else {}
+        return create_async_engine(uri, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True,
+                                   connect_args=connect_args)
+
+    new_engine = create_async_engine(uri, poolclass=NullPool)
+
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection, read_only)
+
+    return new_engine
+
+
+# engine: schema setup and the endpoints that modify tests/groups
+# read_engine: read only connections for GET endpoints, which (WAL / MVCC) never wait on a writer
+# writer_engine: a single connection for the ResultWriter thread's result ingestion
+# maintenance_engine: the scheduler's archive and clean up jobs, which must never hold the writer's connection
+engine = make_engine()
+read_engine = make_engine(read_only=True)
+writer_engine = make_engine(pool_size=1, max_overflow=0)
+maintenance_engine = make_engine(pool_size=1, max_overflow=0)
+# async_read_engine: the async GET endpoints, so a slow query doesn't block the worker's event loop
+async_read_engine = make_async_engine(read_only=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
+
+class GUID(TypeDecorator):
+    """
+    UUID column holding the 16 raw bytes (uuid.bytes) on the Python side, as the app has always used.
+    Stored as BLOB on SQLite and as a native uuid on PostgreSQL.
+    """
+    impl = BLOB
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(PG_UUID(as_uuid=True))
+        return dialect.type_descriptor(BLOB())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != 'postgresql':
+            return value
+        return uuid.UUID(bytes=bytes(value))
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name != 'postgresql':
+            return value
+        return value.bytes
+
+
 Base = declarative_base()
 
 
 class TestGroup(Base):
     __tablename__ = 'test_group'
-    id = Column(BLOB, primary_key=True, default=lambda: uuid.uuid4().bytes, index=True)
+    id = Column(GUID, primary_key=True, default=lambda: uuid.uuid4().bytes, index=True)
     name = Column(String(50), nullable=False, unique=True)
     server = Column(String(100), nullable=False)
     port = Column(Integer, nullable=False)
     schedule = Column(String(100), nullable=True)
     tls = Column(Boolean, nullable=False, default=False)
     scope = Column(String(100), nullable=True)
+    parallelism = Column(Integer, nullable=False, default=1, server_default='1')  # max tests run at once
 
 
 class TestCase(Base):
     __tablename__ = 'test_case'
-    id = Column(BLOB, primary_key=True, default=lambda: uuid.uuid4().bytes, index=True)
-    group_id = Column(BLOB, ForeignKey('test_group.id', ondelete='CASCADE', name='fk_test_case_group_id'), nullable=False)
+    id = Column(GUID, primary_key=True, default=lambda: uuid.uuid4().bytes, index=True)
+    group_id = Column(GUID, ForeignKey('test_group.id', ondelete='CASCADE', name='fk_test_case_group_id'), nullable=False)
     test_name = Column(String(50), nullable=False)
     test_code = Column(Text, nullable=False)
     creation_date = Column(DateTime, default=datetime.utcnow)
     test_type = Column(String(20), nullable=False)
+    # the row's key in the SQLite search index, set by its insert trigger (rowid can't be used, VACUUM may renumber it)
+    search_rowid = Column(Integer, nullable=True)
     group = relationship('TestGroup', backref='test_cases')
 
+    __table_args__ = (
+        # name ordered (keyset) listing of a group's tests
+        Index('ix_test_case_group_name', 'group_id', 'test_name', 'id'),
+        Index('ix_test_case_search_rowid', 'search_rowid', unique=True),
+    )
+
+# Search over test names and code (see search_tests). On SQLite an external content FTS5 trigram table over
+# test_case keyed on test_case.search_rowid, kept in step by triggers; on PostgreSQL pg_trgm GIN indexes that
+# serve ILIKE '%query%'.
+SEARCH_INDEX_DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS test_case_fts USING fts5("
+        "test_name, test_code, content='test_case', content_rowid='search_rowid', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS test_case_fts_insert AFTER INSERT ON test_case BEGIN "
+        "UPDATE test_case SET search_rowid = (SELECT coalesce(max(search_rowid), 0) + 1 FROM test_case) "
+        "WHERE rowid = new.rowid AND search_rowid IS NULL; "
+        "INSERT INTO test_case_fts(rowid, test_name, test_code) "
+        "SELECT search_rowid, test_name, test_code FROM test_case WHERE rowid = new.rowid; END",
+        "CREATE TRIGGER IF NOT EXISTS test_case_fts_delete AFTER DELETE ON test_case BEGIN "
+        "INSERT INTO test_case_fts(test_case_fts, rowid, test_name, test_code) VALUES ('delete', old.search_rowid, old.test_name, old.test_code); END",
+        "CREATE TRIGGER IF NOT EXISTS test_case_fts_update AFTER UPDATE OF test_name, test_code ON test_case BEGIN "
+        "INSERT INTO test_case_fts(test_case_fts, rowid, test_name, test_code) VALUES ('delete', old.search_rowid, old.test_name, old.test_code); "
+        "INSERT INTO test_case_fts(rowid, test_name, test_code) VALUES (new.search_rowid, new.test_name, new.test_code); END",
+    ],
+    'postgresql': [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_test_case_name_trgm ON test_case USING gin (test_name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_test_case_code_trgm ON test_case USING gin (test_code gin_trgm_ops)",
+    ],
+}
+
+
+def create_search_index(connection):
+    for statement in SEARCH_INDEX_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+def rebuild_search_index(connection):
+    """Re-reads every test case into the FTS table."""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("INSERT INTO test_case_fts(test_case_fts) VALUES ('rebuild')"))
+
+
+def drop_search_index(connection):
+    if connection.dialect.name == 'sqlite':
+        for trigger in ("test_case_fts_insert", "test_case_fts_delete", "test_case_fts_update"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        connection.execute(text("DROP TABLE IF EXISTS test_case_fts"))
+
+
+event.listen(TestCase.__table__, "after_create", lambda target, connection, **kw: create_search_index(connection))
+event.listen(TestCase.__table__, "before_drop", DDL("DROP TABLE IF EXISTS test_case_fts").execute_if(dialect='sqlite'))
+
+
 class TestResult(Base):
     __tablename__ = 'test_result'
-    id = Column(BLOB, primary_key=True, default=lambda: uuid.uuid4().bytes, index=True)
-    test_case_id = Column(BLOB, ForeignKey('test_case.id', ondelete='CASCADE', name='fk_test_result_test_case_id'), nullable=False)
-    group_id = Column(BLOB, ForeignKey('test_group.id', ondelete='CASCADE', name='fk_test_result_group_id'), nullable=False)
+    id = Column(GUID, primary_key=True, default=lambda: uuid.uuid4().bytes, index=True)
+    test_case_id = Column(GUID, ForeignKey('test_case.id', ondelete='CASCADE', name='fk_test_result_test_case_id'), nullable=False)
+    group_id = Column(GUID, ForeignKey('test_group.id', ondelete='CASCADE', name='fk_test_result_group_id'), nullable=False)
     test_case = relationship('TestCase', backref='results')
-    date_run = Column(Date, nullable=False, default=datetime.utcnow().date, index=True)
+    # PostgreSQL partitions on date_run, which must then be part of the primary key
+    date_run = Column(Date, nullable=False, default=datetime.utcnow().date, index=True, primary_key=not IS_SQLITE)
     time_run = Column(Time, nullable=False, default=datetime.utcnow().time)
     time_taken = Column(Float, nullable=False)
     pass_status = Column(Boolean, nullable=False)
+    # not run because a prerequisite failed (or a dependency cycle), stored with pass_status False but not a failure
+    skipped = Column(Boolean, nullable=False, default=False, server_default=false())
     error_message = Column(Text, nullable=True)
     run_number = Column(Integer, nullable=False, default=1, index=True)
 
+    __table_args__ = (
+        # keyset pagination of a run's results by status / time taken, see get_test_results_page
+        Index('ix_test_result_run_status', 'group_id', 'date_run', 'run_number', 'pass_status', 'id'),
+        Index('ix_test_result_run_time', 'group_id', 'date_run', 'run_number', 'time_taken', 'id'),
+        # "has this test run" lookups
+        Index('ix_test_result_case_run', 'test_case_id', 'date_run', 'run_number'),
+        # monthly partitions are added by migrations.ensure_result_partitions
+        {'postgresql_partition_by': 'RANGE (date_run)'},
+    )
+
+
+# Rows outside the monthly partitions (e.g. old dates copied in by migrate_sqlite_to_postgres) land here
+event.listen(
+    TestResult.__table__, "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS test_result_default PARTITION OF test_result DEFAULT").execute_if(dialect='postgresql')
+)
+
+
+class TestResultDaily(Base):
+    """Per run rollup of test_result, maintained as results are written (see rollup.py)."""
+    __tablename__ = 'test_result_daily'
+    group_id = Column(GUID, primary_key=True)
+    date_run = Column(Date, primary_key=True, index=True)
+    run_number = Column(Integer, primary_key=True)
+    passed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0, server_default='0')
+    total_time = Column(Float, nullable=False, default=0.0)
+    max_time = Column(Float, nullable=False, default=0.0)
+
+
+class TestRun(Base):
+    """
+    One execution of a test group. run_number is allocated per group and day by runs.allocate_run and the
+    counters are advanced by the ResultWriter as the run's results are committed (see runs.py).
+    """
+    __tablename__ = 'test_run'
+    id = Column(GUID, primary_key=True, default=lambda: uuid.uuid4().bytes)
+    group_id = Column(GUID, ForeignKey('test_group.id', ondelete='CASCADE', name='fk_test_run_group_id'), nullable=False)
+    date_run = Column(Date, nullable=False)
+    run_number = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default='running')  # running, completed or failed
+    started_at = Column(DateTime, nullable=True, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    total_tests = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    passed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        # also the (group_id, date_run) index for run listing and progress lookups
+        UniqueConstraint('group_id', 'date_run', 'run_number', name='uq_test_run_group_date_run'),
+    )
+
 
 class TestDependency(Base):
     __tablename__ = 'test_dependency'
-    id = Column(BLOB, primary_key=True, default=lambda: uuid.uuid4().bytes, index=True)
-    test_id = Column(BLOB, ForeignKey('test_case.id', ondelete='CASCADE', name='fk_test_dependency_test_id'), nullable=False)
-    dependent_test_id = Column(BLOB, ForeignKey('test_case.id', ondelete='CASCADE', name='fk_test_dependency_dependent_test_id'), nullable=False)
+    id = Column(GUID, primary_key=True, default=lambda: uuid.uuid4().bytes, index=True)
+    test_id = Column(GUID, ForeignKey('test_case.id', ondelete='CASCADE', name='fk_test_dependency_test_id'), nullable=False, index=True)
+    dependent_test_id = Column(GUID, ForeignKey('test_case.id', ondelete='CASCADE', name='fk_test_dependency_dependent_test_id'), nullable=False, index=True)
 
     test = relationship('TestCase', foreign_keys=[test_id], backref='dependencies')
     dependent_test = relationship('TestCase', foreign_keys=[dependent_test_id], backref='dependents')
+
+
+
+class SchemaVersion(Base):
+    """One row per applied migration, see migrations.py."""
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True)
+    description = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,280 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from config.config import PROGRESS_PATH
+
+logger = logging.getLogger(__name__)
+
+SOCKET_SUFFIX = ".sock"
+SNAPSHOT_SUFFIX = ".json"
+# snapshots of runs finished longer ago than this are removed when a new run starts
+SNAPSHOT_MAX_AGE = 24 * 60 * 60
+MAX_DATAGRAM = 64 * 1024
+# error messages are cut to this many characters in events, the full text is in the test's result
+ERROR_PREVIEW_CHARS = 1000
+
+
+def run_key(group_id, run_date, run_number):
+    """(group id hex, ISO date, run number), how runs are addressed in events, snapshots and subscriptions."""
+    group_id = group_id.hex() if isinstance(group_id, bytes) else group_id.hex
+    return group_id, run_date.isoformat(), int(run_number)
+
+
+def snapshot_path(key):
+    group_id, run_date, run_number = key
+    return os.path.join(PROGRESS_PATH, f"{group_id}_{run_date}_{run_number}{SNAPSHOT_SUFFIX}")
+
+
+def read_snapshot(key):
+    """The latest progress event of a run, or None if it hasn't started (or its snapshot has expired)."""
+    try:
+        with open(snapshot_path(key)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class RunProgress:
+    """
+    Publishes the progress of one run: an event per finished test with the run's running counters, and a
+    started and finished event. Each event is sent as a datagram to every worker socket in PROGRESS_PATH
+    and written to the run's snapshot file, so a watcher that connects mid-run starts from the current
+    counters. Publishing is best effort and never fails the run.
+    """
+
+    def __init__(self, group_id, run_date, run_number, total_tests):
+        self.key = run_key(group_id, run_date, run_number)
+        self.total_tests = total_tests
+        self.completed = self.passed = self.failed = self.skipped = 0
+        self.seq = 0
+        self._socket = None
+        self._targets = []
+        self._targets_mtime = None
+
+    def started(self):
+        os.makedirs(PROGRESS_PATH, exist_ok=True)
+        remove_expired_snapshots()
+        self._publish("started", status="running")
+
+    def test_finished(self, test_name, pass_status, time_taken, error_message="", skipped=False):
+        self.completed += 1
+        if skipped:
+            self.skipped += 1
+        elif pass_status:
+            self.passed += 1
+        else:
+            self.failed += 1
+        self._publish("test", status="running", test_name=test_name, pass_status=pass_status, skipped=skipped,
+                      time_taken=time_taken, error_message=(error_message or "")[:ERROR_PREVIEW_CHARS])
+
+    def finished(self, status="completed"):
+        self._publish("finished", status=status)
+
+    def _publish(self, event, **fields):
+        self.seq += 1
+        group_id, run_date, run_number = self.key
+        message = {
+            "event": event, "seq": self.seq, "group_id": group_id, "date": run_date, "run_number": run_number,
+            "total_tests": self.total_tests, "completed": self.completed, "passed": self.passed, "failed": self.failed,
+            "skipped": self.skipped, **fields
+        }
+        try:
+            data = json.dumps(message).encode()
+            self._write_snapshot(data)
+            self._send(data)
+        except Exception as e:
+            logger.warning(f"Could not publish progress of run {self.key}: {str(e)}")
+
+    def _write_snapshot(self, data):
+        path = snapshot_path(self.key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _subscriber_sockets(self):
+        # the directory's mtime changes whenever a worker binds or removes its socket
+        mtime = os.stat(PROGRESS_PATH).st_mtime_ns
+        if mtime != self._targets_mtime:
+            self._targets = [entry.path for entry in os.scandir(PROGRESS_PATH) if entry.name.endswith(SOCKET_SUFFIX)]
+            self._targets_mtime = mtime
+        return self._targets
+
+    def _send(self, data):
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+        for path in self._subscriber_sockets():
+            try:
+                self._socket.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # left behind by a worker that exited without cleaning up
+                logger.info(f"Removing stale progress socket {path}")
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                logger.warning(f"Progress socket {path} is full, dropping event {self.seq} of run {self.key}")
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def remove_expired_snapshots(now=None):
+    cutoff = (now or time.time()) - SNAPSHOT_MAX_AGE
+    for entry in os.scandir(PROGRESS_PATH):
+        if entry.name.endswith(SNAPSHOT_SUFFIX) and entry.stat().st_mtime < cutoff:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class ProgressHub:
+    """
+    This worker's end of the progress channel. The first watcher binds the worker's datagram socket and
+    registers it with the event loop; events are handed to the queues of the watchers of their run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._socket = None
+        self._path = None
+        self._loop = None
+        self._subscribers = {}
+
+    def _ensure_reader(self, loop):
+        if self._socket is None:
+            os.makedirs(PROGRESS_PATH, exist_ok=True)
+            self._path = os.path.join(PROGRESS_PATH, f"{uuid.uuid4().hex[:16]}{SOCKET_SUFFIX}")
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+            self._socket.bind(self._path)
+        if self._loop is not loop:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self._socket.fileno())
+            loop.add_reader(self._socket.fileno(), self._on_readable)
+            self._loop = loop
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._socket.recv(MAX_DATAGRAM)
+            except BlockingIOError:
+                return
+            try:
+                event = json.loads(data)
+                key = (event["group_id"], event["date"], event["run_number"])
+            except (ValueError, KeyError):
+                logger.warning("Ignoring a malformed progress event")
+                continue
+            for queue in self._subscribers.get(key, ()):
+                queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, key):
+        """Queue of the run's events for as long as the context is open."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._ensure_reader(asyncio.get_running_loop())
+            self._subscribers.setdefault(key, []).append(queue)
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                self._subscribers[key].remove(queue)
+                if not self._subscribers[key]:
+                    del self._subscribers[key]
+
+    def close(self):
+        with self._lock:
+            if self._socket is None:
+                return
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self._socket.fileno())
+            self._socket.close()
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+            self._socket = self._loop = self._path = None
+
+
+progress_hub = ProgressHub()
+atexit.register(progress_hub.close)
+
+
+def final_event(key, seq, run):
+    """A finished event built from the run's TestRun row, for runs whose own finished event never arrived."""
+    group_id, run_date, run_number = key
+    return {
+        "event": "finished", "seq": seq, "group_id": group_id, "date": run_date, "run_number": run_number,
+        "total_tests": run["total_tests"], "completed": run["completed"], "passed": run["passed"],
+        "failed": run["failed"], "skipped": run["skipped"], "status": run["status"]
+    }
+
+
+async def progress_events(key, keepalive, run_state):
+    """
+    The run's snapshot followed by its live events, until it finishes. Yields None every keepalive
+    seconds without an event, so the caller notices a client that went away.
+
+    Datagrams are dropped once a worker's socket queue is full, so after each quiet keepalive period the
+    snapshot is read again and sent if it has moved on. If it hasn't, run_state() (the run's TestRun row as
+    a dict, or None) is checked and the stream ends when the run is missing or no longer running, e.g. its
+    process died or its snapshot has expired.
+    """
+    async with progress_hub.subscribe(key) as queue:
+        # subscribed before reading the snapshot, so nothing published in between is missed
+        snapshot = read_snapshot(key)
+        last_seq = 0
+        if snapshot:
+            yield snapshot
+            last_seq = snapshot["seq"]
+            if snapshot["event"] == "finished":
+                return
+        check_run = snapshot is None
+        while True:
+            if check_run:
+                run = await run_state()
+                if run is None:
+                    return
+                if run["status"] != "running":
+                    snapshot = read_snapshot(key)
+                    if snapshot and snapshot["event"] == "finished" and snapshot["seq"] > last_seq:
+                        yield snapshot
+                    else:
+                        yield final_event(key, last_seq + 1, run)
+                    return
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                snapshot = read_snapshot(key)
+                if snapshot and snapshot["seq"] > last_seq:
+                    last_seq = snapshot["seq"]
+                    yield snapshot
+                    if snapshot["event"] == "finished":
+                        return
+                    check_run = False
+                else:
+                    yield None
+                    check_run = True
+                continue
+            check_run = False
+            if event["seq"] <= last_seq:
+                continue
+            last_seq = event["seq"]
+            yield event
+            if event["event"] == "finished":
+                return
@@ -0,0 +1,215 @@
+import atexit
+import logging
+import os
+import pickle
+import queue
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+from models.models import TestResult, WriterSessionLocal
+import rollup
+import runs
+from date_index import date_index
+from config.config import RESULT_BATCH_SIZE, RESULT_FLUSH_INTERVAL, RESULT_WRITE_RETRY_SECONDS, FAILED_RESULTS_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class ResultWriter:
+    """
+    Single writer for TestResult rows.
+
+    Concurrent runs submit() plain row dicts, one background thread inserts them in batched
+    transactions once RESULT_BATCH_SIZE rows are queued or RESULT_FLUSH_INTERVAL seconds have
+    passed, so the database sees one write transaction per batch rather than one per test.
+
+    A batch the database refuses is retried for retry_seconds while the error looks transient (locked,
+    busy, no free connection). One that still fails is spooled to spool_path, written again when the
+    writer next starts, and counted against its runs until the run asks with take_unwritten().
+    """
+
+    def __init__(self, session_factory, batch_size=RESULT_BATCH_SIZE, flush_interval=RESULT_FLUSH_INTERVAL,
+                 retry_seconds=RESULT_WRITE_RETRY_SECONDS, spool_path=FAILED_RESULTS_PATH):
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_seconds = retry_seconds
+        self.spool_path = spool_path
+        # (group_id, date_run, run_number): rows of that run that couldn't be written
+        self._unwritten = Counter()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.failed_rows = 0
+        self.spooled_rows = 0
+        self.last_flush_latency = None
+        self.max_flush_latency = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        """Queues a TestResult row (dict of column values) for the next batch."""
+        self.start()
+        self._queue.put(row)
+
+    def flush(self, timeout=None):
+        """Blocks until every row submitted before this call has been committed."""
+        self.start()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def take_unwritten(self, group_id, date_run, run_number):
+        """How many of the run's results failed to be written (and were spooled), resetting the count."""
+        with self._lock:
+            return self._unwritten.pop((group_id, date_run, run_number), 0)
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._stopping = True
+            self.flush()
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "failed_rows": self.failed_rows,
+            "spooled_rows": self.spooled_rows,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+        }
+
+    def _run(self):
+        self._replay_spooled()
+        while not self._stopping or not self._queue.empty():
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            batch, waiters = [], []
+            deadline = time.time() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    # explicit flush, write what we have straight away
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _commit(self, batch):
+        session = self._session_factory()
+        try:
+            session.execute(insert(TestResult), batch)
+            rollup.apply_results(session.connection(), batch)
+            runs.apply_results(session.connection(), batch)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _write(self, batch, attempts=3):
+        start = time.time()
+        deadline = start + self.retry_seconds
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self._commit(batch)
+                break
+            except Exception as e:
+                transient = isinstance(e, (OperationalError, PoolTimeoutError))
+                if (transient and time.time() >= deadline) or (not transient and attempt >= attempts):
+                    logger.error(f"Writing {len(batch)} test results failed {attempt} times, spooling them: {str(e)}")
+                    self._spool(batch)
+                    return
+                logger.warning(f"Writing {len(batch)} test results failed (attempt {attempt}), retrying: {str(e)}")
+                time.sleep(min(0.2 * 2 ** (attempt - 1), 5.0))
+
+        self._written(batch, time.time() - start)
+
+    def _written(self, batch, latency):
+        try:
+            date_index.add(row["date_run"] for row in batch)
+        except Exception as e:
+            logger.error(f"Error updating the date index: {str(e)}")
+
+        self.rows_written += len(batch)
+        self.batches_written += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        logger.info(f"Wrote {len(batch)} test results in {latency:.3f}s")
+
+    def _spool(self, batch):
+        self.failed_rows += len(batch)
+        with self._lock:
+            self._unwritten.update((row["group_id"], row["date_run"], row["run_number"]) for row in batch)
+        try:
+            os.makedirs(self.spool_path, exist_ok=True)
+            path = os.path.join(self.spool_path, f"{time.time_ns()}.pickle")
+            with open(f"{path}.tmp", "wb") as f:
+                pickle.dump(batch, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f"{path}.tmp", path)
+            self.spooled_rows += len(batch)
+        except Exception as e:
+            logger.error(f"Could not spool {len(batch)} test results, they are lost: {str(e)}")
+
+    def _replay_spooled(self):
+        """Writes the batches spooled by earlier failures, oldest first, leaving any that still fail for next time."""
+        if not os.path.isdir(self.spool_path):
+            return
+        for name in sorted(name for name in os.listdir(self.spool_path) if name.endswith(".pickle")):
+            path = os.path.join(self.spool_path, name)
+            # claimed by renaming, so the writers of two processes never both write the same batch
+            claimed = f"{path}.{os.getpid()}.replay"
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            start = time.time()
+            try:
+                with open(claimed, "rb") as f:
+                    batch = pickle.load(f)
+                self._commit(batch)
+            except Exception as e:
+                logger.error(f"Spooled test results {path} still can't be written: {str(e)}")
+                os.replace(claimed, path)
+                continue
+            os.unlink(claimed)
+            logger.info(f"Wrote {len(batch)} spooled test results from {path}")
+            self._written(batch, time.time() - start)
+
+
+result_writer = ResultWriter(WriterSessionLocal)
+atexit.register(result_writer.stop)
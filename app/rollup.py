@@ -0,0 +1,110 @@
+import logging
+from collections import defaultdict
+
+from sqlalchemy import event, select, delete, func, case, tuple_, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models.models import TestResult, TestResultDaily
+
+logger = logging.getLogger(__name__)
+
+
+def aggregate(rows):
+    """Sums result rows (dicts with group_id, date_run, run_number, pass_status, skipped, time_taken) per rollup key."""
+    totals = defaultdict(lambda: {"passed": 0, "failed": 0, "skipped": 0, "total_time": 0.0, "max_time": 0.0})
+    for row in rows:
+        entry = totals[(row["group_id"], row["date_run"], row["run_number"])]
+        if row.get("skipped"):
+            entry["skipped"] += 1
+        elif row["pass_status"]:
+            entry["passed"] += 1
+        else:
+            entry["failed"] += 1
+        entry["total_time"] += row["time_taken"]
+        entry["max_time"] = max(entry["max_time"], row["time_taken"])
+    return totals
+
+
+def apply_results(connection, rows):
+    """Adds newly written result rows to the rollup, in the caller's transaction."""
+    totals = aggregate(rows)
+    if not totals:
+        return
+
+    values = [
+        {"group_id": group_id, "date_run": date_run, "run_number": run_number, **entry}
+        for (group_id, date_run, run_number), entry in totals.items()
+    ]
+    postgres = connection.dialect.name == 'postgresql'
+    stmt = pg_insert(TestResultDaily) if postgres else sqlite_insert(TestResultDaily)
+    daily = TestResultDaily.__table__.c
+    # two argument max() is SQLite's scalar max, PostgreSQL spells it greatest()
+    larger = func.greatest if postgres else func.max
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[daily.group_id, daily.date_run, daily.run_number],
+        set_={
+            "passed": daily.passed + stmt.excluded.passed,
+            "failed": daily.failed + stmt.excluded.failed,
+            "skipped": daily.skipped + stmt.excluded.skipped,
+            "total_time": daily.total_time + stmt.excluded.total_time,
+            "max_time": larger(daily.max_time, stmt.excluded.max_time),
+        }
+    )
+    connection.execute(stmt, values)
+
+
+def rebuild(connection, keys=None):
+    """
+    Recomputes rollup rows from test_result, for the given (group_id, date_run, run_number) keys or everything.
+    Used after results are deleted in bulk and to backfill existing databases.
+    """
+    daily = TestResultDaily.__table__
+    clear = delete(daily)
+    query = select(
+        TestResult.group_id,
+        TestResult.date_run,
+        TestResult.run_number,
+        func.sum(case((TestResult.pass_status == True, 1), else_=0)).label('passed'),
+        func.sum(case((and_(TestResult.pass_status == False, TestResult.skipped == False), 1), else_=0)).label('failed'),
+        func.sum(case((TestResult.skipped == True, 1), else_=0)).label('skipped'),
+        func.sum(TestResult.time_taken).label('total_time'),
+        func.max(TestResult.time_taken).label('max_time'),
+    ).group_by(TestResult.group_id, TestResult.date_run, TestResult.run_number)
+
+    if keys is not None:
+        keys = list(keys)
+        if not keys:
+            return
+        clear = clear.where(tuple_(daily.c.group_id, daily.c.date_run, daily.c.run_number).in_(keys))
+        query = query.where(tuple_(TestResult.group_id, TestResult.date_run, TestResult.run_number).in_(keys))
+
+    connection.execute(clear)
+    rows = [dict(row._mapping) for row in connection.execute(query)]
+    if rows:
+        connection.execute(daily.insert(), rows)
+
+
+def backfill(connection):
+    """Builds the rollup for databases that have results from before it existed."""
+    has_rollup = connection.execute(select(TestResultDaily.group_id).limit(1)).first()
+    has_results = connection.execute(select(TestResult.id).limit(1)).first()
+    if has_results and not has_rollup:
+        logger.info("Backfilling test_result_daily from test_result")
+        rebuild(connection)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_orm_results(session, flush_context):
+    # Results added/deleted through the ORM (rather than the ResultWriter) keep the rollup in step too
+    added = [obj for obj in session.new if isinstance(obj, TestResult)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, TestResult)]
+    if added:
+        apply_results(session.connection(), [
+            {"group_id": r.group_id, "date_run": r.date_run, "run_number": r.run_number,
+             "pass_status": r.pass_status, "skipped": r.skipped, "time_taken": r.time_taken}
+            for r in added
+        ])
+    if deleted:
+        rebuild(session.connection(), {(r.group_id, r.date_run, r.run_number) for r in deleted})
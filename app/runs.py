@@ -0,0 +1,130 @@
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, update, func, bindparam, exists, and_
+from sqlalchemy.exc import IntegrityError
+
+from models.models import TestRun, TestResultDaily
+from config.config import STALE_RUN_SECONDS
+import rollup
+
+logger = logging.getLogger(__name__)
+
+
+def allocate_run(engine, group_id, run_date, total_tests=0, attempts=5):
+    """
+    Creates the group's next run of run_date and returns (run_id, run_number).
+
+    The number is taken by a single INSERT ... (SELECT max(run_number) + 1) statement, so concurrent manual
+    and scheduled runs can't be handed the same one: SQLite serialises the statements and on PostgreSQL the
+    loser of a race hits uq_test_run_group_date_run and simply tries again.
+    """
+    next_number = select(func.coalesce(func.max(TestRun.run_number), 0) + 1).where(
+        TestRun.group_id == group_id,
+        TestRun.date_run == run_date
+    ).scalar_subquery()
+
+    for attempt in range(1, attempts + 1):
+        run_id = uuid.uuid4().bytes
+        try:
+            with engine.begin() as connection:
+                run_number = connection.execute(insert(TestRun).values(
+                    id=run_id,
+                    group_id=group_id,
+                    date_run=run_date,
+                    run_number=next_number,
+                    status='running',
+                    started_at=datetime.utcnow(),
+                    total_tests=total_tests
+                ).returning(TestRun.run_number)).scalar_one()
+            return run_id, run_number
+        except IntegrityError:
+            if attempt == attempts:
+                raise
+            logger.info(f"Run number for group {group_id.hex()} on {run_date} was taken concurrently, retrying")
+            time.sleep(0.01 * attempt)
+
+
+def start_run(engine, run_id, total_tests):
+    with engine.begin() as connection:
+        connection.execute(update(TestRun).where(TestRun.id == run_id).values(
+            status='running', started_at=datetime.utcnow(), total_tests=total_tests
+        ))
+
+
+def finish_run(engine, run_id, status='completed'):
+    with engine.begin() as connection:
+        connection.execute(update(TestRun).where(TestRun.id == run_id).values(status=status, finished_at=datetime.utcnow()))
+
+
+def fail_stale_runs(engine, max_age=STALE_RUN_SECONDS, now=None):
+    """Marks runs still 'running' max_age seconds after they started as failed, e.g. their process was killed. Returns how many."""
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=max_age)
+    with engine.begin() as connection:
+        count = connection.execute(update(TestRun).where(
+            TestRun.status == 'running',
+            TestRun.started_at < cutoff
+        ).values(status='failed', finished_at=datetime.utcnow())).rowcount
+    if count:
+        logger.warning(f"Marked {count} runs that never finished as failed")
+    return count
+
+
+def apply_results(connection, rows):
+    """Advances the runs' completed/passed/failed/skipped counters by newly written result rows, in the caller's transaction."""
+    totals = rollup.aggregate(rows)
+    if not totals:
+        return
+    connection.execute(
+        update(TestRun.__table__).where(
+            TestRun.group_id == bindparam('b_group_id'),
+            TestRun.date_run == bindparam('b_date_run'),
+            TestRun.run_number == bindparam('b_run_number')
+        ).values(
+            completed=TestRun.completed + bindparam('b_passed') + bindparam('b_failed') + bindparam('b_skipped'),
+            passed=TestRun.passed + bindparam('b_passed'),
+            failed=TestRun.failed + bindparam('b_failed'),
+            skipped=TestRun.skipped + bindparam('b_skipped')
+        ),
+        [{"b_group_id": group_id, "b_date_run": date_run, "b_run_number": run_number,
+          "b_passed": entry["passed"], "b_failed": entry["failed"], "b_skipped": entry["skipped"]}
+         for (group_id, date_run, run_number), entry in totals.items()]
+    )
+
+
+def refresh_counts(connection, keys):
+    """Resets the counters of the given (group_id, date_run, run_number) runs from the rollup, e.g. after deleting results."""
+    for group_id, date_run, run_number in keys:
+        daily = connection.execute(select(TestResultDaily.passed, TestResultDaily.failed, TestResultDaily.skipped).where(
+            TestResultDaily.group_id == group_id,
+            TestResultDaily.date_run == date_run,
+            TestResultDaily.run_number == run_number
+        )).first()
+        passed, failed, skipped = daily if daily else (0, 0, 0)
+        connection.execute(update(TestRun).where(
+            TestRun.group_id == group_id,
+            TestRun.date_run == date_run,
+            TestRun.run_number == run_number
+        ).values(completed=passed + failed + skipped, passed=passed, failed=failed, skipped=skipped))
+
+
+def backfill(connection):
+    """Creates a completed run for every run in the rollup that predates the test_run table."""
+    missing = connection.execute(select(
+        TestResultDaily.group_id, TestResultDaily.date_run, TestResultDaily.run_number,
+        TestResultDaily.passed, TestResultDaily.failed, TestResultDaily.skipped
+    ).where(~exists().where(and_(
+        TestRun.group_id == TestResultDaily.group_id,
+        TestRun.date_run == TestResultDaily.date_run,
+        TestRun.run_number == TestResultDaily.run_number
+    )))).all()
+    if missing:
+        connection.execute(insert(TestRun), [{
+            "id": uuid.uuid4().bytes, "group_id": row.group_id, "date_run": row.date_run, "run_number": row.run_number,
+            "status": 'completed', "started_at": None, "finished_at": None, "total_tests": row.passed + row.failed + row.skipped,
+            "completed": row.passed + row.failed + row.skipped, "passed": row.passed, "failed": row.failed,
+            "skipped": row.skipped,
+        } for row in missing])
+    logger.info(f"Backfilled {len(missing)} test runs")
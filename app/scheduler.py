@@ -6,11 +6,15 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from sqlalchemy.orm import Session
 from uuid import UUID
-from models.models import TestGroup, SessionLocal
+from models.models import TestGroup, SessionLocal, engine, maintenance_engine
 from utils import parse_time_to_cron
-from config.config import BASE_DIR
+from config.config import BASE_DIR, IS_SQLITE
 from KdbSubs import run_scheduled_test_group
+from result_writer import result_writer
 from backup_db import perform_backup, cleanup_old_backups
+from migrations import ensure_result_partitions
+from archive import archive_results
+import runs
 
 
 if os.getenv('DOCKER_ENV') == 'true':
@@ -70,14 +74,43 @@ async def startup_event():
                 else:
                     logger.warning(f"Skipping TestGroup ID {test_group.id.hex()} due to invalid schedule.")
 
-        # Add the job for creating backups of the db
+        if IS_SQLITE:
+            # Add the job for creating backups of the db
+            scheduler.add_job(
+                backup_and_cleanup,
+                CronTrigger(hour=00, minute=00),  # Runs at midnight
+                id="database_backup",
+                replace_existing=True
+            )
+            logger.info("Scheduled daily database backup job at midnight.")
+        else:
+            # PostgreSQL backups are left to the database's own tooling; keep test_result partitions ahead instead
+            scheduler.add_job(
+                create_result_partitions,
+                CronTrigger(hour=00, minute=30),
+                id="result_partitions",
+                replace_existing=True
+            )
+            logger.info("Scheduled daily test_result partition maintenance.")
+
+        # Move results past the retention period into the Parquet archive
         scheduler.add_job(
-            backup_and_cleanup,
-            CronTrigger(hour=00, minute=00),  # Runs at midnight
-            id="database_backup",
+            archive_old_results,
+            CronTrigger(hour=1, minute=00),
+            id="archive_results",
             replace_existing=True
         )
-        logger.info("Scheduled daily database backup job at midnight.")
+        logger.info("Scheduled daily test result archiving.")
+
+        # Runs whose process died mid-run would otherwise show as running forever
+        scheduler.add_job(
+            fail_stale_runs,
+            CronTrigger(minute=15),
+            id="fail_stale_runs",
+            replace_existing=True
+        )
+        fail_stale_runs()
+        logger.info("Scheduled hourly clean up of stale test runs.")
 
     except Exception as e:
         logger.error(f"Error scheduling jobs: {str(e)}")
@@ -93,6 +126,7 @@ async def shutdown_event():
     """Shut down the scheduler on app shutdown."""
     logger.info("Shutting down scheduler")
     scheduler.shutdown()
+    result_writer.stop()
 
 
 def backup_and_cleanup():
@@ -101,6 +135,25 @@ def backup_and_cleanup():
     cleanup_old_backups(logger)
 
 
+def create_result_partitions():
+    with engine.begin() as connection:
+        ensure_result_partitions(connection)
+
+
+def archive_old_results():
+    try:
+        archive_results(maintenance_engine)
+    except Exception as e:
+        logger.error(f"Error archiving old test results: {str(e)}")
+
+
+def fail_stale_runs():
+    try:
+        runs.fail_stale_runs(maintenance_engine)
+    except Exception as e:
+        logger.error(f"Error failing stale test runs: {str(e)}")
+
+
 def add_or_update_job(test_group_id: UUID):
     session: Session = SessionLocal()
 
@@ -137,6 +190,10 @@ async def update_job(test_group_id: UUID):
     for job in jobs:
         logger.info(f"Job ID: {job.id}")
 
+@app.get("/result_writer_stats")
+async def result_writer_stats():
+    return result_writer.stats()
+
 @app.delete("/remove_job/{test_group_id}")
 async def remove_job(test_group_id: UUID):
     try:
@@ -0,0 +1,178 @@
+import logging
+import threading
+
+from message_buffer import MessageBuffer, DROP_OLDEST, CONFLATE
+from config.config import SUBSCRIPTION_BUFFER_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """
+    One client of a shared subscription. Encoded messages arrive in its own bounded buffer until close(),
+    so a slow client only loses its own messages (see MessageBuffer for the overflow policies).
+    """
+
+    def __init__(self, upstream, buffer, conflate_key=None):
+        self.buffer = buffer
+        self.conflate_key = conflate_key
+        self._upstream = upstream
+        self._closed = False
+
+    def stopped(self):
+        return self._closed or self._upstream.stopped()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.buffer.close()
+            self._upstream.hub.release(self)
+
+
+def split_by_key(message, column):
+    """
+    (key, message) per distinct value of column in a decoded table message, holding that key's latest
+    row. A message without the column is returned whole under the key None, so it isn't conflated.
+    """
+    if column not in message.get("columns", ()):
+        return [(None, message)]
+    latest = {}
+    for row in message["rows"]:
+        latest[row[column]] = row
+    return [(key, {"columns": message["columns"], "rows": [row], "trimmed": False, "num_rows": 1})
+            for key, row in latest.items()]
+
+
+class Upstream:
+    """The single kdbSub behind a key and the clients its messages are fanned out to."""
+
+    def __init__(self, hub, key, sub):
+        self.hub = hub
+        self.key = key
+        self.sub = sub
+        self.clients = []
+        self.messages = 0
+
+    def stopped(self):
+        return self.sub.stopped()
+
+    def close(self):
+        """The kdbSub has ended: wake every client so it sees the subscription is gone."""
+        for client in list(self.clients):
+            client.buffer.close()
+
+    def publish(self, message):
+        # decoded once on the reactor thread and encoded once per message shape here, however many clients are watching
+        try:
+            encoded = self.hub.encode(message)
+            conflated = {}
+            for client in list(self.clients):
+                if client.buffer.policy == CONFLATE and client.conflate_key:
+                    if client.conflate_key not in conflated:
+                        conflated[client.conflate_key] = [
+                            (key, self.hub.encode(part)) for key, part in split_by_key(message, client.conflate_key)
+                        ]
+                    for key, part in conflated[client.conflate_key]:
+                        client.buffer.put(part, key)
+                else:
+                    client.buffer.put(encoded)
+        except Exception as e:
+            logger.exception(f"Error encoding message of subscription {self.key}: {e}")
+            return
+        self.messages += 1
+
+
+class SubscriptionHub:
+    """
+    Shares kdb subscriptions between the clients of a process. The first acquire() of a key opens its
+    kdbSub through connect(), later ones join it, and the subscription is stopped when its last client
+    closes. encode turns each decoded message into what is handed to the clients.
+    """
+
+    def __init__(self, encode=lambda message: message):
+        self.encode = encode
+        self._lock = threading.Lock()
+        self._upstreams = {}
+        self._connect_locks = {}
+
+    def acquire(self, key, connect, policy=DROP_OLDEST, conflate_key=None, maxsize=SUBSCRIPTION_BUFFER_SIZE):
+        """
+        A Subscriber of key's subscription with a buffer of maxsize messages and the given overflow policy;
+        conflate_key is the column the conflate policy keeps the latest row of. Blocks while the subscription
+        is opened, so run it off the event loop.
+        """
+        buffer = MessageBuffer(maxsize, policy)
+        with self._lock:
+            # [lock, acquires using it], so release() only drops a lock nobody is waiting on
+            connect_lock = self._connect_locks.setdefault(key, [threading.Lock(), 0])
+            connect_lock[1] += 1
+        try:
+            # only first connections to the same key wait on each other
+            with connect_lock[0]:
+                with self._lock:
+                    upstream = self._upstreams.get(key)
+                    if upstream is not None and not upstream.stopped():
+                        return self._add_client(upstream, buffer, conflate_key)
+
+                sub = connect()
+                upstream = Upstream(self, key, sub)
+                sub.on_message = upstream.publish
+                sub.on_stopped = upstream.close
+                with self._lock:
+                    self._upstreams[key] = upstream
+                    client = self._add_client(upstream, buffer, conflate_key)
+                try:
+                    sub.start()
+                except Exception:
+                    self._abandon(upstream, client)
+                    raise
+                logger.info(f"Opened shared subscription {key}")
+                return client
+        finally:
+            with self._lock:
+                connect_lock[1] -= 1
+                self._prune_connect_lock(key)
+
+    def _abandon(self, upstream, client):
+        # start() failed: nobody else can have joined yet, so drop the upstream and close its connection
+        with self._lock:
+            upstream.clients.remove(client)
+            if self._upstreams.get(upstream.key) is upstream:
+                del self._upstreams[upstream.key]
+        client.buffer.close()
+        try:
+            upstream.sub.stopit()
+        except Exception as e:
+            logger.exception(f"Error closing subscription {upstream.key} that failed to start: {e}")
+
+    def _prune_connect_lock(self, key):
+        # called under self._lock: a key's lock lives as long as its subscription or anyone connecting to it
+        connect_lock = self._connect_locks.get(key)
+        if connect_lock is not None and not connect_lock[1] and key not in self._upstreams:
+            del self._connect_locks[key]
+
+    def _add_client(self, upstream, buffer, conflate_key):
+        client = Subscriber(upstream, buffer, conflate_key)
+        upstream.clients.append(client)
+        return client
+
+    def release(self, client):
+        upstream = client._upstream
+        stats = client.buffer.stats()
+        if stats["dropped"] or stats["conflated"]:
+            logger.info(f"Client of subscription {upstream.key} left: {stats}")
+        with self._lock:
+            upstream.clients.remove(client)
+            if upstream.clients:
+                return
+            if self._upstreams.get(upstream.key) is upstream:
+                del self._upstreams[upstream.key]
+                self._prune_connect_lock(upstream.key)
+        logger.info(f"Last client left, stopping shared subscription {upstream.key}")
+        upstream.sub.stopit()
+
+    def stats(self):
+        with self._lock:
+            return [{"key": list(key), "clients": len(upstream.clients), "messages": upstream.messages,
+                     "buffers": [client.buffer.stats() for client in upstream.clients]}
+                    for key, upstream in self._upstreams.items()]
@@ -3,17 +3,52 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import pytest
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from models.models import Base
 from main import app
-from config.config import SQLALCHEMY_DATABASE_URI
-from dependencies import get_db
+from config.config import SQLALCHEMY_DATABASE_URI, ASYNC_SQLALCHEMY_DATABASE_URI
+from dependencies import get_db, get_read_db, get_async_db, get_async_session_factory
+import progress
+import date_index
+import result_writer
+from endpoints import view_dates
 
 # Set up test database
 engine = create_engine(SQLALCHEMY_DATABASE_URI, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URI, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+@contextmanager
+def recorded_statements():
+    """List of the SQL statements the async endpoints send while the block runs."""
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+@pytest.fixture(autouse=True)
+def progress_path(tmp_path, monkeypatch):
+    # test runs publish their progress snapshots here instead of the repo's cache/progress
+    monkeypatch.setattr(progress, "PROGRESS_PATH", str(tmp_path / "progress"))
+
+@pytest.fixture(autouse=True)
+def test_date_index(tmp_path, monkeypatch):
+    # and keep their dates out of the repo's cache/date_index.bin
+    index = date_index.DateIndex(str(tmp_path / "date_index.bin"))
+    for module in (date_index, result_writer, view_dates):
+        monkeypatch.setattr(module, "date_index", index)
+    return index
 
 @pytest.fixture(scope="function")
 def db_session():
@@ -34,6 +69,14 @@ def client(db_session):
             db_session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_session_factory] = lambda: TestingAsyncSessionLocal
     client = TestClient(app)
     yield client
 
@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 import pytest
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -9,7 +9,7 @@ from models.models import TestCase, TestGroup, TestResult
 ###### test_kdb_connection ###
 #############################
 
-@patch('endpoints.add_view_test_groups.test_kdb_conn')  # Mocking the kdb connection function
+@patch('endpoints.add_view_test_groups.test_kdb_conn_async', new_callable=AsyncMock)  # Mocking the kdb connection function
 def test_test_kdb_connection(mock_test_kdb_conn, client, db_session):
     # Mock the response from the kdb connection function
     mock_test_kdb_conn.return_value = "Kdb connection successful"
@@ -199,7 +199,8 @@ def test_get_test_group_stats(client, db_session, setup_mock_data_for_stats):
     assert response.status_code == 200
     assert response.json() == {
         "total_passed": 1,
-        "total_failed": 1
+        "total_failed": 1,
+        "total_skipped": 0
     }
 
 def test_get_test_group_stats_no_results(client, db_session, setup_mock_data_for_stats):
@@ -216,6 +217,7 @@ def test_get_test_group_stats_no_results(client, db_session, setup_mock_data_for
     assert response.status_code == 200
     assert response.json() == {
         "total_passed": 0,
-        "total_failed": 0
+        "total_failed": 0,
+        "total_skipped": 0
     }
 
@@ -271,3 +271,78 @@ def test_get_test_result_summary_no_results(client, setup_mock_data_for_summary)
         assert group_data["Passed"] == 0
         assert group_data["Failed"] == 0
 
+
+
+###########################
+## get_test_results_page ##
+###########################
+
+@pytest.fixture(scope="function")
+def setup_mock_data_for_pages(db_session):
+    group_id = uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Paged Group", server="localhost", port=1234, tls=False))
+    for i in range(25):
+        test_case_id = uuid4()
+        db_session.add(TestCase(id=test_case_id.bytes, test_name=f"Test {i:02d}", group_id=group_id.bytes,
+                                test_code=f"t{i}", test_type="Functional"))
+        # the first 20 tests ran in run 1, every third of them failing
+        if i < 20:
+            db_session.add(TestResult(test_case_id=test_case_id.bytes, group_id=group_id.bytes, date_run=datetime(2023, 8, 1).date(),
+                                      time_taken=float(i), pass_status=(i % 3 != 0), run_number=1))
+    db_session.commit()
+    return group_id
+
+
+def fetch_all_pages(client, group_id, sort_option, page_size=7):
+    rows, cursor, pages = [], None, 0
+    while True:
+        url = f"/get_test_results_page/?date=01-08-2023&group_id={group_id.hex}&sortOption={sort_option}&page_size={page_size}"
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        body = response.json()
+        assert body["run_number"] == 1
+        rows.extend(body["test_data"])
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return rows, pages
+
+
+@pytest.mark.parametrize("sort_option", ["", "Failed", "Passed", "Time Taken"])
+def test_get_test_results_page_walks_every_test_once(client, setup_mock_data_for_pages, sort_option):
+    rows, pages = fetch_all_pages(client, setup_mock_data_for_pages, sort_option)
+    assert pages == 4
+    assert len({row["test_case_id"] for row in rows}) == 25
+
+    # run results first in the requested order, then un-run tests by name
+    run_rows, unrun_rows = rows[:20], rows[20:]
+    assert all(row["Status"] is not None for row in run_rows)
+    assert [row["Test Name"] for row in unrun_rows] == [f"Test {i}" for i in range(20, 25)]
+    assert all(row["Status"] is None for row in unrun_rows)
+
+    if sort_option == "Failed":
+        assert [row["Status"] for row in run_rows] == [False] * 7 + [True] * 13
+    elif sort_option == "Passed":
+        assert [row["Status"] for row in run_rows] == [True] * 13 + [False] * 7
+    elif sort_option == "Time Taken":
+        assert [row["Time Taken"] for row in run_rows] == [float(i) for i in range(19, -1, -1)]
+    else:
+        assert [row["Test Name"] for row in run_rows] == [f"Test {i:02d}" for i in range(20)]
+
+
+def test_get_test_results_page_rejects_bad_cursor(client, setup_mock_data_for_pages):
+    response = client.get(f"/get_test_results_page/?date=01-08-2023&group_id={setup_mock_data_for_pages.hex}&cursor=notacursor")
+    assert response.status_code == 400
+
+
+def test_get_test_results_by_day_query_count_independent_of_rows(client, setup_mock_data_for_pages):
+    from conftest import recorded_statements
+
+    with recorded_statements() as statements:
+        response = client.get(f"/get_test_results_by_day/?date=01-08-2023&group_id={setup_mock_data_for_pages.hex}&page_number=1")
+
+    assert response.status_code == 200
+    rows = response.json()["test_data"]
+    assert len(rows) == 25 and all(row["group_name"] == "Paged Group" for row in rows)
+    # counts, one page of results and one page of un-run tests, however many rows they hold
+    assert len(statements) <= 4
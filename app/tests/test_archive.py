@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+import os
+import pytest
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import func
+from models.models import TestCase, TestGroup, TestResult, TestResultDaily
+import archive
+
+TODAY = datetime.utcnow().date()
+
+
+@pytest.fixture(scope="function")
+def setup_archive_data(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "RESULTS_PATH", str(tmp_path / "test_result"))
+    group_id, case_id = uuid4(), uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Archive Group", server="localhost", port=1234, tls=False))
+    db_session.add(TestCase(id=case_id.bytes, test_name="Archived Test", group_id=group_id.bytes, test_code="1b", test_type="Functional"))
+    for days_ago, pass_status in [(20, False), (12, True), (2, True)]:
+        for run_number in (1, 2):
+            db_session.add(TestResult(test_case_id=case_id.bytes, group_id=group_id.bytes, date_run=TODAY - timedelta(days=days_ago),
+                                      time_taken=float(days_ago), pass_status=pass_status, run_number=run_number, error_message="e"))
+    db_session.commit()
+    return group_id, case_id
+
+
+def test_archive_results_moves_old_days(db_session, setup_archive_data):
+    from conftest import engine
+    group_id, case_id = setup_archive_data
+
+    assert archive.archive_results(engine, retention_days=10, today=TODAY) == 4
+    assert archive.archived_dates() == [TODAY - timedelta(days=20), TODAY - timedelta(days=12)]
+    assert {row.date_run for row in db_session.query(TestResult)} == {TODAY - timedelta(days=2)}
+    # daily totals still include the archived days
+    assert db_session.query(func.count()).select_from(TestResultDaily).scalar() == 6
+
+    archived = archive.read_result_rows(TODAY - timedelta(days=30), TODAY, test_case_id=case_id.bytes)
+    assert [(row["date_run"], row["run_number"]) for row in archived] == [
+        (TODAY - timedelta(days=20), 1), (TODAY - timedelta(days=20), 2),
+        (TODAY - timedelta(days=12), 1), (TODAY - timedelta(days=12), 2),
+    ]
+    assert all(row["group_id"] == group_id.bytes and row["error_message"] == "e" for row in archived)
+    assert archive.read_results(TODAY - timedelta(days=15), TODAY, test_case_id=uuid4().bytes).num_rows == 0
+
+    # re-archiving a day that is already in the archive doesn't duplicate it
+    db_session.add(TestResult(test_case_id=case_id.bytes, group_id=group_id.bytes, date_run=TODAY - timedelta(days=12),
+                              time_taken=1.0, pass_status=True, run_number=3))
+    db_session.commit()
+    assert archive.archive_results(engine, retention_days=10, today=TODAY) == 1
+    assert archive.read_results(TODAY - timedelta(days=12), TODAY - timedelta(days=12)).num_rows == 3
+
+
+def test_archive_results_streams_a_day_in_batches(db_session, setup_archive_data, monkeypatch):
+    from conftest import engine
+    group_id, case_id = setup_archive_data
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH_ROWS", 1)
+    day = TODAY - timedelta(days=20)
+    # the day already has a file, archived before results had a skipped column
+    old_schema = archive.RESULT_SCHEMA.remove(archive.RESULT_SCHEMA.get_field_index("skipped"))
+    os.makedirs(archive.partition_dir(day))
+    pq.write_table(pa.Table.from_pylist([{
+        "id": uuid4().bytes, "test_case_id": case_id.bytes, "group_id": group_id.bytes, "time_run": None,
+        "time_taken": 1.0, "pass_status": True, "error_message": "", "run_number": 9
+    }], schema=old_schema), os.path.join(archive.partition_dir(day), archive.PART_FILE))
+
+    assert archive.archive_results(engine, retention_days=10, today=TODAY) == 4
+
+    # the old rows are kept and each batch read from the database went into the file as it arrived
+    path = os.path.join(archive.partition_dir(day), archive.PART_FILE)
+    assert pq.ParquetFile(path).metadata.num_row_groups == 3
+    assert [(row["run_number"], row["skipped"]) for row in archive.read_result_rows(day, day)] == [(1, False), (2, False), (9, None)]
+
+
+def test_get_test_info_history_includes_archive(client, setup_archive_data):
+    from conftest import engine
+    _, case_id = setup_archive_data
+    archive.archive_results(engine, retention_days=10, today=TODAY)
+
+    response = client.get(f"/get_test_info/?date={TODAY.strftime('%d-%m-%Y')}&test_id={case_id.hex}")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["last_30_days_dates"] == [(TODAY - timedelta(days=days_ago)).strftime('%Y-%m-%d') for days_ago in (20, 20, 12, 12, 2, 2)]
+    assert data["last_30_days_statuses"] == [0, 0, 1, 1, 1, 1]
+    assert data["last_30_days_timeTaken"] == [20.0, 20.0, 12.0, 12.0, 2.0, 2.0]
@@ -0,0 +1,38 @@
+from datetime import date
+from uuid import uuid4
+from models.models import TestCase, TestGroup, TestResult
+from date_index import DateIndex, rebuild_from_rollup
+
+
+def test_date_index_shared_between_instances(tmp_path):
+    path = str(tmp_path / "date_index.bin")
+    writer, reader = DateIndex(path), DateIndex(path)  # as if in two workers
+    assert not reader.built
+    assert reader.summary() == {"start_date": None, "latest_date": None, "missing_dates": []}
+
+    writer.rebuild([date(2024, 1, 1), date(2024, 1, 4)])
+    assert reader.built
+    assert reader.summary() == {"start_date": "2024-01-01", "latest_date": "2024-01-04",
+                                "missing_dates": ["2024-01-02", "2024-01-03"]}
+
+    version = reader.version
+    assert writer.add([date(2024, 1, 2), date(2024, 1, 6)])
+    assert not writer.add([date(2024, 1, 2)])  # already known, version doesn't move
+    assert reader.version == version + 1
+    assert reader.summary() == {"start_date": "2024-01-01", "latest_date": "2024-01-06",
+                                "missing_dates": ["2024-01-03", "2024-01-05"]}
+
+
+def test_date_index_rebuilt_after_results_are_deleted(client, db_session, test_date_index):
+    group_id, test_case_id = uuid4().bytes, uuid4()
+    db_session.add(TestGroup(id=group_id, name="Date Group", server="localhost", port=1234, tls=False))
+    db_session.add(TestCase(id=test_case_id.bytes, test_name="dated", group_id=group_id, test_code="dated", test_type="Functional"))
+    for day in (date(2024, 1, 1), date(2024, 1, 3)):
+        db_session.add(TestResult(test_case_id=test_case_id.bytes, group_id=group_id, date_run=day,
+                                  time_taken=0.1, pass_status=True, run_number=1))
+    db_session.commit()
+    rebuild_from_rollup(db_session.connection())
+    assert test_date_index.summary()["latest_date"] == "2024-01-03"
+
+    assert client.delete(f"/delete_test_case/{test_case_id}").status_code == 200
+    assert test_date_index.summary() == {"start_date": None, "latest_date": None, "missing_dates": []}
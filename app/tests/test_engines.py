@@ -0,0 +1,25 @@
+import time
+import pytest
+from uuid import uuid4
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from models.models import TestGroup, ReadSessionLocal, WriterSessionLocal
+
+
+def test_reads_do_not_wait_for_open_write_transaction(db_session):
+    writer = WriterSessionLocal()
+    reader = ReadSessionLocal()
+    try:
+        writer.add(TestGroup(id=uuid4().bytes, name="Uncommitted", server="localhost", port=1234, tls=False))
+        writer.flush()  # holds the write lock until commit
+
+        start = time.time()
+        assert reader.query(TestGroup).count() == 0
+        assert time.time() - start < 1
+
+        with pytest.raises(OperationalError, match="readonly"):
+            reader.execute(text("DELETE FROM test_group"))
+    finally:
+        writer.rollback()
+        writer.close()
+        reader.close()
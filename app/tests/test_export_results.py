@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+from datetime import date
+from uuid import uuid4
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from models.models import TestCase, TestGroup, TestResult
+import archive
+from endpoints import export_results
+
+DAYS = [date(2023, 8, 1), date(2023, 8, 2), date(2023, 8, 3)]
+
+
+@pytest.fixture(scope="function")
+def setup_export_data(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "RESULTS_PATH", str(tmp_path / "test_result"))
+    # small batches so every export crosses several of them
+    monkeypatch.setattr(export_results, "EXPORT_BATCH_ROWS", 4)
+    group_ids = [uuid4(), uuid4()]
+    for g, group_id in enumerate(group_ids):
+        db_session.add(TestGroup(id=group_id.bytes, name=f"Export Group {g}", server="localhost", port=1234, tls=False))
+        for i in range(3):
+            case_id = uuid4().bytes
+            db_session.add(TestCase(id=case_id, test_name=f"Export {g}-{i}", group_id=group_id.bytes, test_code="1b", test_type="Functional"))
+            for day in DAYS:
+                db_session.add(TestResult(test_case_id=case_id, group_id=group_id.bytes, date_run=day, time_taken=1.5,
+                                          pass_status=(i != 0), run_number=1, error_message="" if i else "type"))
+    db_session.commit()
+    return group_ids
+
+
+def export(client, fmt, **params):
+    query = "&".join(f"{key}={value}" for key, value in {"start_date": "01-08-2023", "end_date": "03-08-2023", **params}.items())
+    response = client.get(f"/export_results/?format={fmt}&{query}")
+    assert response.status_code == 200
+    return response
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson", "parquet", "arrow"])
+def test_export_results_formats(client, setup_export_data, fmt):
+    from conftest import engine
+    # the first day comes from the archive, the others from the database
+    archive.archive_results(engine, retention_days=0, today=DAYS[1])
+
+    response = export(client, fmt)
+    if fmt == "csv":
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+    elif fmt == "ndjson":
+        rows = [json.loads(line) for line in response.text.splitlines()]
+    elif fmt == "parquet":
+        rows = pq.read_table(pa.BufferReader(response.content)).to_pylist()
+    else:
+        rows = pa.ipc.open_stream(response.content).read_all().to_pylist()
+
+    assert len(rows) == 18
+    assert sorted({str(row["date_run"]) for row in rows}) == [str(day) for day in DAYS]
+    assert {row["group_name"] for row in rows} == {"Export Group 0", "Export Group 1"}
+    assert all(row["test_name"].startswith("Export ") for row in rows)
+
+
+def test_export_results_filters(client, setup_export_data):
+    group_ids = setup_export_data
+    rows = export(client, "ndjson", group_ids=group_ids[1].hex, status="failed").text.splitlines()
+    rows = [json.loads(line) for line in rows]
+    assert len(rows) == 3
+    assert all(row["group_id"] == group_ids[1].hex and row["pass_status"] is False and row["error_message"] == "type" for row in rows)
+
+
+def test_export_results_rejects_bad_format(client, setup_export_data):
+    response = client.get("/export_results/?start_date=01-08-2023&end_date=03-08-2023&format=xlsx")
+    assert response.status_code == 400
+
+
+def test_export_results_lists_archived_days_once(client, setup_export_data, monkeypatch):
+    from conftest import engine
+    archive.archive_results(engine, retention_days=0, today=DAYS[1])
+    listings = []
+    archived_dates = archive.archived_dates
+    monkeypatch.setattr(archive, "archived_dates", lambda *args: listings.append(args) or archived_dates(*args))
+
+    rows = list(csv.DictReader(io.StringIO(export(client, "csv").text)))
+    assert len(rows) == 18
+    assert listings == [(DAYS[0], DAYS[2])]
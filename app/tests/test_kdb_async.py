@@ -0,0 +1,71 @@
+import asyncio
+import numpy as np
+from qpython.qconnection import MessageType
+from qpython.qreader import QReader
+from qpython.qwriter import QWriter
+from kdb_async import AsyncQConnection, AsyncKdbConnectionPool
+
+
+async def fake_q_server(reader, writer):
+    """Minimal kdb+ IPC peer: completes the handshake, then answers each sync call with the number of arguments."""
+    credentials = await reader.readuntil(b'\0')
+    assert credentials.startswith(b"user:pass")
+    writer.write(bytes([3]))
+    while True:
+        try:
+            header = await reader.readexactly(8)
+        except asyncio.IncompleteReadError:
+            break
+        size = int.from_bytes(header[4:8], 'little')
+        body = await reader.readexactly(size - 8)
+        request = QReader(None).read(header + body).data
+        response = np.int64(len(request) - 1)
+        writer.write(QWriter(None, protocol_version=3).write(response, MessageType.RESPONSE))
+        await writer.drain()
+    writer.close()
+
+
+def test_async_connection_round_trip():
+    async def run():
+        server = await asyncio.start_server(fake_q_server, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        q = AsyncQConnection("127.0.0.1", port, username="user", password="pass", timeout=5)
+        await q.open()
+        results = [await q.sendSync(".qsuite.executeFunction", "a", "b"), await q.sendSync("f", "x")]
+        q.close()
+        server.close()
+        await server.wait_closed()
+        return results
+
+    assert asyncio.run(run()) == [2, 1]
+
+
+def test_async_pool_clear_retires_handles_in_use():
+    async def run():
+        connections = []
+
+        async def counting_server(reader, writer):
+            connections.append(writer)
+            await fake_q_server(reader, writer)
+
+        server = await asyncio.start_server(counting_server, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = AsyncKdbConnectionPool(lambda host, port, tls, timeout, scope: AsyncQConnection(
+            host, port, username="user", password="pass", timeout=timeout))
+        assert await pool.send_sync("127.0.0.1", port, False, 5, "", "f", "x") == 1
+        assert await pool.send_sync("127.0.0.1", port, False, 5, "", "f", "x") == 1
+        assert len(connections) == 1
+
+        pool._bind_loop()
+        key = ("127.0.0.1", port, False, "")
+        busy = await pool._checkout(key, 5)
+        pool.clear()
+        pool._checkin(key, busy, broken=False)
+        assert not busy.conn.is_connected()
+        assert await pool.send_sync("127.0.0.1", port, False, 5, "", "f", "x") == 1
+        assert len(connections) == 2
+        pool.clear()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
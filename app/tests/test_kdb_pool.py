@@ -0,0 +1,91 @@
+import socket
+import pytest
+from kdb_pool import KdbConnectionPool
+
+
+class FakeQConnection:
+    """Stands in for QConnection, backed by a local socketpair so liveness checks are real."""
+
+    def __init__(self):
+        self._connection = None
+        self._peer = None
+        self.timeout = None
+        self.sent = []
+
+    def open(self):
+        self._connection, self._peer = socket.socketpair()
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._peer.close()
+            self._connection = None
+
+    def is_connected(self):
+        return self._connection is not None
+
+    def query(self, msg_type, query, *args):
+        if self._peer.fileno() == -1:
+            raise BrokenPipeError("peer closed")
+        self.sent.append(query)
+
+    def receive(self, data_only=True, **options):
+        class Message:
+            type = 2
+            data = b"ok"
+        return Message()
+
+
+@pytest.fixture
+def pool():
+    return KdbConnectionPool(lambda host, port, tls, timeout, scope: FakeQConnection(), max_size=2)
+
+
+def test_pool_reuses_handles(pool):
+    for _ in range(50):
+        assert pool.send_sync("localhost", 5000, False, 10, "", ".qsuite.executeFunction", "test1") == b"ok"
+    assert pool.handshakes == 1
+
+
+def test_pool_replaces_dead_idle_handle(pool):
+    pool.send_sync("localhost", 5000, False, 10, "", "f")
+    # simulate kdb closing the idle handle
+    idle = pool._targets[("localhost", 5000, False, "")].idle[0]
+    idle.conn._peer.close()
+
+    assert pool.send_sync("localhost", 5000, False, 10, "", "f") == b"ok"
+    assert pool.handshakes == 2
+
+
+def test_pool_respects_max_size(pool):
+    pool.checkout_timeout = 0.1
+    first = pool.checkout("localhost", 5000, False, 10)
+    second = pool.checkout("localhost", 5000, False, 10)
+    with pytest.raises(TimeoutError):
+        pool.checkout("localhost", 5000, False, 10)
+
+    pool.checkin(*first)
+    assert pool.checkout("localhost", 5000, False, 10)[1] is first[1]
+    pool.checkin(*second)
+
+
+def test_pool_evicts_idle_handles(pool):
+    pool.send_sync("localhost", 5000, False, 10, "", "f")
+    pool.idle_timeout = -1
+    pool.evict_idle()
+    assert pool.stats()["targets"]["localhost:5000"] == {"open": 0, "idle": 0}
+
+
+def test_pool_clear_retires_checked_out_handles(pool):
+    idle = pool.checkout("localhost", 5000, False, 10)
+    busy = pool.checkout("localhost", 5000, False, 10)
+    pool.checkin(*idle)
+
+    pool.clear()
+    assert pool.stats()["targets"]["localhost:5000"] == {"open": 1, "idle": 0}
+    # the handle that was in use during clear() is closed on checkin, not reused
+    pool.checkin(*busy)
+    assert not busy[1].conn.is_connected()
+    assert pool.stats()["targets"]["localhost:5000"] == {"open": 0, "idle": 0}
+    assert pool.send_sync("localhost", 5000, False, 10, "", "f") == b"ok"
+    assert pool.handshakes == 3
@@ -0,0 +1,147 @@
+import socket
+import threading
+import time
+import numpy as np
+from qpython.qconnection import MessageType
+from qpython.qreader import QReader
+from qpython.qwriter import QWriter
+from kdb_reactor import FrameBuffer, KdbReactor, take_buffered
+
+
+def q_message(value):
+    return QWriter(None, protocol_version=3).write(value, MessageType.ASYNC)
+
+
+def test_frame_buffer_reassembles_split_messages():
+    data = q_message(np.int64(1)) + q_message("two") + q_message(np.int64(3))
+    frames = FrameBuffer()
+    received = []
+    for i in range(0, len(data), 5):
+        received += frames.feed(data[i:i + 5])
+    assert [QReader(None).read(frame).data for frame in received] == [1, b"two", 3]
+
+
+def test_reactor_multiplexes_subscriptions_on_one_thread():
+    reactor = KdbReactor()
+    threads_before = threading.active_count()
+    received = {}
+    closed = {}
+    done = threading.Event()
+    pairs = [socket.socketpair() for _ in range(20)]
+
+    def on_frame(i):
+        def handler(frame):
+            received.setdefault(i, []).append(QReader(None).read(frame).data)
+            if sum(len(values) for values in received.values()) == 60:
+                done.set()
+        return handler
+
+    def on_closed(i):
+        return lambda error: closed.__setitem__(i, error)
+
+    for i, (ours, _) in enumerate(pairs):
+        ours.setblocking(False)
+        reactor.register(ours, on_frame(i), on_closed(i), buffered=q_message(np.int64(-i)))
+    for i, (_, theirs) in enumerate(pairs):
+        data = q_message(np.int64(i)) + q_message(np.int64(i * 10))
+        theirs.sendall(data[:3])
+        theirs.sendall(data[3:])
+
+    assert done.wait(5)
+    assert all(received[i] == [-i, i, i * 10] for i in range(20))
+    assert threading.active_count() == threads_before + 1
+    assert reactor.stats() == {"subscriptions": 20, "threads": 1, "frames": 60}
+
+    # a stopped subscription is unregistered, one whose peer went away is closed with the error
+    reactor.unregister(pairs[0][0])
+    pairs[1][1].close()
+    for _ in range(50):
+        if 0 in closed and 1 in closed:
+            break
+        time.sleep(0.01)
+    assert closed[0] is None
+    assert isinstance(closed[1], ConnectionError)
+    assert reactor.stats()["subscriptions"] == 18
+
+
+def test_take_buffered_returns_bytes_already_read():
+    ours, theirs = socket.socketpair()
+    theirs.sendall(b"response" + b"tick")
+    sock_file = ours.makefile("rb")
+    assert sock_file.read(8) == b"response"
+    assert take_buffered(ours, sock_file) == b"tick"
+    assert take_buffered(ours, sock_file) == b""
+
+
+def test_flooding_subscription_does_not_starve_others():
+    reactor = KdbReactor()
+    flood_ours, flood_theirs = socket.socketpair()
+    quiet_ours, quiet_theirs = socket.socketpair()
+    flood_ours.setblocking(False)
+    quiet_ours.setblocking(False)
+    quiet = threading.Event()
+    closed = threading.Event()
+    stop = threading.Event()
+    tick = q_message(np.int64(1)) * 1000
+
+    def flood():
+        while not stop.is_set():
+            try:
+                flood_theirs.sendall(tick)
+            except OSError:
+                return
+
+    reactor.register(flood_ours, lambda frame: None, lambda error: closed.set())
+    reactor.register(quiet_ours, lambda frame: quiet.set(), lambda error: None)
+    flooder = threading.Thread(target=flood, daemon=True)
+    flooder.start()
+    try:
+        quiet_theirs.sendall(q_message(np.int64(2)))
+        assert quiet.wait(5)
+        reactor.unregister(flood_ours)
+        assert closed.wait(5)
+    finally:
+        stop.set()
+        # unblocks a sendall waiting for the reactor to read
+        flood_ours.close()
+        flooder.join(5)
+        flood_theirs.close()
+
+
+def test_reactor_failure_closes_every_subscription(monkeypatch):
+    reactor = KdbReactor()
+    closed = {}
+    everything_closed = threading.Event()
+    pairs = [socket.socketpair() for _ in range(3)]
+
+    def on_closed(i):
+        def handler(error):
+            closed[i] = error
+            if len(closed) == len(pairs):
+                everything_closed.set()
+        return handler
+
+    def broken_read(registration):
+        raise MemoryError("out of memory")
+
+    for i, (ours, _) in enumerate(pairs[:2]):
+        reactor.register(ours, lambda frame: None, on_closed(i))
+    while reactor.stats()["subscriptions"] < 2:
+        time.sleep(0.01)
+    # a failure outside a single socket's read takes down the loop
+    monkeypatch.setattr(reactor, "_read", broken_read)
+    reactor.register(pairs[2][0], lambda frame: None, on_closed(2))
+    pairs[0][1].sendall(q_message(np.int64(1)))
+
+    assert everything_closed.wait(5)
+    assert all(isinstance(error, MemoryError) for error in closed.values())
+    assert reactor.stats()["threads"] == 0
+    assert reactor._wakeup_w is None
+
+    # and the next subscription starts a fresh loop
+    monkeypatch.undo()
+    received = threading.Event()
+    ours, theirs = socket.socketpair()
+    reactor.register(ours, lambda frame: received.set(), lambda error: None)
+    theirs.sendall(q_message(np.int64(1)))
+    assert received.wait(5)
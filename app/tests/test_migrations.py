@@ -0,0 +1,98 @@
+from sqlalchemy import create_engine, inspect, text
+from models.models import Base, drop_search_index
+from migrations import run_migrations, MIGRATIONS
+
+
+def test_run_migrations_upgrades_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=engine)
+    # wind the schema back to before the parallelism column and composite indexes existed
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE test_group DROP COLUMN parallelism"))
+        for index in ["ix_test_result_run_status", "ix_test_result_run_time", "ix_test_case_group_name", "ix_test_dependency_test_id",
+                      "ix_test_case_search_rowid"]:
+            conn.execute(text(f"DROP INDEX {index}"))
+        # and to before the search index existed, with a test case already in the table
+        drop_search_index(conn)
+        conn.execute(text("ALTER TABLE test_case DROP COLUMN search_rowid"))
+        conn.execute(text("INSERT INTO test_group (id, name, server, port, tls) VALUES (x'01', 'group', 'localhost', 1234, 0)"))
+        conn.execute(text("INSERT INTO test_case (id, group_id, test_name, test_code, test_type) "
+                          "VALUES (x'02', x'01', 'old test', 'count trade', 'Functional')"))
+
+    assert run_migrations(engine) == MIGRATIONS[-1][0]
+
+    inspector = inspect(engine)
+    assert "parallelism" in {column["name"] for column in inspector.get_columns("test_group")}
+    assert {"ix_test_result_run_status", "ix_test_result_run_time"} <= {index["name"] for index in inspector.get_indexes("test_result")}
+    assert "ix_test_case_group_name" in {index["name"] for index in inspector.get_indexes("test_case")}
+    assert "ix_test_dependency_test_id" in {index["name"] for index in inspector.get_indexes("test_dependency")}
+
+    # the search index finds the old test, and keeps finding the right rows after VACUUM renumbers rowids
+    with engine.begin() as conn:
+        for i, name in enumerate(["gap", "new test"]):
+            conn.execute(text("INSERT INTO test_case (id, group_id, test_name, test_code, test_type) "
+                              f"VALUES (x'1{i}', x'01', '{name}', 'count trade', 'Functional')"))
+        conn.execute(text("DELETE FROM test_case WHERE test_name = 'old test'"))
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        names = conn.execute(text("SELECT test_case.test_name FROM test_case_fts JOIN test_case "
+                                  "ON test_case.search_rowid = test_case_fts.rowid WHERE test_case_fts MATCH '\"test\"'")).scalars().all()
+    assert names == ["new test"]
+
+    # already up to date, nothing is re-applied
+    assert run_migrations(engine) == MIGRATIONS[-1][0]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM schema_version")).scalar() == len(MIGRATIONS)
+
+
+def test_add_column_renders_nullability_and_default_through_the_dialect(tmp_path):
+    from sqlalchemy import Column, Integer, MetaData, String, Table
+    from migrations import add_column
+    metadata = MetaData()
+    Table("widget", metadata, Column("id", Integer, primary_key=True))
+    engine = create_engine(f"sqlite:///{tmp_path / 'widget.db'}")
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO widget (id) VALUES (1)"))
+    # the model as it is now, with a quoted string default and a nullable column
+    widget = Table("widget", Base.metadata, Column("id", Integer, primary_key=True),
+                   Column("label", String(20), nullable=False, server_default="it's new"),
+                   Column("note", String(20), nullable=True, server_default="none"))
+    try:
+        with engine.begin() as conn:
+            add_column(conn, "widget", "label")
+            add_column(conn, "widget", "note")
+            add_column(conn, "widget", "note")  # already there
+            assert conn.execute(text("SELECT label, note FROM widget")).one() == ("it's new", "none")
+            columns = {column["name"]: column for column in inspect(conn).get_columns("widget")}
+        assert not columns["label"]["nullable"] and columns["note"]["nullable"]
+    finally:
+        Base.metadata.remove(widget)
+
+
+def test_skipped_results_migration_stops_counting_skips_as_failures(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'skipped.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table in ["test_result", "test_result_daily", "test_run"]:
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN skipped"))
+        for version in range(1, 7):
+            conn.execute(text(f"INSERT INTO schema_version (version, description, applied_at) VALUES ({version}, 'old', '2024-01-01')"))
+        conn.execute(text("INSERT INTO test_group (id, name, server, port, tls) VALUES (x'01', 'group', 'localhost', 1234, 0)"))
+        conn.execute(text("INSERT INTO test_case (id, group_id, test_name, test_code, test_type) "
+                          "VALUES (x'02', x'01', 'test', 'count trade', 'Functional')"))
+        for result_id, error_message in [("03", "boom"), ("04", "Skipped - depends on failed test(s) test")]:
+            conn.execute(text("INSERT INTO test_result (id, test_case_id, group_id, date_run, time_run, time_taken, pass_status, error_message, run_number) "
+                              f"VALUES (x'{result_id}', x'02', x'01', '2024-01-02', '10:00:00.000000', 0.1, 0, '{error_message}', 1)"))
+        conn.execute(text("INSERT INTO test_result_daily (group_id, date_run, run_number, passed, failed, total_time, max_time) "
+                          "VALUES (x'01', '2024-01-02', 1, 0, 2, 0.2, 0.1)"))
+        conn.execute(text("INSERT INTO test_run (id, group_id, date_run, run_number, status, total_tests, completed, passed, failed) "
+                          "VALUES (x'05', x'01', '2024-01-02', 1, 'completed', 2, 2, 0, 2)"))
+
+    assert run_migrations(engine) == MIGRATIONS[-1][0]
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT error_message FROM test_result WHERE skipped")).scalars().all() == \
+            ["Skipped - depends on failed test(s) test"]
+        assert conn.execute(text("SELECT passed, failed, skipped FROM test_result_daily")).one() == (0, 1, 1)
+        assert conn.execute(text("SELECT completed, passed, failed, skipped FROM test_run")).one() == (2, 0, 1, 1)
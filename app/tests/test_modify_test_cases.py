@@ -1,3 +1,4 @@
+from unittest.mock import patch, AsyncMock
 import pytest
 from uuid import uuid4  # Import uuid4 for generating UUIDs
 from models.models import TestCase, TestGroup, TestDependency
@@ -107,3 +108,110 @@ def test_edit_test_case(client, db_session):
     assert len(dependencies) == 1
     assert dependencies[0].dependent_test_id == dependency_2_id.bytes  # The dependency should now be the updated one
 
+
+#############################
+## upsert_test_case cycles ##
+#############################
+
+# Test that a dependency closing a cycle is rejected
+def test_upsert_test_case_rejects_dependency_cycle(client, db_session):
+    group_id = uuid4()
+    group = TestGroup(id=group_id.bytes, name="Test Group", server="localhost", port=1234, schedule="16:00", tls=True)
+    db_session.add(group)
+
+    test_a_id, test_b_id, test_c_id = uuid4(), uuid4(), uuid4()
+    for test_id, name in [(test_a_id, "Test A"), (test_b_id, "Test B"), (test_c_id, "Test C")]:
+        db_session.add(TestCase(id=test_id.bytes, test_name=name, group_id=group_id.bytes, test_code="1b", test_type="Functional"))
+    db_session.commit()
+
+    # B depends on A, C depends on B
+    db_session.add(TestDependency(test_id=test_b_id.bytes, dependent_test_id=test_a_id.bytes))
+    db_session.add(TestDependency(test_id=test_c_id.bytes, dependent_test_id=test_b_id.bytes))
+    db_session.commit()
+
+    # Making A depend on C closes the loop A -> C -> B -> A
+    data = {
+        "id": test_a_id.hex,
+        "group_id": group_id.hex,
+        "test_name": "Test A",
+        "test_code": "1b",
+        "test_type": "Functional",
+        "dependencies": [test_c_id.hex]
+    }
+    response = client.post("/upsert_test_case/", json=data)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Dependencies would create a cycle: Test A -> Test C -> Test B -> Test A"
+    assert db_session.query(TestDependency).filter_by(test_id=test_a_id.bytes).count() == 0
+
+    # Replacing C's own dependency is not a cycle
+    data.update({"id": test_c_id.hex, "test_name": "Test C", "dependencies": [test_a_id.hex]})
+    response = client.post("/upsert_test_case/", json=data)
+    assert response.status_code == 200
+
+
+#############################
+## bulk_upsert_test_cases ###
+#############################
+
+@pytest.fixture(scope="function")
+def setup_bulk_group(db_session):
+    group_id = uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Bulk Group", server="localhost", port=1234, tls=False))
+    existing_id = uuid4()
+    db_session.add(TestCase(id=existing_id.bytes, test_name="existing", group_id=group_id.bytes, test_code="old", test_type="Functional"))
+    db_session.commit()
+    return group_id, existing_id
+
+
+def test_bulk_upsert_test_cases_csv(client, db_session, setup_bulk_group):
+    group_id, existing_id = setup_bulk_group
+    body = "test_name,test_code,test_type,dependencies\n" \
+           "setup,setup,Functional,\n" \
+           "checks,checks,Functional,setup;existing\n" \
+           "existing,new code,Functional,setup\n"
+    response = client.post(f"/bulk_upsert_test_cases/{group_id.hex}", content=body, headers={"content-type": "text/csv"})
+    assert response.status_code == 200
+    assert (response.json()["created"], response.json()["updated"]) == (2, 1)
+    assert response.json()["ids"]["existing"] == existing_id.hex
+
+    tests = {test.test_name: test for test in db_session.query(TestCase).filter_by(group_id=group_id.bytes)}
+    assert tests["existing"].test_code == "new code"
+    dependencies = {(tests_by_id.test_name, db_session.get(TestCase, dep.dependent_test_id).test_name)
+                    for dep in db_session.query(TestDependency) for tests_by_id in [db_session.get(TestCase, dep.test_id)]}
+    assert dependencies == {("checks", "setup"), ("checks", "existing"), ("existing", "setup")}
+
+
+def test_bulk_upsert_test_cases_rejects_whole_batch(client, db_session, setup_bulk_group):
+    group_id, _ = setup_bulk_group
+    # the cycle and the unknown dependency are both reported, and nothing is written
+    body = [
+        {"test_name": "a", "test_code": "a", "dependencies": ["b"]},
+        {"test_name": "b", "test_code": "b", "dependencies": ["a"]},
+        {"test_name": "c", "test_code": "c", "dependencies": ["missing"]},
+    ]
+    response = client.post(f"/bulk_upsert_test_cases/{group_id.hex}", json=body)
+    assert response.status_code == 400
+    assert response.json()["detail"] == ["Dependency 'missing' of 'c' does not exist"]
+
+    response = client.post(f"/bulk_upsert_test_cases/{group_id.hex}", json=body[:2])
+    assert response.status_code == 400
+    assert response.json()["detail"] == ["Dependencies would create a cycle between: a, b"]
+    assert db_session.query(TestCase).filter_by(group_id=group_id.bytes).count() == 1
+
+
+@patch('endpoints.modify_test_cases.sendKdbQueryAsync', new_callable=AsyncMock)
+def test_discover_test_cases(mock_send_kdb_query, client, db_session, setup_bulk_group):
+    group_id, _ = setup_bulk_group
+    other_group_id = uuid4()
+    db_session.add(TestGroup(id=other_group_id.bytes, name="Other Bulk Group", server="localhost", port=1234, tls=False))
+    db_session.add(TestCase(id=uuid4().bytes, test_name="test2", group_id=other_group_id.bytes, test_code="other", test_type="Functional"))
+    db_session.commit()
+    # "existing" and "test2" are names of tests already in this and another group
+    mock_send_kdb_query.return_value = [b"old", b"existing", b"test1", b"test2"]
+
+    response = client.post(f"/discover_test_cases/{group_id.hex}")
+    assert response.status_code == 200
+    assert (response.json()["created"], response.json()["updated"]) == (1, 0)
+    assert response.json()["skipped"] == ["existing", "test2"]
+    codes = sorted(test.test_code for test in db_session.query(TestCase).filter_by(group_id=group_id.bytes))
+    assert codes == ["old", "test1"]
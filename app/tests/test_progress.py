@@ -0,0 +1,149 @@
+import asyncio
+import json
+import socket
+import threading
+from datetime import datetime
+from unittest.mock import patch
+from uuid import uuid4, UUID
+import pytest
+from models.models import TestCase, TestGroup
+from KdbSubs import run_scheduled_test_group
+import progress
+
+TODAY = datetime.utcnow().date()
+
+
+async def running_run():
+    return {"status": "running", "total_tests": 2, "completed": 0, "passed": 0, "failed": 0, "skipped": 0}
+
+
+@pytest.fixture(scope="function")
+def progress_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress, "PROGRESS_PATH", str(tmp_path))
+    hub = progress.ProgressHub()
+    monkeypatch.setattr(progress, "progress_hub", hub)
+    yield tmp_path
+    hub.close()
+
+
+def test_progress_events_reach_watchers(progress_dir):
+    group_id = uuid4().bytes
+    key = progress.run_key(group_id, TODAY, 1)
+
+    def publish():
+        run_progress = progress.RunProgress(group_id, TODAY, 1, total_tests=3)
+        run_progress.started()
+        run_progress.test_finished("first", True, 0.1)
+        run_progress.test_finished("second", False, 0.2, "boom")
+        run_progress.test_finished("third", False, 0.0, "Skipped - depends on failed test(s) second", skipped=True)
+        run_progress.finished()
+        run_progress.close()
+
+    async def watch():
+        return [event async for event in progress.progress_events(key, 5, running_run)]
+
+    async def run():
+        watcher = asyncio.create_task(watch())
+        await asyncio.sleep(0.05)
+        thread = threading.Thread(target=publish)
+        thread.start()
+        events = await asyncio.wait_for(watcher, 5)
+        thread.join()
+        return events
+
+    events = asyncio.run(run())
+    assert [event["event"] for event in events] == ["started", "test", "test", "test", "finished"]
+    assert [event["seq"] for event in events] == [1, 2, 3, 4, 5]
+    assert (events[2]["test_name"], events[2]["pass_status"], events[2]["error_message"]) == ("second", False, "boom")
+    assert events[3]["skipped"] is True
+    assert (events[-1]["completed"], events[-1]["passed"], events[-1]["failed"], events[-1]["skipped"], events[-1]["status"]) == \
+        (3, 1, 1, 1, "completed")
+    assert progress.read_snapshot(key)["event"] == "finished"
+
+
+def test_stale_worker_socket_is_removed(progress_dir):
+    stale = progress_dir / "deadbeefdeadbeef.sock"
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(str(stale))
+    sock.close()
+
+    run_progress = progress.RunProgress(uuid4().bytes, TODAY, 1, total_tests=0)
+    run_progress.started()
+    run_progress.close()
+    assert not stale.exists()
+
+
+def test_progress_events_recover_dropped_datagrams(progress_dir, monkeypatch):
+    group_id = uuid4().bytes
+    key = progress.run_key(group_id, TODAY, 1)
+    # every datagram lost, as when the watcher's socket queue is full
+    monkeypatch.setattr(progress.RunProgress, "_send", lambda self, data: None)
+
+    def publish():
+        run_progress = progress.RunProgress(group_id, TODAY, 1, total_tests=2)
+        run_progress.started()
+        run_progress.test_finished("first", True, 0.1)
+        run_progress.test_finished("second", True, 0.1)
+        run_progress.finished()
+
+    async def run():
+        watcher = asyncio.create_task(collect(progress.progress_events(key, 0.05, running_run)))
+        await asyncio.sleep(0.01)
+        publish()
+        return await asyncio.wait_for(watcher, 5)
+
+    events = asyncio.run(run())
+    assert [event for event in events if event is not None][-1]["event"] == "finished"
+    assert events[-1]["completed"] == 2
+
+
+def test_progress_events_end_for_runs_that_are_gone_or_stopped(progress_dir):
+    key = progress.run_key(uuid4().bytes, TODAY, 1)
+
+    async def missing_run():
+        return None
+
+    async def failed_run():
+        return {"status": "failed", "total_tests": 3, "completed": 1, "passed": 1, "failed": 0, "skipped": 0}
+
+    assert asyncio.run(collect(progress.progress_events(key, 5, missing_run))) == []
+    events = asyncio.run(collect(progress.progress_events(key, 5, failed_run)))
+    assert [(event["event"], event["status"], event["completed"]) for event in events] == [("finished", "failed", 1)]
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def functional_query(kdbFunction, host, port, tls, scope=""):
+    return {"success": kdbFunction != "test1", "data": "", "message": "Test Failed", "type": "bool"}
+
+
+@patch('KdbSubs.sendFunctionalQuery', side_effect=functional_query)
+def test_stream_test_progress_of_finished_run(mock_query, client, db_session, progress_dir):
+    group_id = uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Progress Group", server="localhost", port=1234, tls=False))
+    for i in range(3):
+        db_session.add(TestCase(id=uuid4().bytes, test_name=f"Progress Test {i}", group_id=group_id.bytes,
+                                test_code=f"test{i}", test_type="Functional"))
+    db_session.commit()
+    run_scheduled_test_group(UUID(bytes=group_id.bytes))
+
+    response = client.get(f"/stream_test_progress/{group_id}?date={TODAY.strftime('%d-%m-%Y')}&run_number=1")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert len(events) == 1
+    assert events[0]["event"] == "finished"
+    assert (events[0]["total_tests"], events[0]["completed"], events[0]["passed"], events[0]["failed"]) == (3, 3, 2, 1)
+
+
+def test_stream_test_progress_invalid_date(client):
+    response = client.get(f"/stream_test_progress/{uuid4()}?date=2024-01-01&run_number=1")
+    assert response.status_code == 400
+
+
+def test_stream_test_progress_of_unknown_run_ends(client, progress_dir):
+    response = client.get(f"/stream_test_progress/{uuid4()}?date={TODAY.strftime('%d-%m-%Y')}&run_number=1")
+    assert response.status_code == 200
+    assert response.text == ""
@@ -0,0 +1,61 @@
+import os
+from datetime import datetime
+from uuid import uuid4
+from models.models import TestCase, TestGroup, TestResult, SessionLocal
+from result_writer import ResultWriter
+
+
+def test_result_writer_batches_rows(db_session):
+    group_id, test_case_id = uuid4(), uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Writer Group", server="localhost", port=1234, tls=False))
+    db_session.add(TestCase(id=test_case_id.bytes, test_name="Writer Test", group_id=group_id.bytes, test_code="1b", test_type="Functional"))
+    db_session.commit()
+
+    writer = ResultWriter(SessionLocal, batch_size=100, flush_interval=5)
+    now = datetime.utcnow()
+    for i in range(25):
+        writer.submit({
+            "test_case_id": test_case_id.bytes, "group_id": group_id.bytes, "date_run": now.date(),
+            "time_run": now.time(), "time_taken": 0.1, "pass_status": True, "error_message": "", "run_number": 1
+        })
+    assert writer.flush(timeout=5)
+
+    assert db_session.query(TestResult).count() == 25
+    stats = writer.stats()
+    assert stats["rows_written"] == 25
+    assert stats["batches_written"] == 1
+    assert stats["queue_depth"] == 0
+    writer.stop()
+
+
+def test_result_writer_spools_batches_it_cannot_write(db_session, tmp_path):
+    from sqlalchemy.exc import OperationalError
+    group_id, test_case_id = uuid4(), uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Spool Group", server="localhost", port=1234, tls=False))
+    db_session.add(TestCase(id=test_case_id.bytes, test_name="Spool Test", group_id=group_id.bytes, test_code="1b", test_type="Functional"))
+    db_session.commit()
+
+    def locked_database():
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    spool_path = str(tmp_path / "failed_results")
+    writer = ResultWriter(locked_database, flush_interval=5, retry_seconds=0.3, spool_path=spool_path)
+    now = datetime.utcnow()
+    for i in range(3):
+        writer.submit({
+            "test_case_id": test_case_id.bytes, "group_id": group_id.bytes, "date_run": now.date(),
+            "time_run": now.time(), "time_taken": 0.1, "pass_status": True, "error_message": "", "run_number": 7
+        })
+    assert writer.flush(timeout=5)
+    writer.stop()
+    assert writer.stats()["spooled_rows"] == 3
+    assert writer.take_unwritten(group_id.bytes, now.date(), 7) == 3
+    assert writer.take_unwritten(group_id.bytes, now.date(), 7) == 0
+    assert db_session.query(TestResult).count() == 0
+
+    # the next writer to start writes them
+    replaying = ResultWriter(SessionLocal, spool_path=spool_path)
+    assert replaying.flush(timeout=5)
+    replaying.stop()
+    assert db_session.query(TestResult).filter_by(run_number=7).count() == 3
+    assert os.listdir(spool_path) == []
@@ -0,0 +1,62 @@
+from datetime import date
+from uuid import uuid4
+import pytest
+from models.models import TestCase, TestGroup, TestResult, TestResultDaily
+from result_writer import result_writer
+import rollup
+
+RUN_DATE = date(2023, 8, 1)
+
+
+@pytest.fixture(scope="function")
+def setup_rollup_group(db_session):
+    group_id = uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Rollup Group", server="localhost", port=1234, tls=False))
+    case_ids = [uuid4().bytes for _ in range(3)]
+    for i, case_id in enumerate(case_ids):
+        db_session.add(TestCase(id=case_id, test_name=f"Rollup {i}", group_id=group_id.bytes, test_code=f"t{i}", test_type="Functional"))
+    db_session.commit()
+    return group_id, case_ids
+
+
+def result_row(group_id, case_id, pass_status, time_taken, run_number=1):
+    return {"id": uuid4().bytes, "test_case_id": case_id, "group_id": group_id.bytes, "date_run": RUN_DATE,
+            "time_taken": time_taken, "pass_status": pass_status, "error_message": "", "run_number": run_number}
+
+
+def test_rollup_tracks_writer_and_orm_results(client, db_session, setup_rollup_group):
+    group_id, case_ids = setup_rollup_group
+    result_writer.submit(result_row(group_id, case_ids[0], True, 1.0))
+    result_writer.submit(result_row(group_id, case_ids[1], False, 3.0))
+    result_writer.flush()
+    db_session.add(TestResult(**result_row(group_id, case_ids[2], True, 2.0)))
+    db_session.add(TestResult(**result_row(group_id, case_ids[0], True, 4.0, run_number=2)))
+    db_session.commit()
+
+    daily = {row.run_number: row for row in db_session.query(TestResultDaily).all()}
+    assert (daily[1].passed, daily[1].failed, daily[1].total_time, daily[1].max_time) == (2, 1, 6.0, 3.0)
+    assert (daily[2].passed, daily[2].failed) == (1, 0)
+
+    response = client.get(f"/get_test_group_stats/?date=01-08-2023&group_id={group_id.hex}&run_number=1")
+    assert response.json() == {"total_passed": 2, "total_failed": 1, "total_skipped": 0}
+
+    # bulk deleting a test case's results recomputes the runs it was part of
+    client.delete(f"/delete_test_case/{case_ids[0].hex()}")
+    db_session.expire_all()
+    daily = {row.run_number: row for row in db_session.query(TestResultDaily).all()}
+    assert (daily[1].passed, daily[1].failed, daily[1].max_time) == (1, 1, 3.0)
+    assert 2 not in daily
+
+
+def test_rollup_rebuild_matches_results(db_session, setup_rollup_group):
+    group_id, case_ids = setup_rollup_group
+    for case_id, pass_status in zip(case_ids, [True, True, False]):
+        db_session.add(TestResult(**result_row(group_id, case_id, pass_status, 1.5)))
+    db_session.commit()
+    before = [(r.passed, r.failed, r.total_time) for r in db_session.query(TestResultDaily).all()]
+
+    db_session.query(TestResultDaily).delete()
+    db_session.commit()
+    with db_session.get_bind().begin() as connection:
+        rollup.backfill(connection)
+    assert [(r.passed, r.failed, r.total_time) for r in db_session.query(TestResultDaily).all()] == before == [(2, 1, 4.5)]
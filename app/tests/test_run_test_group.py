@@ -0,0 +1,181 @@
+from unittest.mock import patch
+import time
+import pandas as pd
+import pytest
+from qpython.qtype import QException
+from uuid import uuid4, UUID
+from models.models import TestCase, TestGroup, TestResult, TestDependency, TestRun, TestResultDaily
+from KdbSubs import run_scheduled_test_group
+
+###############################
+## run_scheduled_test_group ###
+###############################
+
+def slow_functional_query(kdbFunction, host, port, tls, scope=""):
+    time.sleep(0.2)
+    return {"success": True, "data": "", "message": "Test Ran Successfully", "type": "bool"}
+
+
+@pytest.fixture(scope="function")
+def setup_parallel_group(db_session):
+    group_id = uuid4()
+    group = TestGroup(id=group_id.bytes, name="Parallel Group", server="localhost", port=1234, tls=False, parallelism=4)
+    db_session.add(group)
+    for i in range(8):
+        db_session.add(TestCase(id=uuid4().bytes, test_name=f"Parallel Test {i}", group_id=group_id.bytes,
+                                test_code=f"test{i}", test_type="Functional"))
+    db_session.commit()
+    return group_id
+
+
+@patch('KdbSubs.sendFunctionalQuery', side_effect=slow_functional_query)
+def test_run_scheduled_test_group_parallel(mock_query, db_session, setup_parallel_group):
+    start = time.time()
+    run_scheduled_test_group(UUID(bytes=setup_parallel_group.bytes))
+    elapsed = time.time() - start
+
+    results = db_session.query(TestResult).filter(TestResult.group_id == setup_parallel_group.bytes).all()
+    assert len(results) == 8
+    assert all(result.pass_status for result in results)
+    assert {result.run_number for result in results} == {1}
+    # each test's own duration is recorded, not the time since the run started
+    assert all(0.15 < result.time_taken < 0.5 for result in results)
+    # 8 tests of 0.2s over 4 workers
+    assert elapsed < 1.2
+
+    run_scheduled_test_group(UUID(bytes=setup_parallel_group.bytes))
+    run_numbers = db_session.query(TestResult.run_number).filter(TestResult.group_id == setup_parallel_group.bytes).distinct().all()
+    assert sorted(r[0] for r in run_numbers) == [1, 2]
+
+
+@pytest.fixture(scope="function")
+def setup_dependent_group(db_session):
+    group_id = uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Dependent Group", server="localhost", port=1234, tls=False, parallelism=2))
+    ids = {name: uuid4().bytes for name in ["setup", "broken", "uses_setup", "uses_broken", "uses_uses_broken"]}
+    for name, test_id in ids.items():
+        db_session.add(TestCase(id=test_id, test_name=name, group_id=group_id.bytes, test_code=name, test_type="Functional"))
+    db_session.commit()
+    for test_name, prerequisite in [("uses_setup", "setup"), ("uses_broken", "broken"), ("uses_uses_broken", "uses_broken")]:
+        db_session.add(TestDependency(test_id=ids[test_name], dependent_test_id=ids[prerequisite]))
+    db_session.commit()
+    return group_id
+
+
+def functional_query_by_name(kdbFunction, host, port, tls, scope=""):
+    return {"success": kdbFunction != "broken", "data": "", "message": "Test Failed", "type": "bool"}
+
+
+@patch('KdbSubs.sendFunctionalQuery', side_effect=functional_query_by_name)
+def test_run_scheduled_test_group_skips_dependents_of_failures(mock_query, db_session, setup_dependent_group):
+    run_scheduled_test_group(UUID(bytes=setup_dependent_group.bytes))
+
+    executed = [call.args[0] for call in mock_query.call_args_list]
+    assert sorted(executed) == ["broken", "setup", "uses_setup"]
+    # prerequisites always run before their dependents
+    assert executed.index("setup") < executed.index("uses_setup")
+
+    results = dict(db_session.query(TestCase.test_name, TestResult.error_message).join(TestResult).all())
+    assert results["uses_setup"] == ""
+    assert results["uses_broken"] == "Skipped - depends on failed test(s) broken"
+    assert results["uses_uses_broken"] == "Skipped - depends on failed test(s) uses_broken"
+
+    # skipped tests are neither passes nor failures
+    skipped = dict(db_session.query(TestCase.test_name, TestResult.skipped).join(TestResult).all())
+    assert sorted(name for name, is_skipped in skipped.items() if is_skipped) == ["uses_broken", "uses_uses_broken"]
+    run = db_session.query(TestRun).filter(TestRun.group_id == setup_dependent_group.bytes).one()
+    assert (run.total_tests, run.completed, run.passed, run.failed, run.skipped) == (5, 5, 2, 1, 2)
+    daily = db_session.query(TestResultDaily).filter(TestResultDaily.group_id == setup_dependent_group.bytes).one()
+    assert (daily.passed, daily.failed, daily.skipped) == (2, 1, 2)
+
+
+@pytest.fixture(scope="function")
+def setup_functional_group(db_session):
+    group_id = uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Functional Group", server="localhost", port=1234, tls=False))
+    for i in range(12):
+        db_session.add(TestCase(id=uuid4().bytes, test_name=f"Functional {i}", group_id=group_id.bytes,
+                                test_code=f"test{i}", test_type="Functional"))
+    db_session.commit()
+    return group_id
+
+
+def execute_batch(host, port, tls, timeout, scope, query, test_names):
+    assert query == '.qsuite.executeBatch'
+    return pd.DataFrame({
+        "name": [name.encode() for name in test_names],
+        "success": [name != "test3" for name in test_names],
+        "message": [b"" if name != "test3" else b"Kdb Error => type" for name in test_names],
+        "elapsed": [0.25] * len(test_names),
+    })
+
+
+@patch('KdbSubs.sendFunctionalQuery')
+@patch('KdbSubs.kdb_pool.send_sync', side_effect=execute_batch)
+def test_run_scheduled_test_group_batches_functional_tests(mock_send_sync, mock_query, db_session, setup_functional_group):
+    run_scheduled_test_group(UUID(bytes=setup_functional_group.bytes))
+
+    # one round-trip for all 12 tests, none sent individually
+    assert mock_send_sync.call_count == 1
+    assert mock_query.call_count == 0
+
+    results = dict(db_session.query(TestCase.test_code, TestResult).join(TestResult).all())
+    assert len(results) == 12
+    assert results["test3"].pass_status == False
+    assert results["test3"].error_message == "Kdb Error => type"
+    assert results["test4"].pass_status == True
+    assert results["test4"].time_taken == 0.25
+
+
+def functional_query_or_disconnect(kdbFunction, host, port, tls, scope=""):
+    if kdbFunction == "disconnects":
+        raise ConnectionResetError("connection reset by peer")
+    return {"success": True, "data": "", "message": "Test Ran Successfully", "type": "bool"}
+
+
+@pytest.mark.parametrize("parallelism", [1, 2])
+@patch('KdbSubs.sendFunctionalQuery', side_effect=functional_query_or_disconnect)
+def test_run_scheduled_test_group_records_tests_that_could_not_run(mock_query, db_session, parallelism):
+    group_id = uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Broken Group", server="localhost", port=1234, tls=False, parallelism=parallelism))
+    for name, test_type, test_code in [("ok", "Functional", "ok"), ("disconnects", "Functional", "disconnects"),
+                                       ("bad config", "Subscription", "{not json")]:
+        db_session.add(TestCase(id=uuid4().bytes, test_name=name, group_id=group_id.bytes, test_code=test_code, test_type=test_type))
+    db_session.commit()
+
+    # the run still completes, with a failed result for every test that couldn't run
+    run_scheduled_test_group(group_id)
+
+    results = dict(db_session.query(TestCase.test_name, TestResult).join(TestResult).all())
+    assert len(results) == 3
+    assert results["ok"].pass_status == True
+    assert results["disconnects"].pass_status == False
+    assert results["disconnects"].error_message == "Kdb Error => connection reset by peer"
+    assert results["bad config"].pass_status == False
+    assert results["bad config"].error_message.startswith("Invalid subscription config => ")
+
+    run = db_session.query(TestRun).filter(TestRun.group_id == group_id.bytes).one()
+    assert (run.status, run.total_tests, run.completed, run.passed, run.failed) == ("completed", 3, 3, 1, 2)
+
+
+@patch('KdbSubs.sendFunctionalQuery', side_effect=functional_query_by_name)
+@patch('KdbSubs.kdb_pool.send_sync', side_effect=QException(b'.qsuite.executeBatch'))
+def test_run_scheduled_test_group_runs_tests_individually_without_execute_batch(mock_send_sync, mock_query, db_session, setup_functional_group):
+    run_scheduled_test_group(UUID(bytes=setup_functional_group.bytes))
+
+    assert mock_query.call_count == 12
+    results = db_session.query(TestResult).filter(TestResult.group_id == setup_functional_group.bytes).all()
+    assert len(results) == 12
+    assert all(result.pass_status for result in results)
+
+
+@patch('KdbSubs.sendFunctionalQuery')
+@patch('KdbSubs.kdb_pool.send_sync', side_effect=TimeoutError("timed out"))
+def test_run_scheduled_test_group_fails_a_batch_that_times_out(mock_send_sync, mock_query, db_session, setup_functional_group):
+    run_scheduled_test_group(UUID(bytes=setup_functional_group.bytes))
+
+    # the tests aren't run a second time one by one
+    assert mock_query.call_count == 0
+    results = db_session.query(TestResult).filter(TestResult.group_id == setup_functional_group.bytes).all()
+    assert len(results) == 12
+    assert all(not result.pass_status and result.error_message == "Kdb Error => timed out" for result in results)
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from uuid import uuid4, UUID
+import pytest
+from models.models import TestCase, TestGroup, TestResult, TestRun
+from KdbSubs import run_scheduled_test_group
+import runs
+
+TODAY = datetime.utcnow().date()
+
+
+@pytest.fixture(scope="function")
+def setup_run_group(db_session):
+    group_id = uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Run Group", server="localhost", port=1234, tls=False, parallelism=2))
+    for i in range(3):
+        db_session.add(TestCase(id=uuid4().bytes, test_name=f"Run Test {i}", group_id=group_id.bytes,
+                                test_code=f"test{i}", test_type="Functional"))
+    db_session.commit()
+    return group_id
+
+
+def test_allocate_run_concurrently(db_session, setup_run_group):
+    from conftest import engine
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        allocated = list(pool.map(lambda _: runs.allocate_run(engine, setup_run_group.bytes, TODAY, 3), range(16)))
+
+    assert sorted(run_number for _, run_number in allocated) == list(range(1, 17))
+    assert len({run_id for run_id, _ in allocated}) == 16
+    assert db_session.query(TestRun).filter(TestRun.group_id == setup_run_group.bytes).count() == 16
+
+
+def functional_query(kdbFunction, host, port, tls, scope=""):
+    if kdbFunction == "test2":
+        return {"success": False, "data": "", "message": "Test Failed", "type": "bool"}
+    return {"success": True, "data": "", "message": "Test Ran Successfully", "type": "bool"}
+
+
+@patch('KdbSubs.sendFunctionalQuery', side_effect=functional_query)
+def test_run_counters_and_progress(mock_query, client, db_session, setup_run_group):
+    run_scheduled_test_group(UUID(bytes=setup_run_group.bytes))
+    run_scheduled_test_group(UUID(bytes=setup_run_group.bytes))
+
+    date = TODAY.strftime('%d-%m-%Y')
+    response = client.get(f"/get_test_progress/{setup_run_group}?date={date}&run_number=2")
+    assert response.status_code == 200
+    assert response.json() == {"completed_tests": 3, "total_tests": 3, "passed": 2, "failed": 1, "skipped": 0, "status": "completed"}
+
+    response = client.get(f"/get_run_numbers_by_day/?date={date}&group_id={setup_run_group}")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["run_numbers"] == [1, 2]
+    assert [(run["status"], run["completed"]) for run in data["runs"]] == [("completed", 3), ("completed", 3)]
+
+    # deleting a test case takes its results out of the run counters
+    failing_id = db_session.query(TestCase.id).filter(TestCase.test_code == "test2").scalar()
+    assert client.delete(f"/delete_test_case/{UUID(bytes=failing_id)}").status_code == 200
+    response = client.get(f"/get_test_progress/{setup_run_group}?date={date}&run_number=1")
+    assert response.json()["completed_tests"] == 2
+    assert response.json()["failed"] == 0
+
+
+def test_backfill_creates_runs_from_results(db_session, setup_run_group):
+    test_case_id = db_session.query(TestCase.id).filter(TestCase.group_id == setup_run_group.bytes).first()[0]
+    for run_number in (1, 2):
+        db_session.add(TestResult(test_case_id=test_case_id, group_id=setup_run_group.bytes, date_run=TODAY,
+                                  time_taken=0.1, pass_status=run_number == 1, run_number=run_number))
+    db_session.commit()
+
+    runs.backfill(db_session.connection())
+    runs.backfill(db_session.connection())
+    db_session.commit()
+
+    backfilled = db_session.query(TestRun).filter(TestRun.group_id == setup_run_group.bytes).order_by(TestRun.run_number).all()
+    assert [(run.run_number, run.status, run.passed, run.failed) for run in backfilled] == [(1, "completed", 1, 0), (2, "completed", 0, 1)]
+
+
+def test_runs_that_never_finish_are_failed(db_session, setup_run_group):
+    from conftest import engine
+    # allocated by execute_test_group for a group deleted before the run started
+    missing_group = uuid4()
+    run_id, _ = runs.allocate_run(engine, missing_group.bytes, TODAY)
+    run_scheduled_test_group(missing_group, run_id)
+    assert db_session.get(TestRun, run_id).status == "failed"
+
+    # left running by a process that died
+    stale_id, _ = runs.allocate_run(engine, setup_run_group.bytes, TODAY)
+    an_hour_later = datetime.utcnow() + timedelta(hours=1)
+    runs.fail_stale_runs(engine, max_age=2 * 60 * 60, now=an_hour_later)
+    assert db_session.get(TestRun, stale_id).status == "running"
+    runs.fail_stale_runs(engine, max_age=30 * 60, now=an_hour_later)
+    db_session.expire_all()
+    assert db_session.get(TestRun, stale_id).status == "failed"
+
+
+@patch('KdbSubs.sendFunctionalQuery', side_effect=functional_query)
+def test_run_with_unwritten_results_fails(mock_query, db_session, setup_run_group):
+    with patch('KdbSubs.result_writer.take_unwritten', return_value=2):
+        run_scheduled_test_group(UUID(bytes=setup_run_group.bytes))
+    run = db_session.query(TestRun).filter(TestRun.group_id == setup_run_group.bytes).one()
+    assert run.status == "failed"
@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 import pytest
 from datetime import datetime
 from uuid import uuid4  # Import uuid4 for generating UUIDs
@@ -58,6 +58,7 @@ def test_get_tests_by_ids_ran_test(client, setup_mock_data):
                 "Test Name": "Test Case Ran",
                 "Time Taken": 5.0,
                 "Status": True,
+                "Skipped": False,
                 "Error Message": None,
                 "group_id": setup_mock_data["group_id"].hex,
                 "group_name": "Test Group 1",
@@ -81,6 +82,7 @@ def test_get_tests_by_ids_unran_test(client, setup_mock_data):
                 "Test Name": "Test Case Unran",
                 "Time Taken": None,
                 "Status": None,
+                "Skipped": False,
                 "Error Message": '',
                 "group_id": setup_mock_data["group_id"].hex,
                 "group_name": "Test Group 1",
@@ -105,6 +107,7 @@ def test_get_tests_by_ids_both_tests(client, setup_mock_data):
                 "Test Name": "Test Case Ran",
                 "Time Taken": 5.0,
                 "Status": True,
+                "Skipped": False,
                 "Error Message": None,
                 "group_id": setup_mock_data["group_id"].hex,
                 "group_name": "Test Group 1",
@@ -115,6 +118,7 @@ def test_get_tests_by_ids_both_tests(client, setup_mock_data):
                 "Test Name": "Test Case Unran",
                 "Time Taken": None,
                 "Status": None,
+                "Skipped": False,
                 "Error Message": '',
                 "group_id": setup_mock_data["group_id"].hex,
                 "group_name": "Test Group 1",
@@ -186,10 +190,53 @@ def test_search_functional_tests(client, db_session):
     db_session.commit()
 
     # Mock the external Kdb interaction
-    with patch('endpoints.search_tests.sendKdbQuery') as mock_send_kdb_query:
+    with patch('endpoints.search_tests.sendKdbQueryAsync', new_callable=AsyncMock) as mock_send_kdb_query:
         mock_send_kdb_query.return_value = [b"Test Function 1"]
 
         response = client.get(f"/search_functional_tests/?query=Function&limit=10&group_id={group_id.hex}")
         assert response.status_code == 200
         assert response.json() == {"success": True, "results": ["Test Function 1"], "message": ""}
 
+
+
+@pytest.fixture(scope="function")
+def setup_search_index_data(db_session):
+    group_id, other_group_id = uuid4(), uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Search Group", server="localhost", port=1234, tls=False))
+    db_session.add(TestGroup(id=other_group_id.bytes, name="Other Group", server="localhost", port=1234, tls=False))
+    ids = {name: uuid4().bytes for name in ["trade_checks", "quote_checks", "uses_trade_code", "other_trade_checks"]}
+    db_session.add(TestCase(id=ids["trade_checks"], test_name="Trade Checks", group_id=group_id.bytes, test_code="count quote", test_type="Functional"))
+    db_session.add(TestCase(id=ids["quote_checks"], test_name="Quote Checks", group_id=group_id.bytes, test_code="count quote", test_type="Functional"))
+    db_session.add(TestCase(id=ids["uses_trade_code"], test_name="Volume", group_id=group_id.bytes, test_code="select sum size from trade", test_type="Functional"))
+    db_session.add(TestCase(id=ids["other_trade_checks"], test_name="Trade Checks Other", group_id=other_group_id.bytes, test_code="1b", test_type="Functional"))
+    db_session.commit()
+    return group_id, ids
+
+
+# Test 3: Name matches rank above code matches, and the index follows updates and deletes
+def test_search_tests_ranks_and_tracks_changes(client, db_session, setup_search_index_data):
+    group_id, ids = setup_search_index_data
+
+    response = client.get(f"/search_tests/?query=TRADE&group_id={group_id.hex}&snippets=true")
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["Test Name"] for r in results] == ["Trade Checks", "Volume"]
+    assert results[0]["Name Highlight"] == "<mark>Trade</mark> Checks"
+    assert "<mark>trade</mark>" in results[1]["Code Snippet"]
+
+    assert len(client.get("/search_tests/?query=trade").json()) == 3
+
+    test_case = db_session.get(TestCase, ids["quote_checks"])
+    test_case.test_name = "Trade Quotes"
+    db_session.delete(db_session.get(TestCase, ids["uses_trade_code"]))
+    db_session.commit()
+
+    results = client.get(f"/search_tests/?query=trade&group_id={group_id.hex}").json()
+    assert sorted(r["Test Name"] for r in results) == ["Trade Checks", "Trade Quotes"]
+
+
+# Test 4: Queries shorter than a trigram still match test names
+def test_search_tests_short_query(client, setup_search_index_data):
+    group_id, _ = setup_search_index_data
+    results = client.get(f"/search_tests/?query=Vo&group_id={group_id.hex}").json()
+    assert [r["Test Name"] for r in results] == ["Volume"]
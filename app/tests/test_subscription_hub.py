@@ -0,0 +1,181 @@
+import asyncio
+import json
+import threading
+from queue import Empty
+import pytest
+from subscription_hub import SubscriptionHub
+from message_buffer import MessageBuffer, BufferClosed, CONFLATE, BATCH
+
+
+class FakeSub:
+    """Stands in for kdbSub: messages are pushed by the test instead of a tickerplant."""
+    opened = 0
+
+    def __init__(self):
+        FakeSub.opened += 1
+        self.on_message = None
+        self._stopper = threading.Event()
+
+    def start(self):
+        pass
+
+    def stopit(self):
+        self._stopper.set()
+
+    def stopped(self):
+        return self._stopper.is_set()
+
+
+def test_hub_shares_one_subscription_per_key():
+    FakeSub.opened = 0
+    encoded = []
+
+    def encode(message):
+        encoded.append(message)
+        return json.dumps(message)
+
+    hub = SubscriptionHub(encode=encode)
+    key = ("group", "trades", ("AAPL",))
+    clients = [hub.acquire(key, FakeSub) for _ in range(10)]
+    other = hub.acquire(("group", "trades", ("MSFT",)), FakeSub)
+    assert FakeSub.opened == 2
+
+    upstream = clients[0]._upstream
+    upstream.sub.on_message({"sym": "AAPL", "price": 1.5})
+    assert len(encoded) == 1
+    assert all(client.buffer.get_nowait() == '{"sym": "AAPL", "price": 1.5}' for client in clients)
+    assert other.buffer.empty()
+
+    for client in clients[:-1]:
+        client.close()
+    assert not upstream.sub.stopped()
+    clients[-1].close()
+    assert upstream.sub.stopped()
+    assert list(hub._connect_locks) == [("group", "trades", ("MSFT",))]
+    assert [(entry["key"], entry["clients"], entry["messages"]) for entry in hub.stats()] == [(["group", "trades", ("MSFT",)], 1, 0)]
+
+    # the next client of a torn down key opens a new subscription
+    client = hub.acquire(key, FakeSub)
+    assert FakeSub.opened == 3
+    assert client._upstream is not upstream
+
+
+def test_hub_replaces_a_dropped_subscription():
+    hub = SubscriptionHub()
+    key = ("group", "quotes", ())
+    first = hub.acquire(key, FakeSub)
+    first._upstream.sub.stopit()  # connection to kdb dropped
+    assert first.stopped()
+
+    second = hub.acquire(key, FakeSub)
+    assert not second.stopped()
+    first.close()
+    assert not second.stopped()
+    assert hub.stats()[0]["clients"] == 1
+
+
+def test_hub_conflates_latest_row_per_key_for_slow_clients():
+    hub = SubscriptionHub(encode=json.dumps)
+    key = ("group", "quotes", ())
+    conflating = hub.acquire(key, FakeSub, policy=CONFLATE, conflate_key="sym")
+    plain = hub.acquire(key, FakeSub, maxsize=2)
+
+    publish = conflating._upstream.sub.on_message
+    for price in (1, 2, 3):
+        publish({"columns": ["sym", "price"], "rows": [{"sym": "A", "price": price}, {"sym": "B", "price": -price}],
+                 "trimmed": False, "num_rows": 2})
+
+    assert [json.loads(conflating.buffer.get_nowait())["rows"] for _ in range(2)] == [[{"sym": "A", "price": 3}], [{"sym": "B", "price": -3}]]
+    assert conflating.buffer.empty()
+    assert conflating.buffer.stats()["conflated"] == 4
+    # the plain client kept the last two whole messages
+    assert [json.loads(plain.buffer.get_nowait())["rows"][0]["price"] for _ in range(2)] == [2, 3]
+    assert plain.buffer.stats()["dropped"] == 1
+
+
+def test_message_buffer_policies():
+    buffer = MessageBuffer(3)
+    for i in range(5):
+        buffer.put(i)
+    assert [buffer.get_nowait() for _ in range(3)] == [2, 3, 4]
+    assert (buffer.received, buffer.delivered, buffer.dropped) == (5, 3, 2)
+    with pytest.raises(Empty):
+        buffer.get_nowait()
+
+    batched = MessageBuffer(10, BATCH)
+    for i in range(4):
+        batched.put(i)
+    assert batched.get_nowait() == [0, 1, 2, 3]
+    assert batched.stats()["delivered"] == 4
+
+    with pytest.raises(Empty):
+        MessageBuffer(1).get(timeout=0.01)
+    with pytest.raises(ValueError):
+        MessageBuffer(1, "unbounded")
+
+
+def test_message_buffer_wakes_async_readers():
+    buffer = MessageBuffer(10)
+
+    async def run():
+        threading.Timer(0.05, buffer.put, args=("tick",)).start()
+        started = asyncio.get_running_loop().time()
+        message = await buffer.get_async(timeout=5)
+        waited = asyncio.get_running_loop().time() - started
+
+        with pytest.raises(Empty):
+            await buffer.get_async(timeout=0.01)
+
+        threading.Timer(0.05, buffer.close).start()
+        with pytest.raises(BufferClosed):
+            await buffer.get_async(timeout=5)
+        return message, waited
+
+    message, waited = asyncio.run(run())
+    assert message == "tick"
+    assert waited < 1
+
+
+def test_hub_closes_client_buffers_when_subscription_ends():
+    hub = SubscriptionHub()
+    client = hub.acquire(("group", "trades", ()), FakeSub)
+    client._upstream.sub.on_message("last")
+    client._upstream.sub.on_stopped()
+
+    assert client.buffer.get(timeout=1) == "last"
+    with pytest.raises(BufferClosed):
+        client.buffer.get(timeout=1)
+
+
+def test_hub_forgets_keys_whose_connect_failed():
+    hub = SubscriptionHub()
+
+    def failing_connect():
+        raise ConnectionError("kdb+ is down")
+
+    with pytest.raises(ConnectionError):
+        hub.acquire(("group", "trades", ()), failing_connect)
+    assert hub._connect_locks == {}
+
+
+def test_hub_drops_subscriptions_that_fail_to_start():
+    hub = SubscriptionHub()
+    subs = []
+
+    class FailingSub(FakeSub):
+        def start(self):
+            raise ConnectionError("reactor is down")
+
+    def connect():
+        subs.append(FailingSub())
+        return subs[-1]
+
+    with pytest.raises(ConnectionError):
+        hub.acquire(("group", "trades", ()), connect)
+    # its connection is closed and the key is free for the next acquire to open afresh
+    assert subs[0].stopped()
+    assert hub.stats() == []
+    assert hub._connect_locks == {}
+
+    client = hub.acquire(("group", "trades", ()), FakeSub)
+    assert not client.stopped()
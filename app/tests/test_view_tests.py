@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 import pytest
 from models.models import TestCase, TestGroup, TestResult, TestDependency
 from datetime import datetime, timedelta
@@ -90,7 +90,7 @@ def test_get_test_info_no_dependencies(client, setup_mock_data_for_test_info):
 ###### all_functional_tests ##
 #############################
 
-@patch('endpoints.view_tests.sendKdbQuery')
+@patch('endpoints.view_tests.sendKdbQueryAsync', new_callable=AsyncMock)
 def test_all_functional_tests(mock_send_kdb_query, client, db_session):
     # Generate UUID for the test group
     group_id = uuid4()
@@ -100,7 +100,7 @@ def test_all_functional_tests(mock_send_kdb_query, client, db_session):
     db_session.add(group)
     db_session.commit()
 
-    # Mock the sendKdbQuery function to return some test names
+    # Mock the sendKdbQueryAsync function to return some test names
     mock_send_kdb_query.return_value = [b"Test Function 1", b"Test Function 2"]
 
     # Simulate a GET request to the /all_functional_tests/ endpoint
@@ -112,7 +112,7 @@ def test_all_functional_tests(mock_send_kdb_query, client, db_session):
     assert data["success"] == True
     assert data["results"] == ["Test Function 1", "Test Function 2"]
 
-@patch('endpoints.view_tests.sendKdbQuery')
+@patch('endpoints.view_tests.sendKdbQueryAsync', new_callable=AsyncMock)
 def test_all_functional_tests_error_handling(mock_send_kdb_query, client, db_session):
     # Generate UUID for the test group
     group_id = uuid4()
@@ -122,7 +122,7 @@ def test_all_functional_tests_error_handling(mock_send_kdb_query, client, db_ses
     db_session.add(group)
     db_session.commit()
 
-    # Mock the sendKdbQuery function to raise an exception
+    # Mock the sendKdbQueryAsync function to raise an exception
     mock_send_kdb_query.side_effect = Exception("Kdb Error")
 
     # Simulate a GET request to the /all_functional_tests/ endpoint
@@ -138,7 +138,7 @@ def test_all_functional_tests_error_handling(mock_send_kdb_query, client, db_ses
 ###### view_test_code #######
 #############################
 
-@patch('endpoints.view_tests.sendKdbQuery')
+@patch('endpoints.view_tests.sendKdbQueryAsync', new_callable=AsyncMock)
 def test_view_test_code(mock_send_kdb_query, client, db_session):
     # Generate UUID for the test group
     group_id = uuid4()
@@ -148,7 +148,7 @@ def test_view_test_code(mock_send_kdb_query, client, db_session):
     db_session.add(group)
     db_session.commit()
 
-    # Mock the sendKdbQuery function to return test code
+    # Mock the sendKdbQueryAsync function to return test code
     mock_send_kdb_query.return_value = b"print('Test Code')"
 
     # Simulate a GET request to the /view_test_code/ endpoint
@@ -160,7 +160,7 @@ def test_view_test_code(mock_send_kdb_query, client, db_session):
     assert data["success"] == True
     assert data["results"] == "print('Test Code')"
 
-@patch('endpoints.view_tests.sendKdbQuery')
+@patch('endpoints.view_tests.sendKdbQueryAsync', new_callable=AsyncMock)
 def test_view_test_code_error_handling(mock_send_kdb_query, client, db_session):
     # Generate UUID for the test group
     group_id = uuid4()
@@ -170,7 +170,7 @@ def test_view_test_code_error_handling(mock_send_kdb_query, client, db_session):
     db_session.add(group)
     db_session.commit()
 
-    # Mock the sendKdbQuery function to raise an exception
+    # Mock the sendKdbQueryAsync function to raise an exception
     mock_send_kdb_query.side_effect = Exception("Kdb Error")
 
     # Simulate a GET request to the /view_test_code/ endpoint
@@ -182,3 +182,29 @@ def test_view_test_code_error_handling(mock_send_kdb_query, client, db_session):
     assert data["success"] == False
     assert "Kdb Error" in data["message"]
 
+
+
+# Test 4: Many dependencies cost no extra queries, and each shows its latest run of the day
+def test_get_test_info_batches_dependencies(client, db_session):
+    from conftest import recorded_statements
+
+    group_id, test_case_id = uuid4(), uuid4()
+    db_session.add(TestGroup(id=group_id.bytes, name="Test Group", server="localhost", port=1234, tls=False))
+    db_session.add(TestCase(id=test_case_id.bytes, test_name="Main", group_id=group_id.bytes, test_code="1b", test_type="Functional"))
+    day = datetime(2023, 8, 1).date()
+    for i in range(20):
+        dependent_id = uuid4().bytes
+        db_session.add(TestCase(id=dependent_id, test_name=f"Dependency {i}", group_id=group_id.bytes, test_code="1b", test_type="Functional"))
+        db_session.add(TestDependency(test_id=test_case_id.bytes, dependent_test_id=dependent_id))
+        db_session.add(TestResult(test_case_id=dependent_id, group_id=group_id.bytes, date_run=day, time_taken=1.0, pass_status=False, run_number=1))
+        db_session.add(TestResult(test_case_id=dependent_id, group_id=group_id.bytes, date_run=day, time_taken=1.0, pass_status=True, run_number=2))
+    db_session.commit()
+
+    with recorded_statements() as statements:
+        response = client.get(f"/get_test_info/?date=01-08-2023&test_id={test_case_id.hex}")
+
+    assert response.status_code == 200
+    dependent_tests = response.json()["dependent_tests"]
+    assert len(dependent_tests) == 20
+    assert all(dep["Status"] == True for dep in dependent_tests)
+    assert len(statements) == 4